@@ -3,6 +3,8 @@ import dash
 import dash_bootstrap_components as dbc
 import plotly.io as pio
 
+from services.profiler import instrumentar
+
 pio.templates.default = "plotly"
 
 external_stylesheets = [
@@ -19,3 +21,6 @@ app.config.prevent_initial_callbacks = "initial_duplicate"
 
 app.scripts.config.serve_locally = True
 server = app.server
+
+# tempo/bytes/gatilho por callback em /__perf (FINANCE_PERF=0 desliga)
+instrumentar(app)
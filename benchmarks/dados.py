@@ -0,0 +1,77 @@
+# benchmarks/dados.py
+# Geradores de dados sintéticos (determinísticos por seed) e carga no SQLite do FINANCE_DB.
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+CAT_RECEITAS = ["Salário", "Extra", "Dividendos", "Outros"]
+CAT_DESPESAS = ["Alimentação", "Transporte", "Moradia", "Lazer", "Saúde", "Outros"]
+
+
+def gerar_fluxo(anos: int, por_mes: int = 60, seed: int = 0, fim: str = "2024-12-31") -> dict:
+    """receitas/despesas: ~por_mes lançamentos por mês em 'anos' anos."""
+    rng = np.random.default_rng(seed)
+    inicio = pd.Timestamp(fim) - pd.DateOffset(years=anos) + pd.Timedelta(days=1)
+    dias = pd.date_range(inicio, fim, freq="D")
+    out = {}
+    for tabela, cats, escala, frac in (("receitas", CAT_RECEITAS, 800.0, 0.25), ("despesas", CAT_DESPESAS, 120.0, 1.0)):
+        n = int(len(dias) / 30.4 * por_mes * frac)
+        out[tabela] = pd.DataFrame({
+            "Valor": np.round(rng.lognormal(np.log(escala), 0.8, n), 2),
+            "Data": rng.choice(dias, n).astype("datetime64[D]").astype(str),
+            "Categoria": rng.choice(cats, n),
+            "Descrição": [f"lançamento {i % 500}" for i in range(n)],
+        }).sort_values("Data", kind="mergesort").reset_index(drop=True)
+    return out
+
+
+def gerar_tickers(m: int) -> list:
+    return [f"T{i:03d}{'11' if i % 5 == 0 else '3'}" for i in range(m)]
+
+
+def gerar_precos(tickers: list, dias: int, seed: int = 1, fim: str = "2024-12-31") -> pd.DataFrame:
+    """Passeio aleatório geométrico em dias úteis: Ticker, data, preco."""
+    rng = np.random.default_rng(seed)
+    datas = pd.bdate_range(end=fim, periods=dias)
+    ret = rng.normal(0.0003, 0.02, size=(dias, len(tickers)))
+    px = 20.0 * np.exp(np.cumsum(ret, axis=0)) * rng.uniform(0.5, 5.0, len(tickers))
+    df = pd.DataFrame(np.round(px, 2), index=datas, columns=tickers)
+    return df.rename_axis("data").reset_index().melt(id_vars="data", var_name="Ticker", value_name="preco")
+
+
+def gerar_trades(k: int, tickers: list, precos: pd.DataFrame, seed: int = 2) -> pd.DataFrame:
+    """K trades sem venda descoberta (venda só até a posição do ticker), ao preço do dia."""
+    rng = np.random.default_rng(seed)
+    datas = np.sort(rng.choice(precos["data"].unique(), k))
+    tk = rng.choice(tickers, k)
+    px = precos.set_index(["data", "Ticker"])["preco"]
+    qtd = rng.integers(1, 200, k).astype(float)
+    tipo = np.where(rng.random(k) < 0.35, "V", "C")
+    pos: dict = {}
+    for i in range(k):                                       # garante posição (só na geração)
+        p = pos.get(tk[i], 0.0)
+        if tipo[i] == "V" and p < qtd[i]:
+            tipo[i] = "C"
+        pos[tk[i]] = p + (qtd[i] if tipo[i] == "C" else -qtd[i])
+    return pd.DataFrame({
+        "data": pd.to_datetime(datas), "Ticker": tk, "tipo": tipo, "quantidade": qtd,
+        "preco": px.reindex(list(zip(datas, tk))).to_numpy(), "taxas": np.round(rng.uniform(0, 5, k), 2),
+        "descricao": None,
+    })
+
+
+def carregar(fluxo: dict, precos: pd.DataFrame, trades: pd.DataFrame) -> None:
+    """Grava tudo no banco de services.db (FINANCE_DB) com executemany."""
+    from services import cache, db
+    db.ensure_core_schema()
+    with db.connect() as con:
+        for t, df in fluxo.items():
+            status = "Recebido" if t == "receitas" else "Pago"
+            con.executemany(f'INSERT INTO {t} (Valor, "{status}", Data, Categoria, "Descrição") VALUES (?, 1, ?, ?, ?)',
+                            df[["Valor", "Data", "Categoria", "Descrição"]].itertuples(index=False, name=None))
+        con.executemany("INSERT INTO trades (Data, Ticker, Tipo, Qtd, Preco, Taxas, Descricao) VALUES (?,?,?,?,?,?,?)",
+                        zip(trades["data"].dt.strftime("%Y-%m-%d"), trades["Ticker"], trades["tipo"],
+                            trades["quantidade"], trades["preco"], trades["taxas"], trades["descricao"]))
+    db.upsert_precos(precos, fonte="bench")
+    cache.bump(*fluxo, "trades")
@@ -0,0 +1,143 @@
+# benchmarks/run.py
+# Benchmarks dos caminhos quentes de services/ em várias escalas, sobre um SQLite temporário
+# (FINANCE_DB apontado para um arquivo novo antes de importar services.*) e sem rede.
+#
+#   python -m benchmarks.run                              # escalas pequeno,medio
+#   python -m benchmarks.run --escalas grande --repeticoes 5 --saida bench.json
+#   python -m benchmarks.run --comparar bench_anterior.json   # razão atual/anterior por caso
+# A saída padrão (bench_results.json) fica fora do git (.gitignore).
+#
+# Cada caso roda 'repeticoes' vezes com o cache (services.cache) invalidado antes de cada
+# execução; o JSON guarda mínimo/mediana por caso e escala.
+from __future__ import annotations
+
+import argparse, json, os, platform, statistics, sys, tempfile, time
+from pathlib import Path
+
+ESCALAS = {
+    #         anos de fluxo, tickers, dias de preço, trades, meses de simulação
+    "pequeno": dict(anos=2, tickers=10, dias=500, trades=1_000, meses=120),
+    "medio":   dict(anos=5, tickers=30, dias=1_250, trades=10_000, meses=240),
+    "grande":  dict(anos=10, tickers=100, dias=2_500, trades=50_000, meses=360),
+}
+
+
+def _cronometrar(fn, repeticoes: int, antes=None) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        if antes:
+            antes()
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return {"min_s": round(min(tempos), 6), "mediana_s": round(statistics.median(tempos), 6), "n": repeticoes}
+
+
+def rodar_escala(nome: str, cfg: dict, repeticoes: int, pasta: Path) -> dict:
+    # services.db lê FINANCE_DB na importação: um processo por escala mantém os bancos separados
+    os.environ["FINANCE_DB"] = str(pasta / f"bench_{nome}.db")
+    import warnings
+    warnings.simplefilter("ignore", FutureWarning)
+    import numpy as np
+    import pandas as pd
+    from benchmarks import dados
+    from services import cache, db, fifo, performance, portfolio, projecoes, snapshot
+
+    t0 = time.perf_counter()
+    fluxo = dados.gerar_fluxo(cfg["anos"])
+    tickers = dados.gerar_tickers(cfg["tickers"])
+    precos = dados.gerar_precos(tickers, cfg["dias"])
+    trades = dados.gerar_trades(cfg["trades"], tickers, precos)
+    dados.carregar(fluxo, precos, trades)
+    preparo = time.perf_counter() - t0
+
+    todas = ("receitas", "despesas", "trades", "precos", "proventos", "ativos", "benchmarks")
+    limpar = lambda: cache.bump(*todas)
+    fluxos = list(zip(trades["data"], np.where(trades["tipo"] == "C", -1.0, 1.0) * trades["quantidade"] * trades["preco"]))
+    fluxos.append((trades["data"].max(), float(-sum(v for _, v in fluxos)) * 1.1))
+    sim = projecoes.ParametrosSimulacao(valor_inicial=10_000, aporte_mensal=1_000, anos=cfg["meses"] // 12)
+    despesas = db.load_table("despesas")
+
+    casos = {
+        "compute_positions": lambda: portfolio.compute_positions(trades, precos, pd.DataFrame()),
+        "fifo_realized_per_month": lambda: fifo.fifo_realized_per_month(trades),
+        "build_positions_daily": lambda: performance.build_positions_daily(usar_snapshot=False),
+        "build_positions_daily_pivot": lambda: performance.build_positions_daily(usar_snapshot=False, usar_matriz=False),
+        "build_positions_daily_snapshot": lambda: performance.build_positions_daily(usar_snapshot=True),
+        "snapshot_trades_precos": lambda: (snapshot.load_trades(), snapshot.load_precos()),
+        "db_trades_precos": lambda: (db.load_trades(), db.load_precos()),
+        "compute_metrics": lambda: performance.compute_metrics(),
+        "xirr": lambda: performance.xirr(fluxos),
+        "sim_monte_carlo": lambda: projecoes.sim_monte_carlo(sim),
+        "load_table": lambda: db.load_table("despesas"),
+        # DELETE + append dos mesmos dados (passa pelos triggers de rollup/estatística)
+        "replace_table": lambda: db.replace_table("despesas", despesas),
+    }
+    resultados = {}
+    for caso, fn in casos.items():
+        try:
+            resultados[caso] = _cronometrar(fn, repeticoes, limpar)
+        except Exception as e:                      # um caso quebrado é registrado e não derruba a suíte
+            resultados[caso] = {"erro": f"{type(e).__name__}: {e}"}
+        r = resultados[caso]
+        print(f"  {nome:8s} {caso:30s} " + (f"{r['mediana_s']*1000:10.2f} ms" if "erro" not in r else r["erro"]),
+              flush=True)
+    return {"config": cfg, "preparo_s": round(preparo, 3),
+            "linhas": {"receitas": len(fluxo["receitas"]), "despesas": len(fluxo["despesas"]),
+                       "precos": len(precos), "trades": len(trades)},
+            "casos": resultados}
+
+
+def comparar(atual: dict, anterior: dict) -> None:
+    print("\nrazão mediana atual/anterior (>1 = mais lento):")
+    for escala, r in atual["escalas"].items():
+        ant = anterior.get("escalas", {}).get(escala, {}).get("casos", {})
+        for caso, v in r.get("casos", {}).items():
+            a = ant.get(caso, {})
+            if "mediana_s" in v and a.get("mediana_s"):
+                razao = v["mediana_s"] / a["mediana_s"]
+                print(f"  {escala:8s} {caso:30s} {razao:6.2f}x" + ("  <-- regressão" if razao > 1.2 else ""))
+
+
+def main(argv=None) -> dict:
+    ap = argparse.ArgumentParser(description="Benchmarks de services/ com dados sintéticos (SQLite temporário).")
+    ap.add_argument("--escalas", default="pequeno,medio", help=f"lista separada por vírgula: {', '.join(ESCALAS)}")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--saida", default="bench_results.json")
+    ap.add_argument("--comparar", help="JSON de uma execução anterior")
+    ap.add_argument("--_escala", help=argparse.SUPPRESS)         # uso interno (subprocesso)
+    ap.add_argument("--_pasta", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args._escala:                                   # filho: roda uma escala e imprime o JSON
+        r = rodar_escala(args._escala, ESCALAS[args._escala], args.repeticoes, Path(args._pasta))
+        print("@@" + json.dumps(r))
+        return r
+
+    import subprocess
+    out = {"quando": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+           "plataforma": platform.platform(), "repeticoes": args.repeticoes, "escalas": {}}
+    with tempfile.TemporaryDirectory(prefix="finance_bench_") as pasta:
+        for nome in [e.strip() for e in args.escalas.split(",") if e.strip()]:
+            if nome not in ESCALAS:
+                raise SystemExit(f"escala desconhecida: {nome}")
+            print(f"[{nome}] {ESCALAS[nome]}", flush=True)
+            env = {**os.environ, "FINANCE_DB": str(Path(pasta) / f"bench_{nome}.db")}
+            p = subprocess.run([sys.executable, "-m", "benchmarks.run", "--_escala", nome, "--_pasta", pasta,
+                                "--repeticoes", str(args.repeticoes)],
+                               env=env, cwd=Path(__file__).resolve().parent.parent,
+                               stdout=subprocess.PIPE, text=True)
+            linhas = p.stdout.splitlines()
+            print("\n".join(l for l in linhas if not l.startswith("@@")))
+            js = [l for l in linhas if l.startswith("@@")]
+            out["escalas"][nome] = json.loads(js[-1][2:]) if js else {"erro": f"saída {p.returncode}"}
+
+    Path(args.saida).write_text(json.dumps(out, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresultados em {args.saida}")
+    if args.comparar:
+        comparar(out, json.loads(Path(args.comparar).read_text(encoding="utf-8")))
+    return out
+
+
+if __name__ == "__main__":
+    main()
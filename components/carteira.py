@@ -185,11 +185,10 @@ def _tab_trades():
 def _tab_precos():
     precos = _db.load_precos()
     cols = [
-        dict(name="id", id="id", type="numeric", editable=False),
         dict(name="data", id="data", type="text"),
         dict(name="Ticker", id="Ticker", type="text"),
         dict(name="preco", id="preco", type="numeric"),
-        dict(name="ativo_id", id="ativo_id", type="numeric", editable=False),
+        dict(name="fonte", id="fonte", type="text", editable=False),
     ]
     return html.Div([
         dbc.Card(dbc.CardBody([
@@ -409,8 +408,9 @@ def del_trades(_, selected_rows, data):
         if "id" in row and row["id"] is not None:
             ids.append(int(row["id"]))
     try:
-        _db.delete_trades(ids)
-        return _db.load_trades().to_dict("records")
+        # DELETE único; a tabela só perde as linhas removidas (sem recarregar do banco)
+        removidos = set(_db.delete_trades(ids))
+        return [r for r in data if r.get("id") not in removidos]
     except Exception:
         return no_update
 
@@ -469,20 +469,21 @@ def add_preco(n, d, ticker, preco):
     prevent_initial_call=True
 )
 def del_precos(_, selected_rows, data):
-    # Preços não têm delete em lote direto -> use SQL auxiliar por id
+    # Preços são chaveados por (ticker, data) no store de cotações
     if not selected_rows:
         return no_update
-    ids = []
+    keys = []
     for i in selected_rows:
         row = data[i]
-        if row.get("id") is not None:
-            ids.append(int(row["id"]))
-    if not ids:
+        if row.get("Ticker") and row.get("data"):
+            keys.append((row["Ticker"], row["data"]))
+    if not keys:
         return no_update
     try:
-        with _db.connect() as con:
-            con.executemany("DELETE FROM precos WHERE id=?", [(i,) for i in ids])
-        return _db.load_precos().to_dict("records")
+        if not _db.delete_precos(keys):
+            return no_update
+        sel = {(str(t).upper(), str(d)[:10]) for t, d in keys}
+        return [r for r in data if (str(r.get("Ticker") or "").upper(), str(r.get("data") or "")[:10]) not in sel]
     except Exception:
         return no_update
 
@@ -495,16 +496,15 @@ def del_precos(_, selected_rows, data):
 )
 def edit_precos(_, rows):
     try:
+        # edição de preço: upsert pela (ticker,data), num único lote
+        validos = []
         for r in rows or []:
-            rid = r.get("id")
-            if not rid:
-                continue
-            # edição de preço: fazemos upsert pela (ticker,data)
             d = _coerce_date_str(r.get("data"))
             ticker = (r.get("Ticker") or "").upper()
             pr = r.get("preco")
             if d and ticker and pr not in (None, ""):
-                _db.upsert_preco(ticker, d, float(pr))
+                validos.append({"Ticker": ticker, "data": d, "preco": float(pr), "fonte": r.get("fonte") or "manual"})
+        _db.upsert_precos(pd.DataFrame(validos))
         return _db.load_precos().to_dict("records")
     except Exception:
         return no_update
@@ -556,8 +556,8 @@ def del_proventos(_, selected_rows, data):
         if row.get("id") is not None:
             ids.append(int(row["id"]))
     try:
-        _db.delete_proventos(ids)
-        return _db.load_proventos().to_dict("records")
+        removidos = set(_db.delete_proventos(ids))
+        return [r for r in data if r.get("id") not in removidos]
     except Exception:
         return no_update
 
@@ -4,6 +4,10 @@ from __future__ import annotations
 from dash import html, dcc
 from dash.dependencies import Input, Output
 from datetime import date
+import os
+import threading
+import time
+from collections import deque
 import dash_bootstrap_components as dbc
 import pandas as pd
 import numpy as np
@@ -14,8 +18,10 @@ from app import app
 from services.globals import (
     dfReceitas, dfDespesas, dfInvestimentos,
     dfCatReceitas, dfCatDespesas, dfCatInvestimentos,
-    fmt_brl, filter_period_and_categories
+    fmt_brl,
 )
+from services.cache import memoize
+from services.db import load_rollup
 
 # ================== Layout ==================
 card_icon = {
@@ -217,15 +223,18 @@ def _to_df(data: dict) -> pd.DataFrame:
         df["Categoria"] = df["Categoria"].astype(str)
     return df
 
-def _group_month(df: pd.DataFrame, colname: str) -> pd.DataFrame:
-    if df.empty:
+def _group_month(roll: pd.DataFrame, colname: str) -> pd.DataFrame:
+    """Série mensal a partir do rollup (AnoMes × Categoria) já filtrado."""
+    if roll.empty:
         return pd.DataFrame(columns=["AnoMes", colname])
-    g = (
-        df.assign(AnoMes=df["Data"].dt.to_period("M").dt.to_timestamp())
-          .groupby("AnoMes", as_index=False)["Valor"].sum()
-          .rename(columns={"Valor": colname})
-    )
-    return g
+    return (roll.groupby("AnoMes", as_index=False)["Valor"].sum()
+                .rename(columns={"Valor": colname}))
+
+def _rollups(catRec, catDesp, catInv, start, end):
+    """Rollups mensais (tipo × mês × categoria) do período — centenas de linhas, não os lançamentos."""
+    return (load_rollup("receitas", start, end, catRec or []),
+            load_rollup("despesas", start, end, catDesp or []),
+            load_rollup("investimentos", start, end, catInv or []))
 
 def _ema(series: pd.Series, alpha: float = 0.35) -> pd.Series:
     if series.empty:
@@ -279,6 +288,108 @@ def inicializa_periodo(dataR, dataD, dataI):
         return today, today
     return min(datas), max(datas)
 
+# ================== Computação compartilhada ==================
+# KPIs e gráficos têm as mesmas entradas: os agregados do período são calculados
+# uma única vez por (versão das tabelas, filtros) e os dois callbacks só formatam.
+# Tempos medidos por chamada (não entram no valor em cache): TEMPOS guarda as últimas,
+# com 'cache' = hit/miss; as etapas só existem quando o painel foi calculado (miss).
+# FINANCE_DASH_TIMING=1 imprime cada registro.
+_TIMING = os.environ.get("FINANCE_DASH_TIMING", "").strip().lower() in ("1", "true", "yes")
+_painel_lock = threading.Lock()
+_tempos_lock = threading.Lock()
+_etapas = threading.local()
+TEMPOS: deque = deque(maxlen=50)
+
+def _registrar_tempos(tempos: dict) -> None:
+    with _tempos_lock:
+        TEMPOS.append(tempos)
+    if _TIMING:
+        print("[dashboards] " + " ".join(f"{k}={v}" + ("ms" if isinstance(v, float) else "") for k, v in tempos.items()))
+
+def tempos_recentes(n: int = 10) -> list:
+    with _tempos_lock:
+        return list(TEMPOS)[-n:]
+
+def _heatmap_despesas(start, end, catDesp) -> pd.DataFrame:
+    tmp = load_rollup("despesas", start, end, list(catDesp), por="dia")
+    tmp["Mes"] = tmp["Data"].dt.to_period("M").dt.to_timestamp()
+    try: tmp["DiaSem"] = tmp["Data"].dt.day_name(locale="pt_BR").str[:3]
+    except Exception: tmp["DiaSem"] = tmp["Data"].dt.day_name().str[:3]
+    mat = tmp.pivot_table(index="DiaSem", columns="Mes", values="Valor", aggfunc="sum").fillna(0.0)
+    # ordena dias (seg..dom)
+    ordem = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    mapa = {"Seg": "Mon", "Ter": "Tue", "Qua": "Wed", "Qui": "Thu", "Sex": "Fri", "Sáb": "Sat", "Dom": "Sun"}
+    mat["ordem"] = [ordem.index(mapa.get(x, x)) if mapa.get(x, x) in ordem else 0 for x in mat.index]
+    return mat.sort_values("ordem").drop(columns=["ordem"])
+
+@memoize("receitas", "despesas", "investimentos", maxsize=16)
+def _painel(catRec: tuple, catDesp: tuple, catInv: tuple, start, end) -> dict:
+    """Agregados do período (pura; argumentos hasheáveis). Etapas medidas vão para _etapas.atual."""
+    tempos = getattr(_etapas, "atual", {})
+    t0 = time.perf_counter()
+    def etapa(nome):
+        nonlocal t0
+        t1 = time.perf_counter(); tempos[nome] = round((t1 - t0) * 1000.0, 2); t0 = t1
+
+    rR, rD, rI = _rollups(catRec, catDesp, catInv, start, end)
+    etapa("rollups")
+
+    # Séries mensais
+    gR = _group_month(rR, "Receitas")
+    gD = _group_month(rD, "Despesas")
+    gI = _group_month(rI, "Investimentos")
+    dfM = (
+        pd.merge(pd.merge(gR, gD, on="AnoMes", how="outer"), gI, on="AnoMes", how="outer")
+          .sort_values("AnoMes")
+    )
+    # Converte explicitamente para numérico e dá fillna apenas nas colunas numéricas
+    for col in ["Receitas", "Despesas", "Investimentos"]:
+        dfM[col] = pd.to_numeric(dfM[col], errors="coerce")
+    dfM[["Receitas", "Despesas", "Investimentos"]] = dfM[["Receitas", "Despesas", "Investimentos"]].fillna(0.0)
+    dfM[["Receitas", "Despesas", "Investimentos"]] = dfM[["Receitas", "Despesas", "Investimentos"]].astype("float64")
+    dfM["SaldoMes"] = dfM["Receitas"] - dfM["Despesas"] - dfM["Investimentos"]
+    dfM["SaldoAcumulado"] = dfM["SaldoMes"].cumsum()
+    dfM["SaldoEMA3"] = _ema(dfM["SaldoMes"], 0.5)
+    etapa("mensal")
+
+    totalR = float(rR["Valor"].sum())
+    totalD = float(rD["Valor"].sum())
+    totalI = float(rI["Valor"].sum())
+    saldo = totalR - totalD - totalI
+    # Burn rate (média 3 meses de despesas) e runway (meses) = saldo / burn
+    burn = float(_ema(gD["Despesas"], 0.5).tail(3).mean()) if not gD.empty else 0.0
+    runway = (saldo / burn) if burn > 0 else 0.0
+
+    # Despesas por categoria (treemap, top 10 e insights)
+    desp_cat = (rD.groupby("Categoria", as_index=False, observed=True)["Valor"].sum()
+                .sort_values("Valor", ascending=False))
+    etapa("totais")
+
+    heatmap = None if rD.empty else _heatmap_despesas(start, end, catDesp)
+    etapa("heatmap")
+
+    return dict(dfM=dfM, totalR=totalR, totalD=totalD, totalI=totalI, saldo=saldo,
+                burn=burn, runway=runway, desp_cat=desp_cat, heatmap=heatmap)
+
+def painel(catRec, catDesp, catInv, start, end, origem: str = "") -> tuple:
+    """
+    Ponto único de acesso para os callbacks -> (painel, tempos desta chamada).
+    O lock evita que KPIs e gráficos, disparados juntos, calculem o mesmo painel
+    em paralelo: o segundo acha o cache.
+    """
+    t0 = time.perf_counter()
+    args = (tuple(sorted(map(str, catRec or []))), tuple(sorted(map(str, catDesp or []))),
+            tuple(sorted(map(str, catInv or []))), start or None, end or None)
+    etapas = _etapas.atual = {}
+    try:
+        with _painel_lock:
+            p = _painel(*args)
+    finally:
+        del _etapas.atual
+    tempos = {"origem": origem, "cache": "miss" if etapas else "hit", **etapas,
+              "painel": round((time.perf_counter() - t0) * 1000.0, 2)}
+    return p, tempos
+
 # 0.3) KPIs (inclui savings rate, burn e runway)
 @app.callback(
     [
@@ -301,36 +412,21 @@ def inicializa_periodo(dataR, dataD, dataI):
     ],
 )
 def atualizar_kpis(dataR, dataD, dataI, catRec, catDesp, catInv, start, end):
-    dfR, dfD, dfI = _to_df(dataR), _to_df(dataD), _to_df(dataI)
-    dfR_f = filter_period_and_categories(dfR, start, end, catRec or [])
-    dfD_f = filter_period_and_categories(dfD, start, end, catDesp or [])
-    dfI_f = filter_period_and_categories(dfI, start, end, catInv or [])
-
-    totalR = float(dfR_f["Valor"].sum()) if "Valor" in dfR_f else 0.0
-    totalD = float(dfD_f["Valor"].sum()) if "Valor" in dfD_f else 0.0
-    totalI = float(dfI_f["Valor"].sum()) if "Valor" in dfI_f else 0.0
-
-    saldo = totalR - totalD - totalI
+    # os stores só disparam a atualização; os valores vêm do painel compartilhado
+    p, tempos = painel(catRec, catDesp, catInv, start, end, origem="kpis")
+    _registrar_tempos(tempos)
+    totalR, saldo = p["totalR"], p["saldo"]
 
     # Savings rate = (R - D - I) / R (quando R>0)
     sr = (saldo / totalR) if totalR > 0 else 0.0
-    sr_txt = f"{sr*100:.1f}%"
-
-    # Burn rate (média 3 meses de despesas)
-    gD = _group_month(dfD_f, "Despesas")
-    burn = float(_ema(gD["Despesas"], 0.5).tail(3).mean()) if not gD.empty else 0.0
-
-    # Runway (meses) = saldo atual / burn
-    runway = (saldo / burn) if burn > 0 else 0.0
-    runway_txt = f"{runway:.1f}"
 
     return (
         fmt_brl(saldo),
         fmt_brl(totalR),
-        fmt_brl(totalD),
-        sr_txt,
-        fmt_brl(burn),
-        runway_txt,
+        fmt_brl(p["totalD"]),
+        f"{sr*100:.1f}%",
+        fmt_brl(p["burn"]),
+        f"{p['runway']:.1f}",
     )
 
 # 1) Gráficos + insights
@@ -356,33 +452,10 @@ def atualizar_kpis(dataR, dataD, dataI, catRec, catDesp, catInv, start, end):
     ],
 )
 def atualizar_graficos(receitas, despesas, investimentos, catRec, catDesp, catInv, start, end):
-    dfR = _to_df(receitas)
-    dfD = _to_df(despesas)
-    dfI = _to_df(investimentos)
-
-    dfRec = filter_period_and_categories(dfR, start, end, catRec or [])
-    dfDesp = filter_period_and_categories(dfD, start, end, catDesp or [])
-    dfInv = filter_period_and_categories(dfI, start, end, catInv or [])
-
-    # Séries mensais
-    gR = _group_month(dfRec, "Receitas")
-    gD = _group_month(dfDesp, "Despesas")
-    gI = _group_month(dfInv, "Investimentos")
-    dfM = (
-        pd.merge(pd.merge(gR, gD, on="AnoMes", how="outer"), gI, on="AnoMes", how="outer")
-          .sort_values("AnoMes")
-    )
-
-    # >>> Corrige FutureWarning: downcasting em fillna
-    # Converte explicitamente para numérico e dá fillna apenas nas colunas numéricas
-    for col in ["Receitas", "Despesas", "Investimentos"]:
-        dfM[col] = pd.to_numeric(dfM[col], errors="coerce")
-    dfM[["Receitas", "Despesas", "Investimentos"]] = dfM[["Receitas", "Despesas", "Investimentos"]].fillna(0.0)
-    dfM[["Receitas", "Despesas", "Investimentos"]] = dfM[["Receitas", "Despesas", "Investimentos"]].astype("float64")
-
-    dfM["SaldoMes"] = dfM["Receitas"] - dfM["Despesas"] - dfM["Investimentos"]
-    dfM["SaldoAcumulado"] = dfM["SaldoMes"].cumsum()
-    dfM["SaldoEMA3"] = _ema(dfM["SaldoMes"], 0.5)
+    p, tempos = painel(catRec, catDesp, catInv, start, end, origem="graficos")
+    t0 = time.perf_counter()
+    dfM, desp_cat = p["dfM"], p["desp_cat"]
+    totalR, totalD, totalI, saldo = p["totalR"], p["totalD"], p["totalI"], p["saldo"]
 
     # Graph Cashflow (barras empilhadas e linhas)
     fig1 = go.Figure()
@@ -396,25 +469,16 @@ def atualizar_graficos(receitas, despesas, investimentos, catRec, catDesp, catIn
                        title="Fluxo Mensal (R, D, I) + Saldo e Tendência")
 
     # Treemap de despesas
-    if dfDesp.empty:
+    if desp_cat.empty:
         fig2 = go.Figure(); fig2.update_layout(title="Treemap de Despesas por Categoria (sem dados)")
     else:
-        tre = dfDesp.groupby("Categoria", as_index=False)["Valor"].sum().sort_values("Valor", ascending=False)
-        fig2 = px.treemap(tre, path=["Categoria"], values="Valor", title="Despesas por Categoria (Treemap)")
+        fig2 = px.treemap(desp_cat, path=["Categoria"], values="Valor", title="Despesas por Categoria (Treemap)")
 
     # Heatmap (mês × dia da semana) de despesas
-    if dfDesp.empty:
+    mat = p["heatmap"]
+    if mat is None:
         fig3 = px.imshow(np.array([[0]]), text_auto=True, title="Heatmap de Despesas (mês × dia)")
     else:
-        tmp = dfDesp.copy()
-        tmp["Mes"] = tmp["Data"].dt.to_period("M").dt.to_timestamp()
-        tmp["DiaSem"] = tmp["Data"].dt.day_name(locale="pt_BR").str[:3]
-        mat = tmp.pivot_table(index="DiaSem", columns="Mes", values="Valor", aggfunc="sum").fillna(0.0)
-        # ordena dias (seg..dom)
-        ordem = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        mapa = {"Seg": "Mon", "Ter": "Tue", "Qua": "Wed", "Qui": "Thu", "Sex": "Fri", "Sáb": "Sat", "Dom": "Sun"}
-        mat["ordem"] = [ordem.index(mapa.get(x, "Mon")) if mapa.get(x) in ordem else 0 for x in mat.index]
-        mat = mat.sort_values("ordem").drop(columns=["ordem"])
         fig3 = px.imshow(mat.values, aspect="auto",
                          x=[c.strftime("%Y-%m") for c in mat.columns], y=list(mat.index),
                          labels=dict(x="Mês", y="Dia da Semana", color="Despesas"),
@@ -422,10 +486,6 @@ def atualizar_graficos(receitas, despesas, investimentos, catRec, catDesp, catIn
         fig3.update_layout(yaxis_title=None)
 
     # Rosquinha Savings Rate
-    totalR = float(dfRec["Valor"].sum()) if not dfRec.empty else 0.0
-    totalD = float(dfDesp["Valor"].sum()) if not dfDesp.empty else 0.0
-    totalI = float(dfInv["Valor"].sum()) if not dfInv.empty else 0.0
-    saldo = totalR - totalD - totalI
     savings = max(saldo, 0.0)
     spending = max(totalR - savings, 0.0)
     fig4 = px.pie(values=[savings, spending], names=["Poupança (saldo)", "Gastos"],
@@ -441,11 +501,10 @@ def atualizar_graficos(receitas, despesas, investimentos, catRec, catDesp, catIn
     )
 
     # Top 10 Despesas (barra horizontal) — placeholder seguro se vazio
-    if dfDesp.empty:
+    if desp_cat.empty:
         fig6 = go.Figure(); fig6.update_layout(title="Sem dados de Despesas")
     else:
-        top = (dfDesp.groupby("Categoria", as_index=False)["Valor"].sum()
-               .sort_values("Valor", ascending=False).head(10))
+        top = desp_cat.head(10)
         fig6 = px.bar(top, x="Valor", y="Categoria", orientation="h", title="Top 10 Categorias de Despesas")
 
     # Insights automáticos
@@ -454,14 +513,11 @@ def atualizar_graficos(receitas, despesas, investimentos, catRec, catDesp, catIn
         sr = (saldo / totalR) * 100
         insights.append(html.Li(f"Savings Rate no período: {sr:.1f}%."))
 
-    if not dfDesp.empty:
-        top_all = (dfDesp.groupby("Categoria", as_index=False)["Valor"].sum()
-                   .sort_values("Valor", ascending=False))
-        if not top_all.empty:
-            cat_top = top_all.iloc[0]["Categoria"]
-            v_top = top_all.iloc[0]["Valor"]
-            p_top = (v_top / totalD) * 100 if totalD else 0
-            insights.append(html.Li(f"Categoria que mais pesa nas despesas: {cat_top} ({p_top:.1f}% do total)."))
+    if not desp_cat.empty:
+        cat_top = desp_cat.iloc[0]["Categoria"]
+        v_top = desp_cat.iloc[0]["Valor"]
+        p_top = (v_top / totalD) * 100 if totalD else 0
+        insights.append(html.Li(f"Categoria que mais pesa nas despesas: {cat_top} ({p_top:.1f}% do total)."))
 
     if not dfM.empty and (dfM["SaldoMes"] > 0).sum() + (dfM["SaldoMes"] < 0).sum() > 0:
         meses_pos = int((dfM["SaldoMes"] > 0).sum())
@@ -478,4 +534,6 @@ def atualizar_graficos(receitas, despesas, investimentos, catRec, catDesp, catIn
     if savings == 0 and totalR > 0:
         insights.append(html.Li("Sem poupança líquida no período — reveja despesas/investimentos ou aumente receitas."))
 
+    tempos["figuras"] = round((time.perf_counter() - t0) * 1000.0, 2)
+    _registrar_tempos(tempos)
     return fig1, fig2, fig3, fig4, fig5, fig6, insights
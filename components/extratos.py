@@ -1,7 +1,7 @@
 # components/extratos.py
 from __future__ import annotations
 
-from dash import html, dcc, dash_table, no_update, callback_context
+from dash import html, dcc, dash_table, no_update, callback_context, Patch
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
 import pandas as pd
@@ -12,17 +12,11 @@ from app import app
 from services.globals import (
     dfReceitas, dfDespesas, dfInvestimentos,
     dfCatDespesas, dfCatReceitas, dfCatInvestimentos,
-    fmt_brl, filter_period_and_categories, series_by_period,
-    load_receitas, load_despesas, load_investimentos,
-    update_receita_row, update_despesa_row, update_invest_row,
-    append_receitas, append_despesas, append_investimentos,
+    fmt_brl,
+    update_receitas_rows, update_despesas_rows, update_investimentos_rows,
 )
-
-# tenta importar operações de exclusão em massa
-try:
-    from services.globals import delete_receitas, delete_despesas, delete_investimentos
-except Exception:
-    delete_receitas = delete_despesas = delete_investimentos = None
+from services.db import query_fluxo_page, pagina_valida, delete_rows, duplicate_rows, set_column, table_columns
+from services.views import coerce_fluxo as _coerce, fluxo_view, view_args
 
 
 # ========================== Helpers ==========================
@@ -39,17 +33,6 @@ def _cat_color_map(cats_iter):
         m[c] = PALETTE[hash(c) % len(PALETTE)]
     return m
 
-def _coerce(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    if df.empty: return df
-    if "Data" in df.columns:
-        df["Data"] = pd.to_datetime(df["Data"], errors="coerce").dt.normalize()
-    if "Valor" in df.columns:
-        df["Valor"] = pd.to_numeric(df["Valor"], errors="coerce").fillna(0.0)
-    for c in ("Categoria","Descrição"):
-        if c in df.columns: df[c] = df[c].astype(str)
-    return df
-
 def _fmt_fig_currency(fig, title=None):
     if title: fig.update_layout(title=title)
     fig.update_layout(yaxis_tickformat="R$,.2f")
@@ -62,13 +45,19 @@ def _datatable(df: pd.DataFrame, table_id: str, editable_cols: set[str]):
     style_cond = [{"if": {"column_id": "Valor"}, "textAlign": "right"}]
     if "Anomalia" in df.columns:
         style_cond.append({"if": {"filter_query": "{Anomalia} = '⚠️'"}, "backgroundColor": "#fff3cd"})
+    # paginação/ordenação/filtro no servidor: cada ida e volta traz só a página visível
     return dash_table.DataTable(
         id=table_id,
         columns=cols,
         data=df.to_dict("records"),
+        page_current=0,
         page_size=15,
-        sort_action="native",
-        filter_action="native",
+        page_count=1,
+        page_action="custom",
+        sort_action="custom",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
         editable=True,
         row_selectable="multi",
         selected_rows=[],
@@ -85,25 +74,6 @@ def _update_slider(df: pd.DataFrame):
     vmin = float(df["Valor"].min()); vmax = float(df["Valor"].max())
     return vmin, vmax, [vmin, vmax], f"{fmt_brl(vmin)} – {fmt_brl(vmax)}"
 
-def _apply_extra_filters(df: pd.DataFrame, so_status=False, campo_status=None,
-                         desc_contains=None, valor_min=None, valor_max=None) -> pd.DataFrame:
-    if df.empty: return df
-    f = df.copy()
-    if so_status and campo_status and campo_status in f.columns: f = f[f[campo_status] == 1]
-    if desc_contains:
-        s = str(desc_contains).strip().lower()
-        if s and "Descrição" in f.columns: f = f[f["Descrição"].str.lower().str.contains(s, na=False)]
-    if valor_min is not None: f = f[f["Valor"] >= float(valor_min)]
-    if valor_max is not None: f = f[f["Valor"] <= float(valor_max)]
-    return f
-
-def _prev_window(start, end):
-    if not start or not end: return None, None
-    s = pd.to_datetime(start).normalize(); e = pd.to_datetime(end).normalize()
-    delta = (e - s).days + 1
-    prev_end = s - pd.offsets.Day(1); prev_start = prev_end - pd.offsets.Day(delta - 1)
-    return prev_start, prev_end
-
 def kpi_delta_card(title: str, atual: float, anterior: float, good_when: str = "up"):
     delta = (atual - anterior); perc = (delta / anterior * 100.0) if anterior else None
     trend = "↑" if delta > 0 else ("↓" if delta < 0 else "→")
@@ -120,6 +90,16 @@ def apply_pareto(df_cat_sum: pd.DataFrame, on: str = "Valor", pct: float = 0.8):
     d["acum"] = d[on].cumsum() / d[on].sum()
     return d[d["acum"] <= pct]
 
+def _figs_from_view(v, chkPareto, titulo_serie):
+    """Gráficos de Top categoria/descrição, dia da semana e série a partir da visão já agregada."""
+    color_map = _cat_color_map(v.por_categoria["Categoria"])
+    top_cat = apply_pareto(v.por_categoria, "Valor", 0.8) if 1 in (chkPareto or []) else v.por_categoria.head(10)
+    fig_top = _fmt_fig_currency(px.bar(top_cat, x="Categoria", y="Valor", color="Categoria", color_discrete_map=color_map), "Top por Categoria")
+    fig_desc = _fmt_fig_currency(px.bar(v.por_descricao, x="Descrição", y="Valor"), "Top por Descrição")
+    fig_dow = _fmt_fig_currency(px.bar(v.por_dia_semana, x="Dia", y="Valor"), "Por dia da semana")
+    fig_serie = _fmt_fig_currency(px.line(v.por_periodo, x="Periodo", y="Valor", markers=True), titulo_serie)
+    return fig_top, fig_desc, fig_dow, fig_serie
+
 def _parse_bool(v):
     if isinstance(v, (int, float)): return 1 if int(v) != 0 else 0
     if isinstance(v, str):
@@ -130,7 +110,7 @@ def _parse_bool(v):
     return 0
 
 # ----- normalização de payload (corrige warning de datas ISO do DataTable) -----
-_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
+_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}(T|$| )")
 
 def _normalize_payload_for_update(row: dict, editable_cols: set[str]) -> dict:
     import math
@@ -148,7 +128,7 @@ def _normalize_payload_for_update(row: dict, editable_cols: set[str]) -> dict:
         elif k == "Data":
             try:
                 if isinstance(v, str) and _ISO_RE.match(v):
-                    d = pd.to_datetime(v, format="%Y-%m-%dT%H:%M:%S", errors="coerce")
+                    d = pd.to_datetime(v[:10], format="%Y-%m-%d", errors="coerce")
                 else:
                     d = pd.to_datetime(v, dayfirst=True, errors="coerce")
                 if pd.isna(d): continue
@@ -163,12 +143,78 @@ def _normalize_payload_for_update(row: dict, editable_cols: set[str]) -> dict:
             payload[k] = v
     return payload
 
-def _anomalias(df: pd.DataFrame) -> pd.Series:
-    """Retorna série booleana: True se valor é anômalo (>2 desvios dentro da categoria)."""
-    if df.empty or "Categoria" not in df.columns or "Valor" not in df.columns:
-        return pd.Series([False]*len(df), index=df.index)
-    z = (df["Valor"] - df.groupby("Categoria")["Valor"].transform("mean")) / df.groupby("Categoria")["Valor"].transform("std")
-    return (z.abs() >= 2).fillna(False)
+# ----- stores do extrato: {coluna: {id: valor}} — edições viram Patch só das linhas alteradas -----
+def _json_val(v):
+    if isinstance(v, pd.Timestamp): return v.isoformat()
+    if v is None or (isinstance(v, float) and v != v): return None
+    return v.item() if hasattr(v, "item") else v
+
+def _por_id(df: pd.DataFrame) -> dict:
+    if df is None or df.empty or "id" not in df.columns:
+        return {} if df is None else df.to_dict()
+    return df.set_index(df["id"].astype(int).astype(str), drop=False).to_dict()
+
+def _patch_store(changed: pd.DataFrame):
+    if changed is None or changed.empty:
+        return no_update
+    p = Patch()
+    for rec in changed.to_dict("records"):
+        k = str(int(rec["id"]))
+        for col, v in rec.items():
+            p[col][k] = _json_val(v)
+    return p
+
+def _patch_delete(table: str, ids):
+    if not ids:
+        return no_update
+    p = Patch()
+    for col in table_columns(table):
+        for rid in ids:
+            del p[col][str(int(rid))]
+    return p
+
+def _edits(data, data_prev, editable_cols: set[str]) -> list[tuple[int, dict]]:
+    """[(id, payload)] das linhas da página cujo conteúdo editável mudou."""
+    prev_map = {r.get("id"): r for r in (data_prev or []) if r and "id" in r}
+    out = []
+    for curr in data or []:
+        rid = curr.get("id")
+        if rid is None or rid not in prev_map: continue
+        prev = prev_map[rid]
+        if any(curr.get(k) != prev.get(k) for k in editable_cols):
+            payload = _normalize_payload_for_update(curr, editable_cols)
+            if payload:
+                out.append((int(rid), payload))
+    return out
+
+# colunas exibidas nas tabelas (a 'Anomalia' vem calculada do SQL em query_fluxo_page)
+COLS_REC  = ["id","Data","Categoria","Descrição","Valor","Recebido","Recorrente"]
+COLS_DESP = ["id","Data","Categoria","Descrição","Valor","Pago","Fixo","Parcelado","QtdParcelas","ParcelaAtual"]
+COLS_INV  = ["id","Data","Categoria","Descrição","Valor"]
+
+# filtros do painel que, ao mudar, voltam a tabela para a 1ª página
+_RESET_PAGE = {"ddCatRecExtrato","ddCatDespExtrato","ddCatInvExtrato","dprGlobal",
+               "chkRecebRec","chkPagoDesp","txtBuscaRec","txtBuscaDesp","txtBuscaInv",
+               "rsValoresRec","rsValoresDesp","rsValoresInv"}
+
+def _grid_page(table, cols, status_col, page_current, page_size, sort_by, filter_query,
+               categorias, start, end, chk_status, busca, faixa):
+    """Página atual da tabela (dados, nº de páginas, página efetiva)."""
+    trig = {t["prop_id"].split(".")[0] for t in (callback_context.triggered or [])}
+    trig_props = {t["prop_id"].split(".")[-1] for t in (callback_context.triggered or [])}
+    if trig & _RESET_PAGE or trig_props & {"sort_by", "filter_query"}:
+        page_current = 0
+    page_size = int(page_size or 15)
+    faixa = faixa or [None, None]
+    df, total = query_fluxo_page(
+        table, start=start, end=end, categorias=categorias or [], status_col=status_col,
+        so_status=1 in (chk_status or []), busca=busca, valor_min=faixa[0], valor_max=faixa[1],
+        filter_query=filter_query, sort_by=sort_by, page_current=page_current or 0,
+        page_size=page_size, columns=cols,
+    )
+    # query_fluxo_page já leu a página limitada ao total; devolve a mesma ao pager
+    page_count = max(1, -(-total // page_size))
+    return df.to_dict("records"), page_count, pagina_valida(page_current, total, page_size)
 
 
 # ========================== Layout ==========================
@@ -177,9 +223,9 @@ layout = html.Div(
         # boot & stores locais
         dcc.Interval(id="bootExtrato", n_intervals=0, max_intervals=1, interval=300),
 
-        dcc.Store(id="storeReceitasExtrato", data=dfReceitas.to_dict()),
-        dcc.Store(id="storeDespesasExtrato", data=dfDespesas.to_dict()),
-        dcc.Store(id="storeInvestExtrato", data=dfInvestimentos.to_dict()),
+        dcc.Store(id="storeReceitasExtrato", data=_por_id(dfReceitas)),
+        dcc.Store(id="storeDespesasExtrato", data=_por_id(dfDespesas)),
+        dcc.Store(id="storeInvestExtrato", data=_por_id(dfInvestimentos)),
         dcc.Store(id="storeExtratoProfiles", storage_type="local"),
         dcc.Store(id="storeMetasDesp", storage_type="local"),
 
@@ -479,13 +525,13 @@ def quick_period(n_m, n_3, n_ano, n_12, n_clear):
 # Sincroniza Stores locais com os globais (se existirem no app)
 @app.callback(Output("storeReceitasExtrato","data", allow_duplicate=True),
               Input("storeReceitas","data"), prevent_initial_call=True)
-def _sync_r(d): return d
+def _sync_r(d): return _por_id(pd.DataFrame(d))
 @app.callback(Output("storeDespesasExtrato","data", allow_duplicate=True),
               Input("storeDespesas","data"), prevent_initial_call=True)
-def _sync_d(d): return d
+def _sync_d(d): return _por_id(pd.DataFrame(d))
 @app.callback(Output("storeInvestExtrato","data", allow_duplicate=True),
               Input("storeInvestimentos","data"), prevent_initial_call=True)
-def _sync_i(d): return d
+def _sync_i(d): return _por_id(pd.DataFrame(d))
 
 
 # ========================= SLIDERS =========================
@@ -505,76 +551,71 @@ def _sl_d(d): return _update_slider(_coerce(pd.DataFrame(d)))
 def _sl_i(d): return _update_slider(_coerce(pd.DataFrame(d)))
 
 
+# ===================== TABELAS (paginação no servidor) =====================
+@app.callback(
+    Output("gridReceitas","data"), Output("gridReceitas","page_count"), Output("gridReceitas","page_current"),
+    Input("gridReceitas","page_current"), Input("gridReceitas","page_size"),
+    Input("gridReceitas","sort_by"), Input("gridReceitas","filter_query"),
+    Input("storeReceitasExtrato","data"),
+    Input("ddCatRecExtrato","value"), Input("dprGlobal","start_date"), Input("dprGlobal","end_date"),
+    Input("chkRecebRec","value"), Input("txtBuscaRec","value"), Input("rsValoresRec","value"),
+)
+def page_receitas(page, size, sort_by, fq, _store, categorias, start, end, chkRec, busca, faixa):
+    return _grid_page("receitas", COLS_REC, "Recebido", page, size, sort_by, fq,
+                      categorias, start, end, chkRec, busca, faixa)
+
+@app.callback(
+    Output("gridDespesas","data"), Output("gridDespesas","page_count"), Output("gridDespesas","page_current"),
+    Input("gridDespesas","page_current"), Input("gridDespesas","page_size"),
+    Input("gridDespesas","sort_by"), Input("gridDespesas","filter_query"),
+    Input("storeDespesasExtrato","data"),
+    Input("ddCatDespExtrato","value"), Input("dprGlobal","start_date"), Input("dprGlobal","end_date"),
+    Input("chkPagoDesp","value"), Input("txtBuscaDesp","value"), Input("rsValoresDesp","value"),
+)
+def page_despesas(page, size, sort_by, fq, _store, categorias, start, end, chkPago, busca, faixa):
+    return _grid_page("despesas", COLS_DESP, "Pago", page, size, sort_by, fq,
+                      categorias, start, end, chkPago, busca, faixa)
+
+@app.callback(
+    Output("gridInvestimentos","data"), Output("gridInvestimentos","page_count"), Output("gridInvestimentos","page_current"),
+    Input("gridInvestimentos","page_current"), Input("gridInvestimentos","page_size"),
+    Input("gridInvestimentos","sort_by"), Input("gridInvestimentos","filter_query"),
+    Input("storeInvestExtrato","data"),
+    Input("ddCatInvExtrato","value"), Input("dprGlobal","start_date"), Input("dprGlobal","end_date"),
+    Input("txtBuscaInv","value"), Input("rsValoresInv","value"),
+)
+def page_invest(page, size, sort_by, fq, _store, categorias, start, end, busca, faixa):
+    return _grid_page("investimentos", COLS_INV, None, page, size, sort_by, fq,
+                      categorias, start, end, None, busca, faixa)
+
+
 # ========================= RECEITAS =========================
 @app.callback(
     Output("kpis-receitas","children"),
     Output("grafTop10Rec","figure"), Output("grafTopDescRec","figure"),
     Output("grafDOWRec","figure"), Output("grafSerieRec","figure"),
-    Output("gridReceitas","data"), Output("gridReceitas","columns"),
     Output("ddCatRecExtrato","options"),
     Input("storeReceitasExtrato","data"),
     Input("ddCatRecExtrato","value"), Input("dprGlobal","start_date"), Input("dprGlobal","end_date"),
     Input("riAgruparPorGlobal","value"), Input("chkParetoRec","value"),
     Input("chkRecebRec","value"), Input("txtBuscaRec","value"), Input("rsValoresRec","value"),
 )
-def analise_receitas(dataR, categorias, start, end, agrupar, chkPareto, chkRec, busca, faixa):
-    df = _coerce(pd.DataFrame(dataR))
-    if df.empty:
+def analise_receitas(_store, categorias, start, end, agrupar, chkPareto, chkRec, busca, faixa):
+    # o store só dispara; a seleção vem da visão memoizada (por versão da tabela + filtros)
+    v = fluxo_view("receitas", campo_status="Recebido", so_status=1 in (chkRec or []), agrupar=agrupar,
+                   **view_args(start, end, categorias, busca, faixa))
+    opts = [{"label": c, "value": c} for c in v.categorias]
+    if not v.categorias:
         vazio = _fmt_fig_currency(px.bar(), "Sem dados")
-        tab = pd.DataFrame(columns=["id","Data","Categoria","Descrição","Valor","Recebido","Recorrente","Anomalia"])
-        opts = []
-        return [dbc.Col(dbc.Alert("Sem dados no filtro.", color="light"), md=12)], vazio, vazio, vazio, vazio, tab.to_dict("records"), [{"name":c,"id":c,"editable":c in EDITABLE_REC} for c in tab.columns], opts
-
-    # opções atualizadas
-    opts = [{"label": c, "value": c} for c in sorted(df["Categoria"].dropna().astype(str).unique().tolist())]
-
-    df_f = filter_period_and_categories(df, start, end, categorias or [])
-    df_f = _apply_extra_filters(df_f, so_status=1 in (chkRec or []), campo_status="Recebido",
-                                desc_contains=busca, valor_min=(faixa or [None,None])[0], valor_max=(faixa or [None,None])[1])
-
-    # KPIs com delta
-    prev_s, prev_e = _prev_window(start, end)
-    df_prev = filter_period_and_categories(df, prev_s, prev_e, categorias or [])
-    df_prev = _apply_extra_filters(df_prev, so_status=1 in (chkRec or []), campo_status="Recebido",
-                                   desc_contains=busca, valor_min=(faixa or [None,None])[0], valor_max=(faixa or [None,None])[1])
-    total_atual = float(df_f["Valor"].sum()) if not df_f.empty else 0.0
-    total_prev  = float(df_prev["Valor"].sum()) if not df_prev.empty else 0.0
-    kpis = [dbc.Col(kpi_delta_card("Receitas (período)", total_atual, total_prev, good_when="up"), md=3)]
-
-    if df_f.empty:
-        vazio = _fmt_fig_currency(px.bar(), "Sem dados no filtro")
-        tab = pd.DataFrame(columns=["id","Data","Categoria","Descrição","Valor","Recebido","Recorrente","Anomalia"])
-        return kpis, vazio, vazio, vazio, vazio, tab.to_dict("records"), [{"name":c,"id":c,"editable":c in EDITABLE_REC} for c in tab.columns], opts
-
-    # Cores por categoria
-    color_map = _cat_color_map(df_f["Categoria"].unique())
-
-    # Top categorias (Pareto opcional)
-    top_cat = df_f.groupby("Categoria", as_index=False)["Valor"].sum()
-    top_cat = apply_pareto(top_cat, "Valor", 0.8) if 1 in (chkPareto or []) else top_cat.sort_values("Valor", ascending=False).head(10)
-    fig_top = _fmt_fig_currency(px.bar(top_cat, x="Categoria", y="Valor", color="Categoria", color_discrete_map=color_map), "Top por Categoria")
-
-    # Top descrições
-    topdesc = (df_f.groupby("Descrição", as_index=False)["Valor"].sum()
-               .sort_values("Valor", ascending=False).head(10))
-    fig_desc = _fmt_fig_currency(px.bar(topdesc, x="Descrição", y="Valor"), "Top por Descrição")
+        return [dbc.Col(dbc.Alert("Sem dados no filtro.", color="light"), md=12)], vazio, vazio, vazio, vazio, opts
 
-    # DOW e Série
-    dow = df_f.copy()
-    try: dow["Dia"] = dow["Data"].dt.day_name(locale="pt_BR").str[:3]
-    except Exception: dow["Dia"] = dow["Data"].dt.day_name().str[:3]
-    fig_dow = _fmt_fig_currency(px.bar(dow.groupby("Dia", as_index=False)["Valor"].sum(), x="Dia", y="Valor"), "Por dia da semana")
-    serie = series_by_period(df_f, agrupar)
-    fig_serie = _fmt_fig_currency(px.line(serie, x="Periodo", y="Valor", markers=True), "Entradas por período")
-
-    # Tabela + anomalias
-    df_tab = df_f.loc[:, [c for c in ["id","Data","Categoria","Descrição","Valor","Recebido","Recorrente"] if c in df_f.columns]]\
-                 .sort_values("Data", ascending=False).copy()
-    anom = _anomalias(df_tab.rename(columns={"Descrição":"Descricao"}).rename(columns={"Descricao":"Descrição"}))
-    df_tab["Anomalia"] = ["⚠️" if x else "" for x in anom.tolist()]
+    kpis = [dbc.Col(kpi_delta_card("Receitas (período)", v.total_atual, v.total_anterior, good_when="up"), md=3)]
+    if v.vazio:
+        vazio = _fmt_fig_currency(px.bar(), "Sem dados no filtro")
+        return kpis, vazio, vazio, vazio, vazio, opts
 
-    cols = [{"name":c,"id":c,"editable":c in EDITABLE_REC} for c in df_tab.columns]
-    return kpis, fig_top, fig_desc, fig_dow, fig_serie, df_tab.to_dict("records"), cols, opts
+    fig_top, fig_desc, fig_dow, fig_serie = _figs_from_view(v, chkPareto, "Entradas por período")
+    return kpis, fig_top, fig_desc, fig_dow, fig_serie, opts
 
 # Edição inline (Receitas)
 @app.callback(
@@ -587,16 +628,10 @@ def analise_receitas(dataR, categorias, start, end, agrupar, chkPareto, chkRec,
 def save_edit_rec(ts, data, data_prev):
     if data_prev is None: return False, False, no_update
     try:
-        prev_map = {r.get("id"): r for r in data_prev if r and "id" in r}
-        for curr in data:
-            rid = curr.get("id")
-            if rid is None or rid not in prev_map: continue
-            prev = prev_map[rid]
-            if any(curr.get(k) != prev.get(k) for k in EDITABLE_REC):
-                payload = _normalize_payload_for_update(curr, EDITABLE_REC)
-                if payload:
-                    update_receita_row(int(rid), payload)
-        return True, False, load_receitas().to_dict()
+        # todas as células alteradas numa transação; o store recebe só as linhas tocadas
+        changes = _edits(data, data_prev, EDITABLE_REC)
+        if not changes: return False, False, no_update
+        return True, False, _patch_store(update_receitas_rows(changes))
     except Exception:
         return False, True, no_update
 
@@ -615,31 +650,21 @@ def bulk_rec(mark, unmark, dup, delete, sel_rows, data):
             if callback_context.triggered else None)
     rows = [data[i] for i in (sel_rows or []) if 0 <= i < len(data)]
     if not rows: return no_update, False, False, False
+    ids = [int(r.get("id")) for r in rows if r.get("id") is not None]
+    if not ids: return no_update, False, False, trig == "btnRecDel"
 
+    # um único statement por ação (ids em tabela temporária); o store recebe só o delta
     if trig in ("btnRecMark", "btnRecUnmark"):
         val = 1 if trig == "btnRecMark" else 0
-        for r in rows:
-            rid = r.get("id")
-            if rid is not None:
-                update_receita_row(int(rid), {"Recebido": val})
-        return load_receitas().to_dict(), False, False, False
+        return _patch_store(set_column("receitas", ids, "Recebido", val)), False, False, False
 
     if trig == "btnRecDup":
-        import pandas as pd
         cols = ["Valor","Recebido","Recorrente","Data","Categoria","Descrição"]
-        df_new = pd.DataFrame([{k: r.get(k) for k in cols if k in r} for r in rows])
-        if not df_new.empty:
-            append_receitas(df_new)
-        return load_receitas().to_dict(), True, False, False
+        return _patch_store(duplicate_rows("receitas", ids, cols)), True, False, False
 
     if trig == "btnRecDel":
-        ids = [int(r.get("id")) for r in rows if r.get("id") is not None]
-        if not ids: return no_update, False, False, True
         try:
-            if delete_receitas is None:
-                raise RuntimeError("delete_receitas() não disponível em services.globals")
-            delete_receitas(ids)
-            return load_receitas().to_dict(), False, True, False
+            return _patch_delete("receitas", delete_rows("receitas", ids)), False, True, False
         except Exception:
             return no_update, False, False, True
 
@@ -651,7 +676,6 @@ def bulk_rec(mark, unmark, dup, delete, sel_rows, data):
     Output("kpis-despesas","children"),
     Output("grafTop10Desp","figure"), Output("grafTopDescDesp","figure"),
     Output("grafDOWDesp","figure"), Output("grafSerieDesp","figure"),
-    Output("gridDespesas","data"), Output("gridDespesas","columns"),
     Output("ddCatDespExtrato","options"), Output("ddMetaCatDesp","options"), Output("divMetasDesp","children"),
     Input("storeDespesasExtrato","data"),
     Input("ddCatDespExtrato","value"), Input("dprGlobal","start_date"), Input("dprGlobal","end_date"),
@@ -659,65 +683,28 @@ def bulk_rec(mark, unmark, dup, delete, sel_rows, data):
     Input("chkPagoDesp","value"), Input("txtBuscaDesp","value"), Input("rsValoresDesp","value"),
     State("storeMetasDesp","data"),
 )
-def analise_despesas(dataD, categorias, start, end, agrupar, chkPareto, chkPago, busca, faixa, metas_store):
-    df = _coerce(pd.DataFrame(dataD))
-    opts = [{"label": c, "value": c} for c in sorted(df["Categoria"].dropna().astype(str).unique().tolist())] if not df.empty else []
+def analise_despesas(_store, categorias, start, end, agrupar, chkPareto, chkPago, busca, faixa, metas_store):
+    v = fluxo_view("despesas", campo_status="Pago", so_status=1 in (chkPago or []), agrupar=agrupar,
+                   **view_args(start, end, categorias, busca, faixa))
+    opts = [{"label": c, "value": c} for c in v.categorias]
     metas_opts = opts
 
-    if df.empty:
+    if not v.categorias:
         vazio = _fmt_fig_currency(px.bar(), "Sem dados")
-        tab = pd.DataFrame(columns=["id","Data","Categoria","Descrição","Valor","Pago","Fixo","Parcelado","QtdParcelas","ParcelaAtual","Anomalia"])
-        return [dbc.Col(dbc.Alert("Sem dados no filtro.", color="light"), md=12)], vazio, vazio, vazio, vazio, tab.to_dict("records"), [{"name":c,"id":c,"editable":c in EDITABLE_DESP} for c in tab.columns], opts, metas_opts, []
-
-    df_f = filter_period_and_categories(df, start, end, categorias or [])
-    df_f = _apply_extra_filters(df_f, so_status=1 in (chkPago or []), campo_status="Pago",
-                                desc_contains=busca, valor_min=(faixa or [None,None])[0], valor_max=(faixa or [None,None])[1])
-
-    # KPIs com delta
-    prev_s, prev_e = _prev_window(start, end)
-    df_prev = filter_period_and_categories(df, prev_s, prev_e, categorias or [])
-    df_prev = _apply_extra_filters(df_prev, so_status=1 in (chkPago or []), campo_status="Pago",
-                                   desc_contains=busca, valor_min=(faixa or [None,None])[0], valor_max=(faixa or [None,None])[1])
-    total_atual = float(df_f["Valor"].sum()) if not df_f.empty else 0.0
-    total_prev  = float(df_prev["Valor"].sum()) if not df_prev.empty else 0.0
-    kpis = [dbc.Col(kpi_delta_card("Despesas (período)", total_atual, total_prev, good_when="down"), md=3)]
-
-    if df_f.empty:
-        vazio = _fmt_fig_currency(px.bar(), "Sem dados no filtro")
-        tab = pd.DataFrame(columns=["id","Data","Categoria","Descrição","Valor","Pago","Fixo","Parcelado","QtdParcelas","ParcelaAtual","Anomalia"])
-        return kpis, vazio, vazio, vazio, vazio, tab.to_dict("records"), [{"name":c,"id":c,"editable":c in EDITABLE_DESP} for c in tab.columns], opts, metas_opts, []
-
-    # Cores e gráficos
-    color_map = _cat_color_map(df_f["Categoria"].unique())
-    top_cat = df_f.groupby("Categoria", as_index=False)["Valor"].sum()
-    top_cat = apply_pareto(top_cat, "Valor", 0.8) if 1 in (chkPareto or []) else top_cat.sort_values("Valor", ascending=False).head(10)
-    fig_top = _fmt_fig_currency(px.bar(top_cat, x="Categoria", y="Valor", color="Categoria", color_discrete_map=color_map), "Top por Categoria")
-
-    topdesc = (df_f.groupby("Descrição", as_index=False)["Valor"].sum()
-               .sort_values("Valor", ascending=False).head(10))
-    fig_desc = _fmt_fig_currency(px.bar(topdesc, x="Descrição", y="Valor"), "Top por Descrição")
+        return [dbc.Col(dbc.Alert("Sem dados no filtro.", color="light"), md=12)], vazio, vazio, vazio, vazio, opts, metas_opts, []
 
-    dow = df_f.copy()
-    try: dow["Dia"] = dow["Data"].dt.day_name(locale="pt_BR").str[:3]
-    except Exception: dow["Dia"] = dow["Data"].dt.day_name().str[:3]
-    fig_dow = _fmt_fig_currency(px.bar(dow.groupby("Dia", as_index=False)["Valor"].sum(), x="Dia", y="Valor"), "Por dia da semana")
-
-    serie = series_by_period(df_f, agrupar)
-    fig_serie = _fmt_fig_currency(px.line(serie, x="Periodo", y="Valor", markers=True), "Saídas por período")
-
-    # Tabela + anomalias
-    df_tab = df_f.loc[:, [c for c in ["id","Data","Categoria","Descrição","Valor","Pago","Fixo","Parcelado","QtdParcelas","ParcelaAtual"] if c in df_f.columns]]\
-                 .sort_values("Data", ascending=False).copy()
-    anom = _anomalias(df_tab)
-    df_tab["Anomalia"] = ["⚠️" if x else "" for x in anom.tolist()]
+    kpis = [dbc.Col(kpi_delta_card("Despesas (período)", v.total_atual, v.total_anterior, good_when="down"), md=3)]
+    if v.vazio:
+        vazio = _fmt_fig_currency(px.bar(), "Sem dados no filtro")
+        return kpis, vazio, vazio, vazio, vazio, opts, metas_opts, []
 
-    cols = [{"name":c,"id":c,"editable":c in EDITABLE_DESP} for c in df_tab.columns]
+    fig_top, fig_desc, fig_dow, fig_serie = _figs_from_view(v, chkPareto, "Saídas por período")
 
     # Metas e progresso por categoria neste período
     metas = metas_store or {}
     barras = []
-    if metas and not df_f.empty:
-        atual = df_f.groupby("Categoria")["Valor"].sum().to_dict()
+    if metas:
+        atual = dict(zip(v.por_categoria["Categoria"], v.por_categoria["Valor"]))
         for cat, meta in metas.items():
             meta_val = float(meta or 0)
             if meta_val <= 0: continue
@@ -731,7 +718,7 @@ def analise_despesas(dataD, categorias, start, end, agrupar, chkPareto, chkPago,
                 ])
             )
 
-    return kpis, fig_top, fig_desc, fig_dow, fig_serie, df_tab.to_dict("records"), cols, opts, metas_opts, barras
+    return kpis, fig_top, fig_desc, fig_dow, fig_serie, opts, metas_opts, barras
 
 # Edição inline (Despesas)
 @app.callback(
@@ -744,16 +731,10 @@ def analise_despesas(dataD, categorias, start, end, agrupar, chkPareto, chkPago,
 def save_edit_desp(ts, data, data_prev):
     if data_prev is None: return False, False, no_update
     try:
-        prev_map = {r.get("id"): r for r in data_prev if r and "id" in r}
-        for curr in data:
-            rid = curr.get("id")
-            if rid is None or rid not in prev_map: continue
-            prev = prev_map[rid]
-            if any(curr.get(k) != prev.get(k) for k in EDITABLE_DESP):
-                payload = _normalize_payload_for_update(curr, EDITABLE_DESP)
-                if payload:
-                    update_despesa_row(int(rid), payload)
-        return True, False, load_despesas().to_dict()
+        # todas as células alteradas numa transação; o store recebe só as linhas tocadas
+        changes = _edits(data, data_prev, EDITABLE_DESP)
+        if not changes: return False, False, no_update
+        return True, False, _patch_store(update_despesas_rows(changes))
     except Exception:
         return False, True, no_update
 
@@ -772,31 +753,21 @@ def bulk_desp(mark, unmark, dup, delete, sel_rows, data):
             if callback_context.triggered else None)
     rows = [data[i] for i in (sel_rows or []) if 0 <= i < len(data)]
     if not rows: return no_update, False, False, False
+    ids = [int(r.get("id")) for r in rows if r.get("id") is not None]
+    if not ids: return no_update, False, False, trig == "btnDespDel"
 
+    # um único statement por ação (ids em tabela temporária); o store recebe só o delta
     if trig in ("btnDespMark", "btnDespUnmark"):
         val = 1 if trig == "btnDespMark" else 0
-        for r in rows:
-            rid = r.get("id")
-            if rid is not None:
-                update_despesa_row(int(rid), {"Pago": val})
-        return load_despesas().to_dict(), False, False, False
+        return _patch_store(set_column("despesas", ids, "Pago", val)), False, False, False
 
     if trig == "btnDespDup":
-        import pandas as pd
         cols = ["Valor","Pago","Fixo","Data","Categoria","Descrição","Parcelado","QtdParcelas","ParcelaAtual"]
-        df_new = pd.DataFrame([{k: r.get(k) for k in cols if k in r} for r in rows])
-        if not df_new.empty:
-            append_despesas(df_new)
-        return load_despesas().to_dict(), True, False, False
+        return _patch_store(duplicate_rows("despesas", ids, cols)), True, False, False
 
     if trig == "btnDespDel":
-        ids = [int(r.get("id")) for r in rows if r.get("id") is not None]
-        if not ids: return no_update, False, False, True
         try:
-            if delete_despesas is None:
-                raise RuntimeError("delete_despesas() não disponível em services.globals")
-            delete_despesas(ids)
-            return load_despesas().to_dict(), False, True, False
+            return _patch_delete("despesas", delete_rows("despesas", ids)), False, True, False
         except Exception:
             return no_update, False, False, True
 
@@ -822,64 +793,27 @@ def save_meta_desp(n, cat, meta, store):
     Output("kpis-invest","children"),
     Output("grafTop10Inv","figure"), Output("grafTopDescInv","figure"),
     Output("grafDOWInv","figure"), Output("grafSerieInv","figure"),
-    Output("gridInvestimentos","data"), Output("gridInvestimentos","columns"),
     Output("ddCatInvExtrato","options"),
     Input("storeInvestExtrato","data"),
     Input("ddCatInvExtrato","value"), Input("dprGlobal","start_date"), Input("dprGlobal","end_date"),
     Input("riAgruparPorGlobal","value"), Input("chkParetoInv","value"),
     Input("txtBuscaInv","value"), Input("rsValoresInv","value"),
 )
-def analise_invest(dataI, categorias, start, end, agrupar, chkPareto, busca, faixa):
-    df = _coerce(pd.DataFrame(dataI))
-    opts = [{"label": c, "value": c} for c in sorted(df["Categoria"].dropna().astype(str).unique().tolist())] if not df.empty else []
+def analise_invest(_store, categorias, start, end, agrupar, chkPareto, busca, faixa):
+    v = fluxo_view("investimentos", agrupar=agrupar, **view_args(start, end, categorias, busca, faixa))
+    opts = [{"label": c, "value": c} for c in v.categorias]
 
-    if df.empty:
+    if not v.categorias:
         vazio = _fmt_fig_currency(px.bar(), "Sem dados")
-        tab = pd.DataFrame(columns=["id","Data","Categoria","Descrição","Valor","Anomalia"])
-        return [dbc.Col(dbc.Alert("Sem dados no filtro.", color="light"), md=12)], vazio, vazio, vazio, vazio, tab.to_dict("records"), [{"name":c,"id":c,"editable":c in EDITABLE_INV} for c in tab.columns], opts
-
-    df_f = filter_period_and_categories(df, start, end, categorias or [])
-    df_f = _apply_extra_filters(df_f, so_status=False, campo_status=None,
-                                desc_contains=busca, valor_min=(faixa or [None,None])[0], valor_max=(faixa or [None,None])[1])
-
-    # KPIs
-    prev_s, prev_e = _prev_window(start, end)
-    df_prev = filter_period_and_categories(df, prev_s, prev_e, categorias or [])
-    df_prev = _apply_extra_filters(df_prev, so_status=False, campo_status=None,
-                                   desc_contains=busca, valor_min=(faixa or [None,None])[0], valor_max=(faixa or [None,None])[1])
-    total_atual = float(df_f["Valor"].sum()) if not df_f.empty else 0.0
-    total_prev  = float(df_prev["Valor"].sum()) if not df_prev.empty else 0.0
-    kpis = [dbc.Col(kpi_delta_card("Investimentos (aportes)", total_atual, total_prev, good_when="up"), md=3)]
-
-    if df_f.empty:
-        vazio = _fmt_fig_currency(px.bar(), "Sem dados no filtro")
-        tab = pd.DataFrame(columns=["id","Data","Categoria","Descrição","Valor","Anomalia"])
-        return kpis, vazio, vazio, vazio, vazio, tab.to_dict("records"), [{"name":c,"id":c,"editable":c in EDITABLE_INV} for c in tab.columns], opts
-
-    color_map = _cat_color_map(df_f["Categoria"].unique())
-    top_cat = df_f.groupby("Categoria", as_index=False)["Valor"].sum()
-    top_cat = apply_pareto(top_cat, "Valor", 0.8) if 1 in (chkPareto or []) else top_cat.sort_values("Valor", ascending=False).head(10)
-    fig_top = _fmt_fig_currency(px.bar(top_cat, x="Categoria", y="Valor", color="Categoria", color_discrete_map=color_map), "Top por Categoria")
+        return [dbc.Col(dbc.Alert("Sem dados no filtro.", color="light"), md=12)], vazio, vazio, vazio, vazio, opts
 
-    topdesc = (df_f.groupby("Descrição", as_index=False)["Valor"].sum()
-               .sort_values("Valor", ascending=False).head(10))
-    fig_desc = _fmt_fig_currency(px.bar(topdesc, x="Descrição", y="Valor"), "Top por Descrição")
-
-    dow = df_f.copy()
-    try: dow["Dia"] = dow["Data"].dt.day_name(locale="pt_BR").str[:3]
-    except Exception: dow["Dia"] = dow["Data"].dt.day_name().str[:3]
-    fig_dow = _fmt_fig_currency(px.bar(dow.groupby("Dia", as_index=False)["Valor"].sum(), x="Dia", y="Valor"), "Por dia da semana")
-
-    serie = series_by_period(df_f, agrupar)
-    fig_serie = _fmt_fig_currency(px.line(serie, x="Periodo", y="Valor", markers=True), "Aportes por período")
-
-    df_tab = df_f.loc[:, [c for c in ["id","Data","Categoria","Descrição","Valor"] if c in df_f.columns]]\
-                 .sort_values("Data", ascending=False).copy()
-    anom = _anomalias(df_tab)
-    df_tab["Anomalia"] = ["⚠️" if x else "" for x in anom.tolist()]
-    cols = [{"name":c,"id":c,"editable":c in EDITABLE_INV} for c in df_tab.columns]
+    kpis = [dbc.Col(kpi_delta_card("Investimentos (aportes)", v.total_atual, v.total_anterior, good_when="up"), md=3)]
+    if v.vazio:
+        vazio = _fmt_fig_currency(px.bar(), "Sem dados no filtro")
+        return kpis, vazio, vazio, vazio, vazio, opts
 
-    return kpis, fig_top, fig_desc, fig_dow, fig_serie, df_tab.to_dict("records"), cols, opts
+    fig_top, fig_desc, fig_dow, fig_serie = _figs_from_view(v, chkPareto, "Aportes por período")
+    return kpis, fig_top, fig_desc, fig_dow, fig_serie, opts
 
 # Edição inline (Investimentos)
 @app.callback(
@@ -892,16 +826,10 @@ def analise_invest(dataI, categorias, start, end, agrupar, chkPareto, busca, fai
 def save_edit_inv(ts, data, data_prev):
     if data_prev is None: return False, False, no_update
     try:
-        prev_map = {r.get("id"): r for r in data_prev if r and "id" in r}
-        for curr in data:
-            rid = curr.get("id")
-            if rid is None or rid not in prev_map: continue
-            prev = prev_map[rid]
-            if any(curr.get(k) != prev.get(k) for k in EDITABLE_INV):
-                payload = _normalize_payload_for_update(curr, EDITABLE_INV)
-                if payload:
-                    update_invest_row(int(rid), payload)
-        return True, False, load_investimentos().to_dict()
+        # todas as células alteradas numa transação; o store recebe só as linhas tocadas
+        changes = _edits(data, data_prev, EDITABLE_INV)
+        if not changes: return False, False, no_update
+        return True, False, _patch_store(update_investimentos_rows(changes))
     except Exception:
         return False, True, no_update
 
@@ -920,23 +848,17 @@ def bulk_inv_ops(n_dup, n_del, sel_rows, data):
             if callback_context.triggered else None)
     rows = [data[i] for i in (sel_rows or []) if 0 <= i < len(data)]
     if not rows: return no_update, False, False, False
+    ids = [int(r.get("id")) for r in rows if r.get("id") is not None]
+    if not ids: return no_update, False, False, trig == "btnInvDel"
 
+    # um único statement por ação (ids em tabela temporária); o store recebe só o delta
     if trig == "btnInvDup":
-        import pandas as pd
         cols = ["Valor","Data","Categoria","Descrição"]
-        df_new = pd.DataFrame([{k: r.get(k) for k in cols if k in r} for r in rows])
-        if not df_new.empty:
-            append_investimentos(df_new)
-        return load_investimentos().to_dict(), True, False, False
+        return _patch_store(duplicate_rows("investimentos", ids, cols)), True, False, False
 
     if trig == "btnInvDel":
-        ids = [int(r.get("id")) for r in rows if r.get("id") is not None]
-        if not ids: return no_update, False, False, True
         try:
-            if delete_investimentos is None:
-                raise RuntimeError("delete_investimentos() não disponível em services.globals")
-            delete_investimentos(ids)
-            return load_investimentos().to_dict(), False, True, False
+            return _patch_delete("investimentos", delete_rows("investimentos", ids)), False, True, False
         except Exception:
             return no_update, False, False, True
 
@@ -944,14 +866,28 @@ def bulk_inv_ops(n_dup, n_del, sel_rows, data):
 
 
 # ========================= Downloads Investimentos =========================
+# a tabela só guarda a página visível: exporta o conjunto filtrado inteiro direto do SQLite
+_INV_EXPORT_STATE = [
+    State("gridInvestimentos","sort_by"), State("gridInvestimentos","filter_query"),
+    State("ddCatInvExtrato","value"), State("dprGlobal","start_date"), State("dprGlobal","end_date"),
+    State("txtBuscaInv","value"), State("rsValoresInv","value"),
+]
+
+def _export_inv(sort_by, fq, categorias, start, end, busca, faixa) -> pd.DataFrame:
+    faixa = faixa or [None, None]
+    df, _ = query_fluxo_page("investimentos", start=start, end=end, categorias=categorias or [],
+                             busca=busca, valor_min=faixa[0], valor_max=faixa[1],
+                             filter_query=fq, sort_by=sort_by, page_size=None, columns=COLS_INV)
+    return df
+
 @app.callback(Output("downCsvInv","data"), Input("btnCsvInv","n_clicks"),
-              State("gridInvestimentos","data"), prevent_initial_call=True)
-def down_csv_inv(n, data):
-    df = pd.DataFrame(data)
+              *_INV_EXPORT_STATE, prevent_initial_call=True)
+def down_csv_inv(n, *filtros):
+    df = _export_inv(*filtros)
     return dcc.send_data_frame(df.to_csv, filename="investimentos_filtrados.csv", index=False, encoding="utf-8")
 
 @app.callback(Output("downXlsxInv","data"), Input("btnXlsxInv","n_clicks"),
-              State("gridInvestimentos","data"), prevent_initial_call=True)
-def down_xlsx_inv(n, data):
-    df = pd.DataFrame(data)
+              *_INV_EXPORT_STATE, prevent_initial_call=True)
+def down_xlsx_inv(n, *filtros):
+    df = _export_inv(*filtros)
     return dcc.send_data_frame(df.to_excel, filename="investimentos_filtrados.xlsx", index=False, sheet_name="Investimentos")
@@ -4,7 +4,8 @@ from dash import html, dcc, Input, Output, State, callback, ctx
 import dash_bootstrap_components as dbc
 from dash_iconify import DashIconify
 import pandas as pd
-from services import ir, db  # usa o services/ir.py e db.py do seu projeto
+import plotly.graph_objects as go
+from services import ir, irpf, db  # usa o services/ir.py e db.py do seu projeto
 
 # registre com tema bonito no app principal (app.py):
 # app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX])
@@ -259,6 +260,8 @@ layout = dbc.Container([
                     html.Div(id="resumo-opcao", className="mb-2"),
                     html.H6("DARFs (se houver)"),
                     html.Ul(id="resumo-darfs", className="mb-2"),
+                    html.H6("PGBL x imposto (modelo completo, até 12% da renda)"),
+                    dcc.Graph(id="resumo-pgbl", config={"displayModeBar": False}, style={"height": "260px"}),
                     html.H6("Atalhos úteis"),
                     html.Ul([
                         html.Li("Sicalc (emitir DARF 6015/0190)"),
@@ -324,9 +327,7 @@ def rascunho_rv(n, ano):
     df = ir.consolidar_pf_bolsa_auto(int(ano))
     if df.empty:
         return "Sem trades para importar ou motor desativado."
-    # aqui você pode gravar no banco se quiser
-    for _, row in df.iterrows():
-        ir.upsert_row("pf_rv_mensal", row.to_dict(), key_fields=["ano","mes"])
+    ir.upsert_rows("pf_rv_mensal", df.to_dict("records"), key_fields=["ano","mes"])
     return f"Importado rascunho de {len(df)} mês(es) a partir de trades."
 
 @callback(Output("toast-bd","is_open"), Input("add-bd","n_clicks"),
@@ -349,38 +350,38 @@ def salvar_bd(n, ano, cod, doc, discr, aquis, s_ant, s_ano):
 @callback(Output("resumo-opcao","children"), Output("resumo-darfs","children"), Output("resumo-alertas","children"),
           Input("ano","value"))
 def resumo(ano):
-    # cálculo simplificado: pega fontes pagadoras e pagamentos dedutíveis desse ano
-    f = db.load_table("pf_fontes_pagadoras")
-    p = db.load_table("pf_pagamentos")
-    f = f[f["ano"] == ano] if "ano" in f.columns else f.iloc[0:0]
-    p = p[p["ano"] == ano] if "ano" in p.columns else p.iloc[0:0]
-    rend = float(f["rend_bruto"].sum()) if "rend_bruto" in f else 0.0
-    irrf = float(f["irrf"].sum()) if "irrf" in f else 0.0
-    dedu = float(p["valor"].sum()) if "valor" in p else 0.0
+    # resumo do ano pré-calculado (pf_resumo_anual): uma linha por ano
+    r = ir.resumo_anual(ano) if ano else ir.calcular_resumo(0.0, 0.0, 0.0)
+    rend, irrf, dedu = r["rend_bruto"], r["irrf"], r["deducoes"]
+    recomendado = r["recomendado"]
 
-    # Modelo simplista: completo vs 20% simplificado (limite 16.754,34)
-    desconto_simpl = min(rend*0.20, 16754.34)
-    base_completo = max(0.0, rend - dedu)
-    base_simplif = max(0.0, rend - desconto_simpl)
-    # alíquota marginal simples (apenas indicativa)
-    def faixa(base):
-        if base <= 22859.20: return 0.0
-        elif base <= 33919.80: return 0.075
-        elif base <= 45012.60: return 0.15
-        elif base <= 55976.16: return 0.225
-        return 0.275
-    imp_comp = base_completo * faixa(base_completo) - irrf
-    imp_simp = base_simplif * faixa(base_simplif) - irrf
-    recomendado = "Modelo Completo" if imp_comp < imp_simp else "Modelo Simplificado"
-
-    item_darf = html.Li("Se houver lucro tributável em Bolsa no mês: emitir DARF 6015 até o último dia útil do mês seguinte.")
+    rv = ir.consolidar_pf_bolsa_auto(int(ano)) if ano else pd.DataFrame()
+    itens_darf = [html.Li(ir.resumo_darf_bolsa_pf(m)) for m in rv[rv["darf_6015"] > 0].to_dict("records")] if not rv.empty else []
+    itens_darf = itens_darf or [html.Li("Se houver lucro tributável em Bolsa no mês: emitir DARF 6015 até o último dia útil do mês seguinte.")]
     alertas = dbc.Alert([
         html.Div(f"Rendimentos brutos: R$ {fmt(rend)} | Deduções informadas: R$ {fmt(dedu)}"),
         html.Div(f"IRRF já retido: R$ {fmt(irrf)}"),
         html.Div(f"Sugestão: {recomendado} (estimativa).")
     ], color="warning", className="mb-2")
 
-    return recomendado, [item_darf], alertas
+    return recomendado, itens_darf, alertas
+
+@callback(Output("resumo-pgbl","figure"), Input("ano","value"))
+def curva_pgbl(ano):
+    # todos os aportes avaliados numa chamada vetorizada (services.irpf)
+    r = ir.resumo_anual(ano) if ano else ir.calcular_resumo(0.0, 0.0, 0.0)
+    fig = go.Figure()
+    if r["rend_bruto"] > 0:
+        c = irpf.curva_pgbl(r["rend_bruto"], r["irrf"], r["deducoes"], ano, passos=40)
+        fig.add_scatter(x=c["pgbl"], y=c["economia"], mode="lines", name="Economia",
+                        customdata=c[["imposto", "melhor"]],
+                        hovertemplate="Aporte R$ %{x:,.2f}<br>Economia R$ %{y:,.2f}"
+                                      "<br>Imposto R$ %{customdata[0]:,.2f} (%{customdata[1]})<extra></extra>")
+        if r.get("pgbl"):
+            fig.add_vline(x=min(r["pgbl"], irpf.PGBL_TETO * r["rend_bruto"]), line_dash="dot")
+    fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), xaxis_title="Aporte PGBL no ano (R$)",
+                      yaxis_title="Imposto economizado (R$)", showlegend=False)
+    return fig
 
 # ---------- Utils ----------
 def parse_money(txt):
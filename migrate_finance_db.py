@@ -16,7 +16,7 @@ def normalize_dates_table(con, table, col="Data"):
 
 def main():
     # garante tabelas/colunas e cria índices
-    db.ensure_core_schema()
+    db.ensure_core_schema(forcar=True)
     with db.connect() as con:
         # normalizações simples nas tabelas que têm Data+id
         for t in ("receitas","despesas","investimentos","proventos","trades"):
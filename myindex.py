@@ -2,12 +2,14 @@
 from dash import html, dcc
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
+import os
 import threading
 import webbrowser
 
 from app import app
 # importe seus módulos de páginas/componentes
 from components import sidebar, dashboards, extratos, simulacoes, carteira, ir
+from services.scheduler import start_quote_scheduler
 
 # ===== Layout principal =====
 app.layout = dbc.Container(children=[
@@ -50,6 +52,11 @@ def page(pathname):
         ])
 
 # ===== Boot =====
+DEBUG = True
+
 if __name__ == '__main__':
+    # com debug o reloader executa este bloco duas vezes; o scheduler só sobe no processo que serve
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_quote_scheduler()
     threading.Timer(1.0, lambda: webbrowser.open("http://127.0.0.1:8051")).start()
-    app.run(port=8051, debug=True)
+    app.run(port=8051, debug=DEBUG)
@@ -0,0 +1,116 @@
+# services/anomalias.py
+# Anomalias do fluxo de caixa (receitas/despesas/investimentos) contra o histórico inteiro.
+#
+#   metodo="z"   -> média/desvio por categoria em cat_stats (Welford, mantida por triggers
+#                   no db.py); o teste por linha é uma busca na PK, sem recalcular nada.
+#   metodo="mad" -> escore robusto 0.6745·(x - mediana)/MAD por categoria. Mediana e MAD
+#                   não são incrementais: calculadas uma vez por versão da tabela (cache).
+#
+#   python -m services.anomalias --tabela despesas --metodo mad --limiar 3.5
+#   python -m services.anomalias --rebuild
+from __future__ import annotations
+
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from services import db as _db
+from services.cache import memoize
+
+LIMIAR_Z = 2.0
+LIMIAR_MAD = 3.5
+_MAD_K = 0.6745   # MAD -> desvio padrão sob normalidade
+
+
+def _check(tabela: str) -> None:
+    if tabela not in _db._FLUXO_TABLES:
+        raise ValueError(f"tabela inválida: {tabela}")
+
+
+def stats(tabela: str) -> pd.DataFrame:
+    """cat_stats da tabela: Categoria, n, media, desvio (amostral)."""
+    _check(tabela)
+    _db._ensure_schema()
+    with _db.connect() as con:
+        df = pd.read_sql_query("SELECT cat AS Categoria, n, media, m2 FROM cat_stats WHERE tabela = ? ORDER BY cat",
+                               con, params=(tabela,))
+    df["desvio"] = np.sqrt(np.where(df["n"] > 1, df["m2"] / (df["n"] - 1).clip(lower=1), 0.0))
+    return df.drop(columns=["m2"])
+
+
+@memoize("receitas", "despesas", "investimentos", maxsize=3)
+def _mad_stats(tabela: str) -> pd.DataFrame:
+    df = _db.load_table(tabela)
+    if df.empty:
+        return pd.DataFrame(columns=["Categoria", "mediana", "mad"])
+    v = pd.DataFrame({"Categoria": df["Categoria"].fillna("").astype(str),
+                      "Valor": pd.to_numeric(df["Valor"], errors="coerce").fillna(0.0)})
+    med = v.groupby("Categoria")["Valor"].median()
+    mad = (v["Valor"] - v["Categoria"].map(med)).abs().groupby(v["Categoria"]).median()
+    return pd.DataFrame({"mediana": med, "mad": mad}).reset_index()
+
+
+def score(df: pd.DataFrame, tabela: str, metodo: str = "z") -> pd.Series:
+    """Escore por linha (vetorizado). NaN quando a categoria não tem dispersão."""
+    _check(tabela)
+    if df.empty:
+        return pd.Series(dtype="float64", index=df.index)
+    cat = df["Categoria"].astype(str).where(df["Categoria"].notna(), "")   # aceita Categorical
+    x = pd.to_numeric(df["Valor"], errors="coerce").fillna(0.0)
+    if metodo == "mad":
+        s = _mad_stats(tabela).set_index("Categoria")
+        mad = cat.map(s["mad"]).replace(0, np.nan)
+        return _MAD_K * (x - cat.map(s["mediana"])) / mad
+    s = stats(tabela).set_index("Categoria")
+    desvio = cat.map(s["desvio"]).replace(0, np.nan)
+    return (x - cat.map(s["media"])) / desvio
+
+
+def anomalias(tabela: str, metodo: str = "z", limiar: Optional[float] = None,
+              start=None, end=None) -> pd.DataFrame:
+    """Lançamentos anômalos (|escore| >= limiar), com a coluna 'Escore'."""
+    _check(tabela)
+    limiar = float(limiar if limiar is not None else (LIMIAR_MAD if metodo == "mad" else LIMIAR_Z))
+    if metodo == "z":
+        # filtro inteiro no SQLite: só as linhas marcadas saem do banco
+        _db._ensure_schema()
+        with _db.connect() as con:
+            where, params, _ = _db._fluxo_where(con, tabela, start, end)
+            flag = _db.anomalia_sql(tabela, f'"{tabela}"', limiar)
+            w = f"{where} AND {flag} <> ''" if where else f" WHERE {flag} <> ''"
+            df = _db._read_df(con, f'SELECT * FROM "{tabela}"{w} ORDER BY "Data" DESC, id DESC', params)
+    else:
+        df = _db.load_table(tabela)
+        if not df.empty and (start or end):
+            d = pd.to_datetime(df["Data"], errors="coerce")
+            if start: df = df[d >= pd.to_datetime(start).normalize()]
+            if end: df = df[d <= pd.to_datetime(end).normalize()]
+    if df.empty:
+        return df.assign(Escore=pd.Series(dtype="float64"))
+    df = df.assign(Escore=score(df, tabela, metodo).round(2))
+    if metodo != "z":
+        df = df[df["Escore"].abs() >= limiar].sort_values(["Data", "id"], ascending=False)
+    return df.reset_index(drop=True)
+
+
+def rebuild() -> None:
+    """Recalcula cat_stats do zero (após importações grandes ou para corrigir deriva numérica)."""
+    _db._ensure_schema()
+    with _db.connect() as con:
+        _db.rebuild_cat_stats(con)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Anomalias do fluxo de caixa (banco em FINANCE_DB).")
+    ap.add_argument("--tabela", default="despesas", choices=sorted(_db._FLUXO_TABLES))
+    ap.add_argument("--metodo", default="z", choices=["z", "mad"])
+    ap.add_argument("--limiar", type=float)
+    ap.add_argument("--rebuild", action="store_true", help="recalcula cat_stats antes de consultar")
+    args = ap.parse_args()
+    if args.rebuild:
+        rebuild()
+    out = anomalias(args.tabela, args.metodo, args.limiar)
+    cols = [c for c in ("id", "Data", "Categoria", "Descrição", "Valor", "Escore") if c in out.columns]
+    print(out[cols].to_string(index=False) if not out.empty else "Nenhuma anomalia.")
@@ -0,0 +1,310 @@
+# services/backfill_precos.py
+# Backfill de histórico diário no store de cotações (services/quotes.py).
+#
+#   python -m services.backfill_precos --db finance.db                 # yfinance, fallback Stooq
+#   python -m services.backfill_precos --db finance.db --provider stooq
+#   python -m services.backfill_precos --db finance.db --provider fixture --fixture-dir ./fixtures
+#
+# 1) calcula os períodos em que cada ativo esteve em carteira (a partir de 'trades'; aceita o
+#    schema do app — Data/Ticker/Tipo/Qtd — e o da carteira — data/ativo_id/tipo/quantidade);
+# 2) compara com as datas já presentes em 'quotes' e monta os buracos (dias úteis);
+# 3) pede o histórico diário de cada ticker UMA vez ao provedor e grava em lotes.
+from __future__ import annotations
+
+import argparse, csv, datetime as dt, sqlite3, unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
+
+import requests
+
+from services import cache, quotes
+from services.sync_precos_direct import TODAY, brl
+
+B3_CLASSES = {"ACAO", "ETF", "FII", "BDR"}
+
+# ======== Provedores de histórico ========
+class HistoryProvider(Protocol):
+    """Qualquer objeto com .name e .history(ticker, start, end) -> iterável de (date, close em BRL)."""
+    name: str
+
+    def history(self, ticker: str, start: dt.date, end: dt.date) -> Iterable[Tuple[dt.date, float]]: ...
+
+
+class YFinanceHistory:
+    name = "yfinance"
+
+    def history(self, ticker: str, start: dt.date, end: dt.date) -> Iterator[Tuple[dt.date, float]]:
+        import yfinance as yf
+        sym = ticker.upper() if ticker.upper().endswith(".SA") else f"{ticker.upper()}.SA"
+        # 'end' do yfinance é exclusivo
+        h = yf.Ticker(sym).history(start=start.isoformat(), end=(end + dt.timedelta(days=1)).isoformat(),
+                                   interval="1d", auto_adjust=False)
+        if h is None or h.empty:
+            return
+        for idx, close in h["Close"].items():
+            if close == close:  # descarta NaN
+                yield idx.date(), brl(close)
+
+
+class StooqHistory:
+    name = "stooq"
+
+    def history(self, ticker: str, start: dt.date, end: dt.date) -> Iterator[Tuple[dt.date, float]]:
+        s = ticker.lower() if ticker.lower().endswith(".sa") else f"{ticker.lower()}.sa"
+        url = (f"https://stooq.com/q/d/l/?s={s}&i=d"
+               f"&d1={start.strftime('%Y%m%d')}&d2={end.strftime('%Y%m%d')}")
+        with requests.get(url, timeout=30, stream=True) as r:
+            r.raise_for_status()
+            yield from _parse_ohlc_csv(r.iter_lines(decode_unicode=True), start, end)
+
+
+class CsvFixtureProvider:
+    """Lê <dir>/<TICKER>.csv no formato do Stooq (Date,...,Close). Usado em testes/offline."""
+    name = "fixture"
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+
+    def history(self, ticker: str, start: dt.date, end: dt.date) -> Iterator[Tuple[dt.date, float]]:
+        path = self.directory / f"{ticker.upper()}.csv"
+        if not path.exists():
+            return
+        with path.open(newline="", encoding="utf-8") as fh:
+            yield from _parse_ohlc_csv(fh, start, end)
+
+
+class FallbackHistory:
+    """Tenta cada provedor em ordem; usa o primeiro que devolver dados."""
+
+    def __init__(self, providers: List[HistoryProvider]):
+        self.providers = providers
+        self.name = "+".join(p.name for p in providers)
+
+    def history(self, ticker: str, start: dt.date, end: dt.date) -> Iterator[Tuple[dt.date, float]]:
+        for p in self.providers:
+            try:
+                rows = list(p.history(ticker, start, end))
+            except Exception:
+                continue
+            if rows:
+                yield from rows
+                return
+
+
+def _parse_ohlc_csv(lines: Iterable[str], start: dt.date, end: dt.date) -> Iterator[Tuple[dt.date, float]]:
+    reader = csv.reader(l for l in lines if l)
+    header = next(reader, None)
+    if not header or "Close" not in header:
+        return
+    i_date, i_close = header.index("Date"), header.index("Close")
+    for row in reader:
+        try:
+            d = dt.date.fromisoformat(row[i_date]); px = float(row[i_close])
+        except (ValueError, IndexError):
+            continue
+        if start <= d <= end:
+            yield d, brl(px)
+
+
+def make_provider(name: str, fixture_dir: Optional[str] = None) -> HistoryProvider:
+    if name == "fixture":
+        if not fixture_dir:
+            raise SystemExit("--fixture-dir é obrigatório com --provider fixture")
+        return CsvFixtureProvider(fixture_dir)
+    if name == "stooq":
+        return StooqHistory()
+    if name == "yfinance":
+        return YFinanceHistory()
+    return FallbackHistory([YFinanceHistory(), StooqHistory()])
+
+# ======== Detecção de buracos ========
+@dataclass
+class Gap:
+    ativo_id: Optional[int]      # None no schema do app (trades por Ticker)
+    ticker: str
+    ranges: List[Tuple[dt.date, dt.date]] = field(default_factory=list)
+
+    @property
+    def start(self) -> dt.date:
+        return self.ranges[0][0]
+
+    @property
+    def end(self) -> dt.date:
+        return self.ranges[-1][1]
+
+    def contains(self, d: dt.date) -> bool:
+        return any(a <= d <= b for a, b in self.ranges)
+
+    @property
+    def dias(self) -> int:
+        return sum(len(_business_days(a, b)) for a, b in self.ranges)
+
+
+def _business_days(start: dt.date, end: dt.date) -> List[dt.date]:
+    out, d = [], start
+    while d <= end:
+        if d.weekday() < 5:
+            out.append(d)
+        d += dt.timedelta(days=1)
+    return out
+
+
+def _colunas(conn: sqlite3.Connection, table: str) -> Dict[str, str]:
+    """nome em minúsculas -> nome real (os dois schemas diferem só na caixa em Data/Tipo/Ticker)."""
+    return {str(r[1]).lower(): str(r[1]) for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _classe(c: Optional[str]) -> str:
+    c = unicodedata.normalize("NFKD", str(c or "ACAO"))
+    return "".join(ch for ch in c if not unicodedata.combining(ch)).strip().upper()
+
+
+def held_periods(conn: sqlite3.Connection, as_of: dt.date = TODAY) -> Dict[object, List[Tuple[dt.date, dt.date]]]:
+    """
+    ativo -> [(início, fim)] em que a posição acumulada esteve > 0.
+    A chave é ativo_id (schema da carteira) ou o Ticker em maiúsculas (schema do app).
+    """
+    cols = _colunas(conn, "trades")
+    if not cols:
+        return {}
+    if "ativo_id" in cols:
+        chave = '"ativo_id"'
+    elif "ticker" in cols:
+        chave = f'UPPER(TRIM("{cols["ticker"]}"))'
+    else:
+        return {}
+    qtd = "COALESCE(" + ", ".join(f'"{cols[c]}"' for c in ("qtd", "quantidade") if c in cols) + ", 0)"
+    tipo, data = cols["tipo"], cols["data"]
+    rows = conn.execute(f"""
+        SELECT {chave} AS k, date("{data}") AS d,
+               SUM(CASE WHEN UPPER("{tipo}")='V' THEN -{qtd} ELSE {qtd} END) AS q
+          FROM trades
+         WHERE {chave} IS NOT NULL AND date("{data}") IS NOT NULL
+         GROUP BY k, d
+         ORDER BY k, d
+    """).fetchall()
+    out: Dict[object, List[Tuple[dt.date, dt.date]]] = {}
+    pos: Dict[object, float] = {}
+    open_at: Dict[object, dt.date] = {}
+    for k, d_iso, q in rows:
+        d = dt.date.fromisoformat(d_iso)
+        before = pos.get(k, 0.0)
+        after = before + float(q or 0.0)
+        pos[k] = after
+        if before <= 1e-9 < after:
+            open_at[k] = d
+        elif after <= 1e-9 < before and k in open_at:
+            out.setdefault(k, []).append((open_at.pop(k), d))
+    for k, d in open_at.items():
+        out.setdefault(k, []).append((d, as_of))
+    return out
+
+
+def _cadastro(conn: sqlite3.Connection) -> Dict[object, Tuple[str, str]]:
+    """ativo_id ou Ticker -> (ticker, classe normalizada) a partir de 'ativos', se existir."""
+    cols = _colunas(conn, "ativos")
+    if "ticker" not in cols:
+        return {}
+    classe = f'"{cols["classe"]}"' if "classe" in cols else "NULL"
+    chave = '"id"' if "id" in cols else f'UPPER(TRIM("{cols["ticker"]}"))'
+    return {k: (str(t).upper(), _classe(cl)) for k, t, cl in conn.execute(
+        f'SELECT {chave}, UPPER(TRIM("{cols["ticker"]}")), {classe} FROM ativos')}
+
+
+def detect_gaps(conn: sqlite3.Connection, as_of: dt.date = TODAY, min_gap: int = 3) -> List[Gap]:
+    """
+    Buracos = dias úteis dentro dos períodos em carteira sem cotação em 'quotes'.
+    Buracos com menos de 'min_gap' dias úteis seguidos são ignorados (feriados).
+    """
+    periods = held_periods(conn, as_of)
+    if not periods:
+        return []
+    quotes.ensure_quote_schema(conn)
+    cadastro = _cadastro(conn)
+
+    gaps: List[Gap] = []
+    for k, spans in periods.items():
+        if isinstance(k, str):                 # schema do app: sem cadastro, assume ação da B3
+            ticker, classe = cadastro.get(k, (k, "ACAO"))
+        else:
+            ticker, classe = cadastro.get(k, (None, None))
+        if not ticker or classe not in B3_CLASSES:
+            continue
+        lo, hi = spans[0][0], spans[-1][1]
+        have = {quotes.date_of(d) for d in quotes.quote_days(conn, ticker, lo, hi)}
+        gap = Gap(None if isinstance(k, str) else k, ticker)
+        for a, b in spans:
+            seq: List[dt.date] = []
+            for d in _business_days(a, b) + [None]:
+                if d is not None and d not in have:
+                    seq.append(d); continue
+                if len(seq) >= min_gap:
+                    gap.ranges.append((seq[0], seq[-1]))
+                seq = []
+        if gap.ranges:
+            gaps.append(gap)
+    return gaps
+
+# ======== Execução ========
+def backfill(conn: sqlite3.Connection, provider: HistoryProvider, as_of: dt.date = TODAY,
+             min_gap: int = 3, chunk_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """Busca o histórico de cada ticker com buraco e grava só os dias faltantes, em lotes de chunk_size."""
+    gaps = detect_gaps(conn, as_of, min_gap)
+    gravados: Dict[str, int] = {}
+    for gap in gaps:
+        if dry_run:
+            gravados[gap.ticker] = 0
+            continue
+        buf: List[Tuple[str, dt.date, float, str]] = []
+        n = 0
+        try:
+            for d, px in provider.history(gap.ticker, gap.start, gap.end):
+                if not gap.contains(d):
+                    continue
+                buf.append((gap.ticker, d, px, provider.name))
+                if len(buf) >= chunk_size:
+                    with conn:
+                        n += quotes.upsert_quotes(conn, buf)
+                        cache.marcar(conn, *cache.PRICE_TAGS)
+                    buf = []
+        except Exception as e:
+            print(f"  ! {gap.ticker}: {e}")
+        if buf:
+            with conn:
+                n += quotes.upsert_quotes(conn, buf)
+                cache.marcar(conn, *cache.PRICE_TAGS)
+        gravados[gap.ticker] = n
+    return gravados
+
+
+def run(db_path: str, provider: HistoryProvider, min_gap: int = 3, chunk_size: int = 500, dry_run: bool = False):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA foreign_keys=ON;")
+        gaps = detect_gaps(conn, TODAY, min_gap)
+        if not gaps:
+            print("Nenhum buraco de preços nos períodos em carteira.")
+            return
+        print(f"Buracos encontrados ({provider.name}):")
+        for g in gaps:
+            print(f"  - {g.ticker}: {g.dias} dia(s) úteis em {len(g.ranges)} intervalo(s), {g.start} → {g.end}")
+        res = backfill(conn, provider, TODAY, min_gap, chunk_size, dry_run)
+    finally:
+        conn.close()
+    if not dry_run:
+        print("\nGravados (ticker: dias):")
+        for t, n in res.items():
+            print(f"  - {t}: {n}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Backfill de preços diários nos períodos em carteira.")
+    ap.add_argument("--db", required=True)
+    ap.add_argument("--provider", choices=["auto", "yfinance", "stooq", "fixture"], default="auto")
+    ap.add_argument("--fixture-dir", help="pasta com <TICKER>.csv (para --provider fixture)")
+    ap.add_argument("--min-gap", type=int, default=3, help="ignora buracos menores que N dias úteis (feriados)")
+    ap.add_argument("--chunk", type=int, default=500, help="linhas por transação")
+    ap.add_argument("--dry-run", action="store_true", help="só lista os buracos")
+    args = ap.parse_args()
+    run(args.db, make_provider(args.provider, args.fixture_dir), args.min_gap, args.chunk, args.dry_run)
@@ -0,0 +1,134 @@
+# services/cache.py
+# Cache em memória com invalidação por tag (nome de tabela/dataset).
+#
+#   @memoize("trades", "precos")
+#   def calcula(...): ...
+#
+#   bump("precos")   # invalida só o que depende de 'precos'
+#
+# Cada tag tem um contador de versão; a chave do cache inclui as versões das
+# tags declaradas, então um bump torna as entradas antigas inalcançáveis (e o
+# LRU as descarta). Thread-safe: o scheduler de cotações chama bump() fora da
+# thread dos callbacks.
+#
+# Escritas de outros processos (CLIs: importer, backfill_precos, sync_precos_direct...)
+# não passam por bump(): o escritor chama marcar(con, tags) uma vez por transação (db.connect
+# faz isso sozinho) e a versão de uma tag é a local + a de cache_versao no banco. Uma conexão
+# só leitura consulta PRAGMA data_version (~3 µs) a cada busca e relê cache_versao só quando
+# outra conexão fez commit; commit sem marcar() (nem o marcador '*' mudou) invalida tudo.
+from __future__ import annotations
+
+import functools
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = defaultdict(int)
+_db_versions: Dict[str, int] = {}
+_banco: Optional[str] = None
+_con: Optional[sqlite3.Connection] = None
+_data_version: Optional[int] = None
+_epoca = 0          # somada a todas as tags: escrita de fora sem marcar(), tag desconhecida
+
+MARCA = "*"         # linha de cache_versao tocada por toda transação marcada
+
+# tags alimentadas pelas rotinas de cotação (store 'quotes', dataset lógico "precos")
+PRICE_TAGS: Tuple[str, ...] = ("precos",)
+
+
+def observar(path) -> None:
+    """Liga as versões do banco em 'path' (db.py chama no import)."""
+    global _banco, _con, _data_version
+    with _lock:
+        if _con is not None:
+            _con.close()
+        _banco, _con, _data_version = str(Path(path).absolute()), None, None
+        _db_versions.clear()
+
+
+def marcar(con: sqlite3.Connection, *tags: str) -> None:
+    """
+    Soma 1 em cache_versao para as tags (e para MARCA) na transação aberta de 'con':
+    um UPDATE por tag e transação, não por linha. Sem a tabela (banco antigo), não faz nada.
+    """
+    try:
+        con.executemany("UPDATE cache_versao SET versao = versao + 1 WHERE tag = ?",
+                        [(t,) for t in dict.fromkeys((MARCA,) + tags)])
+    except sqlite3.OperationalError:
+        pass
+
+
+def _sincronizar() -> None:
+    # chamado com _lock; falhas (banco ainda inexistente, sem cache_versao) = versões 0
+    global _con, _data_version, _epoca
+    if _banco is None:
+        return
+    try:
+        if _con is None:
+            _con = sqlite3.connect(Path(_banco).as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+        dv = _con.execute("PRAGMA data_version").fetchone()[0]
+        if dv == _data_version:
+            return
+        primeira = _data_version is None
+        _data_version = dv
+        novas = dict(_con.execute("SELECT tag, versao FROM cache_versao").fetchall())
+        if not primeira and novas == _db_versions:
+            _epoca += 1     # alguém fez commit sem marcar(): não dá para saber o que mudou
+        _db_versions.clear()
+        _db_versions.update(novas)
+    except sqlite3.Error:
+        if _con is not None and _data_version is None:
+            _con.close()
+            _con = None
+
+
+def version(tag: str) -> int:
+    with _lock:
+        _sincronizar()
+        return _versions[tag] + _db_versions.get(tag, 0) + _epoca
+
+
+def versions(*tags: str) -> Tuple[int, ...]:
+    with _lock:
+        _sincronizar()
+        return tuple(_versions[t] + _db_versions.get(t, 0) + _epoca for t in tags)
+
+
+def bump(*tags: str) -> None:
+    """Marca as tags como alteradas (invalida os caches que dependem delas)."""
+    with _lock:
+        for t in tags:
+            _versions[t] += 1
+
+
+def memoize(*tags: str, maxsize: int = 32) -> Callable:
+    """LRU por (argumentos, versões das tags). Os argumentos precisam ser hasheáveis."""
+    def deco(fn: Callable) -> Callable:
+        entries: "OrderedDict[tuple, object]" = OrderedDict()
+        fn_lock = threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (versions(*tags), args, tuple(sorted(kwargs.items())))
+            with fn_lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                    return entries[key]
+            val = fn(*args, **kwargs)
+            with fn_lock:
+                entries[key] = val
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return val
+
+        def cache_clear() -> None:
+            with fn_lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        wrapper.tags = tags
+        return wrapper
+    return deco
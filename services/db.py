@@ -1,35 +1,290 @@
 # services/db.py
 from __future__ import annotations
 
+import atexit
+import contextlib
+import itertools
 import os
+import re
 import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from collections import deque
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Any, Dict, Iterable, Sequence, Union
 
 import pandas as pd
 
+from services import cache, quotes
+
 # ============================================================
 # Caminho do banco
 # ============================================================
 _DB_ENV = os.environ.get("FINANCE_DB", "").strip()
 DB_PATH = Path(_DB_ENV) if _DB_ENV else Path("finance.db").absolute()
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+cache.observar(DB_PATH)
+
+# ============================================================
+# Tracing de SQL (tudo que passa por connect())
+#   SQL_TRACE guarda as últimas execuções: sql, forma dos parâmetros, linhas, ms e origem.
+#   Acima de SQL_LENTO_MS a execução vai para a tabela sql_lento com o EXPLAIN QUERY PLAN:
+#   ao fechar a conexão os registros entram numa fila, gravada por uma thread com conexão
+#   própria (nunca na conexão/transação do chamador; caminhos só de leitura não escrevem).
+#   FINANCE_SQL_TRACE=0 desliga; FINANCE_SQL_LENTO_MS ajusta o limite (padrão 100 ms).
+# ============================================================
+_TRACE_ATIVO = os.environ.get("FINANCE_SQL_TRACE", "1").strip().lower() not in ("0", "false", "no")
+SQL_LENTO_MS = float(os.environ.get("FINANCE_SQL_LENTO_MS", "100") or 100)
+SQL_TRACE: deque = deque(maxlen=2000)
+
+DDL_SQL_LENTO = """
+CREATE TABLE IF NOT EXISTS sql_lento (
+  id      INTEGER PRIMARY KEY AUTOINCREMENT,
+  quando  TEXT NOT NULL DEFAULT (datetime('now')),
+  ms      REAL,
+  linhas  INTEGER,
+  sql     TEXT,
+  params  TEXT,
+  origem  TEXT,
+  plano   TEXT
+);
+"""
+
+_LIBS = tuple(os.path.dirname(m.__file__) for m in (sqlite3, pd, contextlib))
+_EXPLICAVEL = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+_RE_INDICE = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING (INTEGER PRIMARY KEY)|SCAN (\w+)")
+
+def _origem() -> str:
+    # primeiros dois frames fora de sqlite3/pandas/contextlib e do próprio tracing
+    f, achados = sys._getframe(2), []
+    while f is not None and len(achados) < 2:
+        nome = f.f_code.co_filename
+        if not nome.startswith(_LIBS) and not (nome == __file__ and f.f_code.co_name in _TRACE_FUNCS):
+            achados.append(f"{os.path.basename(nome)}:{f.f_lineno} {f.f_code.co_name}")
+        f = f.f_back
+    return " <- ".join(achados) or "?"
+
+def _forma(params, many: bool = False) -> str:
+    if many:
+        return f"{len(params)} lotes" if hasattr(params, "__len__") else "lotes"
+    if not params:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ",".join(map(str, params)) + "}"
+    return f"{len(params)} posicionais"
+
+def explicar(con: sqlite3.Connection, sql: str, params=()) -> list[str]:
+    """EXPLAIN QUERY PLAN (uma linha por nó, recuada pela profundidade). [] se não aplicável."""
+    if not sql.lstrip().upper().startswith(_EXPLICAVEL):
+        return []
+    try:
+        rows = sqlite3.Cursor(con).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return []
+    nivel, out = {0: 0}, []
+    for id_, pai, _, det in rows:
+        nivel[id_] = nivel.get(pai, 0) + 1
+        out.append("  " * (nivel[id_] - 1) + str(det))
+    return out
+
+_VAZIO = object()
+
+class _TraceCursor(sqlite3.Cursor):
+    _reg = None
+
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        cur = super().execute(sql, params)
+        self._registrar(sql, params, _forma(params), t0)
+        return cur
+
+    def executemany(self, sql, seq):
+        if hasattr(seq, "__len__"):
+            primeiro = seq[0] if len(seq) else ()
+        else:
+            # iterador/gerador: só o primeiro item é espiado (para o plano); o resto segue em streaming
+            it = iter(seq)
+            primeiro = next(it, _VAZIO)
+            seq = () if primeiro is _VAZIO else itertools.chain((primeiro,), it)
+            primeiro = () if primeiro is _VAZIO else primeiro
+        t0 = time.perf_counter()
+        cur = super().executemany(sql, seq)
+        self._registrar(sql, primeiro, _forma(seq, True), t0)
+        return cur
+
+    def executescript(self, script):
+        t0 = time.perf_counter()
+        cur = super().executescript(script)
+        self._registrar(script, (), "script", t0, plano=False)
+        return cur
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._buscou(row is not None, t0)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._buscou(len(rows), t0)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._buscou(len(rows), t0)
+        return rows
+
+    def _registrar(self, sql, params, forma, t0, plano=True):
+        r = {"sql": sql, "params": forma, "linhas": self.rowcount if self.rowcount >= 0 else None,
+             "ms": (time.perf_counter() - t0) * 1000.0, "origem": _origem(), "quando": time.time()}
+        SQL_TRACE.append(r)
+        self._reg = (r, params if plano else None)
+        self._checar_lento()
+
+    def _buscou(self, n, t0):
+        if self._reg is not None:
+            r = self._reg[0]
+            r["linhas"] = (r["linhas"] or 0) + int(n)
+            r["ms"] += (time.perf_counter() - t0) * 1000.0
+            self._checar_lento()
+
+    def _checar_lento(self):
+        r, params = self._reg
+        if r["ms"] < SQL_LENTO_MS or r.get("lento"):
+            return
+        r["lento"] = True
+        r["plano"] = "\n".join(explicar(self.connection, r["sql"], params)) if params is not None else ""
+        r["valores"] = repr(params)[:500] if params else ""
+        self.connection._lentos.append(r)     # mesmo dict: linhas/ms de fetches posteriores entram no log
+
+class TracingConnection(sqlite3.Connection):
+    """sqlite3.Connection cujo cursor() (e logo execute/executemany/pandas) passa pelo tracing."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lentos: list[dict] = []
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _TraceCursor)
+
+    # os atalhos da Connection criam o cursor em C, sem passar por cursor()
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+_TRACE_FUNCS = {n for n, v in vars(_TraceCursor).items() if callable(v)} | {"_origem", "cursor"}
+
+_LENTOS_FILA: deque = deque(maxlen=1000)
+_lentos_lock = threading.Lock()
+_lentos_evento = threading.Event()
+_lentos_thread: threading.Thread | None = None
+_lentos_ddl_ok = False
+
+def _gravar_lentos(con: sqlite3.Connection) -> None:
+    """Enfileira os lentos da conexão que está fechando; a gravação fica com a thread escritora."""
+    global _lentos_thread
+    lentos = getattr(con, "_lentos", None)
+    if not lentos:
+        return
+    _LENTOS_FILA.extend(lentos)
+    lentos.clear()
+    with _lentos_lock:
+        if _lentos_thread is None:
+            _lentos_thread = threading.Thread(target=_escritor_lentos, name="sql-lento", daemon=True)
+            _lentos_thread.start()
+    _lentos_evento.set()
+
+def gravar_lentos_pendentes() -> int:
+    """Grava a fila de sql_lento numa conexão própria (best-effort). Retorna quantos gravou."""
+    global _lentos_ddl_ok
+    with _lentos_lock:
+        regs = [_LENTOS_FILA.popleft() for _ in range(len(_LENTOS_FILA))]
+        if not regs:
+            return 0
+        try:
+            con = sqlite3.connect(DB_PATH, timeout=5)
+            try:
+                if not _lentos_ddl_ok:
+                    con.executescript(DDL_SQL_LENTO)
+                    _lentos_ddl_ok = True
+                with con:
+                    cache.marcar(con)       # só o marcador: sql_lento não alimenta nenhum cache
+                    con.executemany(
+                        "INSERT INTO sql_lento(ms, linhas, sql, params, origem, plano) VALUES (?,?,?,?,?,?)",
+                        [(round(r["ms"], 3), r["linhas"], r["sql"], f'{r["params"]} {r["valores"]}'.strip(),
+                          r["origem"], r["plano"]) for r in regs])
+            finally:
+                con.close()
+        except sqlite3.Error:
+            return 0    # log é best-effort (banco somente leitura, travado etc.)
+        return len(regs)
+
+def _escritor_lentos() -> None:
+    while True:
+        _lentos_evento.wait()
+        time.sleep(1.0)         # junta as rajadas de um callback numa transação só
+        _lentos_evento.clear()
+        gravar_lentos_pendentes()
+
+atexit.register(gravar_lentos_pendentes)
+
+def sql_resumo(top: int = 20) -> pd.DataFrame:
+    """Agrega SQL_TRACE por texto: chamadas, ms total/máx, linhas e a origem mais recente."""
+    df = pd.DataFrame(list(SQL_TRACE))
+    if df.empty:
+        return df
+    df["sql"] = df["sql"].str.split().str.join(" ").str.slice(0, 200)
+    g = df.groupby("sql", sort=False).agg(chamadas=("ms", "size"), ms_total=("ms", "sum"),
+                                           ms_max=("ms", "max"), linhas=("linhas", "sum"),
+                                           origem=("origem", "last"))
+    return g.sort_values("ms_total", ascending=False).head(top).reset_index()
+
+def uso_indices() -> pd.DataFrame:
+    """Índices (e SCANs completos) citados nos planos de sql_lento, com contagem."""
+    gravar_lentos_pendentes()
+    with connect() as con:
+        try:
+            planos = [r[0] for r in sqlite3.Cursor(con).execute("SELECT plano FROM sql_lento WHERE plano <> ''")]
+        except sqlite3.Error:
+            planos = []
+    achados = [m.group(1) or m.group(2) or f"SCAN {m.group(3)}" for p in planos for m in _RE_INDICE.finditer(p)]
+    return pd.Series(achados, dtype=object).value_counts().rename_axis("uso").reset_index(name="planos")
 
 # ============================================================
 # Conexão e utilitários
 # ============================================================
+def texto_busca(s) -> str:
+    """Normalização da busca por descrição: sem acento e casefold ('ÁGUA' -> 'agua')."""
+    if s is None:
+        return ""
+    return "".join(c for c in unicodedata.normalize("NFKD", str(s)) if not unicodedata.combining(c)).casefold()
+
 @contextmanager
 def connect() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH)
+    con = sqlite3.connect(DB_PATH, factory=TracingConnection if _TRACE_ATIVO else sqlite3.Connection)
     try:
         con.execute("PRAGMA foreign_keys=ON;")
+        # busca_norm(x): mesma normalização da busca em pandas (views.apply_extra_filters)
+        con.create_function("busca_norm", 1, texto_busca, deterministic=True)
+        escritas = _rastrear_escritas(con)
         yield con
+        if escritas:
+            cache.marcar(con, *tags_escritas(escritas))
         con.commit()
     except Exception:
         con.rollback()
         raise
     finally:
+        _gravar_lentos(con)
         con.close()
 
 def _read_df(con: sqlite3.Connection, query: str, params: Union[Sequence, Dict, None] = None) -> pd.DataFrame:
@@ -89,7 +344,9 @@ def insert_row(table: str, payload: dict) -> int:
     binds = ", ".join([f':{k}' for k in payload.keys()])
     with connect() as con:
         cur = con.execute(f'INSERT INTO "{table}" ({keys}) VALUES ({binds})', payload)
-        return int(cur.lastrowid)
+        new_id = int(cur.lastrowid)
+    cache.bump(table)
+    return new_id
 
 def delete_rows(table: str, ids: list[int]) -> None:
     if not ids:
@@ -123,6 +380,22 @@ def _coerce_fluxo(df: pd.DataFrame) -> pd.DataFrame:
             d[c] = d[c].astype(str)
     return d
 
+def _coerce_fluxo_payload(payload: dict) -> dict:
+    """Mesma normalização de _coerce_fluxo, mas só nas chaves presentes (edições parciais)."""
+    p = dict(payload)
+    if p.get("Data") is not None:
+        p["Data"] = pd.to_datetime(p["Data"], errors="coerce").strftime("%Y-%m-%d")
+    if "Valor" in p:
+        v = pd.to_numeric(p["Valor"], errors="coerce")
+        p["Valor"] = 0.0 if pd.isna(v) else float(v)
+    for c in ("Categoria","Descrição"):
+        if c in p:
+            p[c] = str(p[c])
+    return p
+
+def update_fluxo_rows(table: str, changes: Iterable[tuple[int, dict]]) -> pd.DataFrame:
+    return update_rows(table, [(rid, _coerce_fluxo_payload(p)) for rid, p in changes])
+
 # Receitas
 def load_receitas() -> pd.DataFrame:
     df = load_table("receitas")
@@ -137,8 +410,11 @@ def append_receitas(df: pd.DataFrame) -> None:
 def update_receita_row(row_id: int, payload: dict) -> None:
     update_row("receitas", row_id, _coerce_fluxo(pd.DataFrame([payload])).iloc[0].to_dict())
 
-def delete_receitas(ids: list[int]) -> None:
-    delete_rows("receitas", ids)
+def update_receitas_rows(changes: Iterable[tuple[int, dict]]) -> pd.DataFrame:
+    return update_fluxo_rows("receitas", changes)
+
+def delete_receitas(ids: list[int]) -> list[int]:
+    return delete_rows("receitas", ids)
 
 # Despesas
 def load_despesas() -> pd.DataFrame:
@@ -154,8 +430,11 @@ def append_despesas(df: pd.DataFrame) -> None:
 def update_despesa_row(row_id: int, payload: dict) -> None:
     update_row("despesas", row_id, _coerce_fluxo(pd.DataFrame([payload])).iloc[0].to_dict())
 
-def delete_despesas(ids: list[int]) -> None:
-    delete_rows("despesas", ids)
+def update_despesas_rows(changes: Iterable[tuple[int, dict]]) -> pd.DataFrame:
+    return update_fluxo_rows("despesas", changes)
+
+def delete_despesas(ids: list[int]) -> list[int]:
+    return delete_rows("despesas", ids)
 
 # Investimentos (fluxo, não “trades”)
 def load_investimentos() -> pd.DataFrame:
@@ -171,8 +450,11 @@ def append_investimentos(df: pd.DataFrame) -> None:
 def update_invest_row(row_id: int, payload: dict) -> None:
     update_row("investimentos", row_id, _coerce_fluxo(pd.DataFrame([payload])).iloc[0].to_dict())
 
-def delete_investimentos(ids: list[int]) -> None:
-    delete_rows("investimentos", ids)
+def update_investimentos_rows(changes: Iterable[tuple[int, dict]]) -> pd.DataFrame:
+    return update_fluxo_rows("investimentos", changes)
+
+def delete_investimentos(ids: list[int]) -> list[int]:
+    return delete_rows("investimentos", ids)
 
 # ------------ ÍNDICES para performance ------------
 def _create_indexes(con: sqlite3.Connection) -> None:
@@ -298,6 +580,11 @@ CREATE TABLE IF NOT EXISTS portfolio_daily(
   PM REAL,
   PnL REAL,
   Aporte REAL,
+  -- série da carteira gravada por performance.compute_metrics (save_portfolio_daily)
+  vm_total REAL,
+  aportes REAL,
+  retiradas REAL,
+  proventos REAL,
   PRIMARY KEY (Data, Ticker)
 );
 """
@@ -308,7 +595,13 @@ CREATE TABLE IF NOT EXISTS portfolio_daily(
 #   - adiciona colunas que não existirem
 #   - cria índices somente se as colunas existirem
 # ============================================================
-def ensure_core_schema() -> None:
+_schema_ok = False
+
+def ensure_core_schema(forcar: bool = False) -> None:
+    """Cria/migra o schema (uma vez por processo; forcar=True refaz as checagens)."""
+    global _schema_ok
+    if _schema_ok and not forcar:
+        return
     with connect() as con:
         # Tabelas
         con.executescript(DDL_CORE_TABLES)
@@ -354,7 +647,8 @@ def ensure_core_schema() -> None:
                 con.execute(f'ALTER TABLE benchmarks ADD COLUMN "{col}" {typ}')
 
         # Migrações leves — PORTFOLIO_DAILY
-        pcols = {"Data": "TEXT", "Ticker": "TEXT", "Valor": "REAL", "Qtde": "REAL", "PM": "REAL", "PnL": "REAL", "Aporte": "REAL"}
+        pcols = {"Data": "TEXT", "Ticker": "TEXT", "Valor": "REAL", "Qtde": "REAL", "PM": "REAL", "PnL": "REAL", "Aporte": "REAL",
+                 "vm_total": "REAL", "aportes": "REAL", "retiradas": "REAL", "proventos": "REAL"}
         existing = _table_columns(con, "portfolio_daily")
         for col, typ in pcols.items():
             if not any(c.lower() == col.lower() for c in existing):
@@ -389,6 +683,17 @@ def ensure_core_schema() -> None:
         if _has_column(con, "benchmarks", "Symbol"):
             con.execute("CREATE INDEX IF NOT EXISTS idx_bmk_symbol ON benchmarks(Symbol)")
 
+        # rollups e estatística por categoria do fluxo de caixa (triggers; preenchidos na 1ª vez)
+        ensure_rollups(con)
+        ensure_cat_stats(con)
+
+        # cotações: store canônico (migra precos/cotacoes antigos na 1ª vez)
+        quotes.ensure_quote_schema(con)
+
+        # versões do cache no banco (escritas de CLIs/outros processos invalidam o servidor)
+        ensure_cache_versao(con)
+    _schema_ok = True
+
 # Wrapper compatível com services/globals.py
 def _ensure_schema() -> None:
     ensure_core_schema()
@@ -414,12 +719,12 @@ def replace_table(name: str, df: pd.DataFrame) -> None:
     _ensure_schema()
     with connect() as con:
         con.execute(f'DELETE FROM "{name}"')
-        if df is None or df.empty:
-            return
-        d = df.copy()
-        if "Data" in d.columns:
-            d["Data"] = pd.to_datetime(d["Data"], errors="coerce").dt.strftime("%Y-%m-%d")
-        d.to_sql(name, con, if_exists="append", index=False)
+        if df is not None and not df.empty:
+            d = df.copy()
+            if "Data" in d.columns:
+                d["Data"] = pd.to_datetime(d["Data"], errors="coerce").dt.strftime("%Y-%m-%d")
+            d.to_sql(name, con, if_exists="append", index=False)
+    cache.bump(name)
 
 def append_rows(name: str, df: pd.DataFrame) -> None:
     _ensure_schema()
@@ -432,6 +737,7 @@ def append_rows(name: str, df: pd.DataFrame) -> None:
         d["Data"] = pd.to_datetime(d["Data"], errors="coerce").dt.strftime("%Y-%m-%d")
     with connect() as con:
         d.to_sql(name, con, if_exists="append", index=False)
+    cache.bump(name)
 
 # ============================================================
 # UPDATE/DELETE utilitários
@@ -446,13 +752,103 @@ def update_row(table: str, row_id: int, payload: Dict[str, Any]) -> None:
     args = {**p, "id": int(row_id)}
     with connect() as con:
         con.execute(f'UPDATE "{table}" SET {sets} WHERE id=:id', args)
+    cache.bump(table)
+
+def update_rows(table: str, changes: Iterable[tuple[int, Dict[str, Any]]]) -> pd.DataFrame:
+    """
+    Várias edições [(id, payload), ...] numa única transação: um executemany por
+    conjunto de colunas alteradas. Retorna o estado final só das linhas tocadas.
+    """
+    grupos: Dict[tuple, list] = {}
+    for row_id, payload in changes or []:
+        p = {k: v for k, v in (payload or {}).items() if k != "id"}
+        if not p:
+            continue
+        if "Data" in p and p["Data"] is not None:
+            p["Data"] = pd.to_datetime(p["Data"], errors="coerce").strftime("%Y-%m-%d")
+        cols = tuple(sorted(p))
+        grupos.setdefault(cols, []).append(tuple(p[c] for c in cols) + (int(row_id),))
+    if not grupos:
+        return pd.DataFrame()
+    ids = sorted({params[-1] for lote in grupos.values() for params in lote})
+    with connect() as con:
+        for cols, lote in grupos.items():
+            sets = ", ".join(f'"{c}"=?' for c in cols)
+            con.executemany(f'UPDATE "{table}" SET {sets} WHERE id=?', lote)
+        partes = [_read_df(con, f'SELECT * FROM "{table}" WHERE id IN ({",".join("?" * len(ids[i:i + 900]))})',
+                           ids[i:i + 900]) for i in range(0, len(ids), 900)]
+    cache.bump(table)
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+def delete_rows(table: str, ids: Iterable[int]) -> list[int]:
+    """DELETE único contra a tabela temporária de ids; retorna os ids efetivamente removidos."""
+    ids = [int(i) for i in (ids or [])]
+    if not ids:
+        return []
+    with connect() as con:
+        _load_sel_ids(con, ids)
+        removidos = [r[0] for r in con.execute(
+            f'DELETE FROM "{table}" WHERE id IN (SELECT id FROM temp._sel_ids) RETURNING id').fetchall()]
+    if removidos:
+        cache.bump(table)
+    return removidos
+
+# ============================================================
+# Operações em lote (set-based): ids numa tabela temporária + um único
+# INSERT … SELECT / UPDATE / DELETE com RETURNING (devolvem só o delta)
+# ============================================================
+def _load_sel_ids(con: sqlite3.Connection, ids: Iterable[int]) -> None:
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS _sel_ids(id INTEGER PRIMARY KEY)")
+    con.execute("DELETE FROM temp._sel_ids")
+    con.executemany("INSERT OR IGNORE INTO temp._sel_ids(id) VALUES (?)", [(int(i),) for i in ids])
+
+def _returning_df(cur: sqlite3.Cursor) -> pd.DataFrame:
+    rows = cur.fetchall()
+    df = pd.DataFrame(rows, columns=[d[0] for d in (cur.description or [])])
+    if "Data" in df.columns:
+        df["Data"] = pd.to_datetime(df["Data"], errors="coerce")
+    return df
+
+def _ordered_columns(con: sqlite3.Connection, table: str) -> list[str]:
+    return [str(r[1]) for r in con.execute(f'PRAGMA table_info("{table}")').fetchall()]
+
+def table_columns(table: str) -> list[str]:
+    """Colunas na ordem do schema (para montar deltas/patches de store)."""
+    with connect() as con:
+        return _ordered_columns(con, table)
 
-def delete_rows(table: str, ids: Iterable[int]) -> None:
+def duplicate_rows(table: str, ids: Iterable[int], cols: Sequence[str] | None = None) -> pd.DataFrame:
+    """Copia as linhas (INSERT … SELECT). cols limita o que é copiado; o resto fica com o DEFAULT."""
     ids = [int(i) for i in (ids or [])]
     if not ids:
-        return
+        return pd.DataFrame()
+    with connect() as con:
+        existentes = _ordered_columns(con, table)
+        # import_hash identifica a linha original do extrato (índice UNIQUE): a cópia nasce sem ele
+        sel = [c for c in (cols or existentes) if c in existentes and c not in ("id", "import_hash")]
+        lista = ", ".join(f'"{c}"' for c in sel)
+        _load_sel_ids(con, ids)
+        novas = _returning_df(con.execute(
+            f'INSERT INTO "{table}" ({lista}) SELECT {lista} FROM "{table}" '
+            f'WHERE id IN (SELECT id FROM temp._sel_ids) ORDER BY id RETURNING *'))
+    if not novas.empty:
+        cache.bump(table)
+    return novas
+
+def set_column(table: str, ids: Iterable[int], col: str, value: Any) -> pd.DataFrame:
+    """UPDATE … SET col=value para todos os ids de uma vez; retorna as linhas alteradas."""
+    ids = [int(i) for i in (ids or [])]
+    if not ids:
+        return pd.DataFrame()
     with connect() as con:
-        con.executemany(f'DELETE FROM "{table}" WHERE id=?', [(i,) for i in ids])
+        if col not in _ordered_columns(con, table):
+            raise ValueError(f"coluna inválida: {col}")
+        _load_sel_ids(con, ids)
+        alteradas = _returning_df(con.execute(
+            f'UPDATE "{table}" SET "{col}"=? WHERE id IN (SELECT id FROM temp._sel_ids) RETURNING *', (value,)))
+    if not alteradas.empty:
+        cache.bump(table)
+    return alteradas
 
 # ============================================================
 # Fluxo de Caixa — aliases
@@ -473,11 +869,415 @@ def append_receitas(df: pd.DataFrame) -> None:      append_rows("receitas", df)
 def append_despesas(df: pd.DataFrame) -> None:      append_rows("despesas", df)
 def append_investimentos(df: pd.DataFrame) -> None: append_rows("investimentos", df)
 
+# ============================================================
+# Fluxo de Caixa — consulta paginada (DataTables em modo "custom")
+#   filtros do painel + filter_query/sort_by do DataTable -> SQL com LIMIT/OFFSET
+# ============================================================
+_FLUXO_TABLES = {"receitas", "despesas", "investimentos"}
+
+# operadores do filter_query do DataTable (ordem importa: '>=' antes de '>')
+_DT_OPERATORS = [
+    ("ge ", ">="), ("le ", "<="), ("lt ", "<"), ("gt ", ">"), ("ne ", "!="), ("eq ", "="),
+    (">=", ">="), ("<=", "<="), ("!=", "!="), ("<", "<"), (">", ">"), ("=", "="),
+    ("contains ", "LIKE"), ("datestartswith ", "DATESTARTS"),
+]
+
+def _dt_filter_part(part: str, allowed: set[str]):
+    """'{col} op valor' -> (coluna, op_sql, valor) ou None se não reconhecido/coluna fora da whitelist."""
+    part = part.strip()
+    if not part.startswith("{") or "}" not in part:
+        return None
+    col = part[1:part.index("}")]
+    if col not in allowed:
+        return None
+    rest = part[part.index("}") + 1:].strip()
+    for tok, op in _DT_OPERATORS:
+        if rest.startswith(tok):
+            raw = rest[len(tok):].strip()
+            if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in "\"'`":
+                val: Any = raw[1:-1].replace("\\" + raw[0], raw[0])
+            else:
+                val = raw
+                if op not in ("LIKE", "DATESTARTS"):
+                    try:
+                        val = float(raw)
+                    except ValueError:
+                        pass
+            return col, op, val
+    return None
+
+_LIKE_ESCAPE = "ESCAPE '\\'"
+
+def _like_literal(s) -> str:
+    """Texto do usuário como literal no LIKE ('50%', 'IPTU_2024' não viram curinga)."""
+    return str(s).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _fluxo_where(con: sqlite3.Connection, table: str, start=None, end=None, categorias=None,
+                 status_col: str | None = None, so_status: bool = False, busca: str | None = None,
+                 valor_min=None, valor_max=None, filter_query: str | None = None):
+    cols = _table_columns(con, table)
+    where, params = [], []
+    if start:
+        where.append('"Data" >= ?'); params.append(pd.to_datetime(start).strftime("%Y-%m-%d"))
+    if end:
+        # '<' dia seguinte: cobre linhas antigas gravadas com hora
+        where.append('"Data" < ?'); params.append((pd.to_datetime(end).normalize() + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+    if categorias:
+        cats = [str(c) for c in categorias]
+        where.append(f'"Categoria" IN ({",".join("?" * len(cats))})'); params += cats
+    if so_status and status_col and status_col in cols:
+        where.append(f'"{status_col}" = 1')
+    if busca and str(busca).strip():
+        where.append(f'busca_norm("Descrição") LIKE ? {_LIKE_ESCAPE}')
+        params.append(f"%{_like_literal(texto_busca(str(busca).strip()))}%")
+    if valor_min is not None:
+        where.append('"Valor" >= ?'); params.append(float(valor_min))
+    if valor_max is not None:
+        where.append('"Valor" <= ?'); params.append(float(valor_max))
+    for part in (filter_query or "").split(" && "):
+        f = _dt_filter_part(part, cols)
+        if f is None:
+            continue
+        col, op, val = f
+        if op == "LIKE":
+            where.append(f'"{col}" LIKE ? {_LIKE_ESCAPE}'); params.append(f"%{_like_literal(val)}%")
+        elif op == "DATESTARTS":
+            where.append(f'"{col}" LIKE ? {_LIKE_ESCAPE}'); params.append(f"{_like_literal(val)}%")
+        else:
+            where.append(f'"{col}" {op} ?'); params.append(val)
+    return (" WHERE " + " AND ".join(where)) if where else "", params, cols
+
+def pagina_valida(page_current, total: int, page_size: int) -> int:
+    """Página pedida limitada a [0, última página com 'total' linhas]."""
+    return max(0, min(int(page_current or 0), max(1, -(-int(total) // int(page_size))) - 1))
+
+def query_fluxo_page(table: str, start=None, end=None, categorias=None, status_col: str | None = None,
+                     so_status: bool = False, busca: str | None = None, valor_min=None, valor_max=None,
+                     filter_query: str | None = None, sort_by: list | None = None,
+                     page_current: int = 0, page_size: int | None = 15,
+                     columns: Sequence[str] | None = None) -> tuple[pd.DataFrame, int]:
+    """
+    Uma página do extrato já filtrada/ordenada no SQLite.
+    Retorna (linhas, total_filtrado). page_size=None devolve tudo (exportação).
+    Inclui a coluna 'Anomalia' (|z| >= 2 na categoria, contra o histórico inteiro em cat_stats).
+    """
+    if table not in _FLUXO_TABLES:
+        raise ValueError(f"tabela inválida: {table}")
+    _ensure_schema()
+    with connect() as con:
+        where, params, cols = _fluxo_where(con, table, start, end, categorias, status_col, so_status,
+                                           busca, valor_min, valor_max, filter_query)
+        total = int(con.execute(f'SELECT COUNT(*) FROM "{table}"{where}', params).fetchone()[0])
+        if page_size:
+            # resultado encolheu (delete, filtro mais estreito) com a página antiga: última página válida
+            page_current = pagina_valida(page_current, total, page_size)
+
+        order = [f'"{s["column_id"]}" {"DESC" if s.get("direction") == "desc" else "ASC"}'
+                 for s in (sort_by or []) if s.get("column_id") in cols]
+        order_sql = ", ".join(order + ['"Data" DESC', "id DESC"])
+        sel = [c for c in (columns or cols) if c in cols]
+        alias = f'"{table}"'
+        sel_sql = ", ".join(f'{alias}."{c}"' for c in sel) if sel else f"{alias}.*"
+        if "Valor" in cols:
+            sel_sql += f', {anomalia_sql(table, alias)} AS "Anomalia"'
+        q = f'SELECT {sel_sql} FROM "{table}"{where} ORDER BY {order_sql}'
+        qp = list(params)
+        if page_size:
+            q += " LIMIT ? OFFSET ?"; qp += [int(page_size), int(page_current or 0) * int(page_size)]
+        df = _read_df(con, q, qp)
+    return df, total
+
+# ============================================================
+# Fluxo de Caixa — rollups materializados
+#   rollup_mensal (tipo × mês × categoria) e rollup_diario (tipo × dia × categoria),
+#   mantidos por triggers em receitas/despesas/investimentos. Os dashboards leem
+#   centenas de linhas daqui em vez de varrer todos os lançamentos.
+# ============================================================
+DDL_ROLLUPS = """
+CREATE TABLE IF NOT EXISTS rollup_mensal(
+  tipo TEXT NOT NULL,
+  mes TEXT NOT NULL,            -- 'YYYY-MM'
+  categoria TEXT NOT NULL,
+  valor REAL NOT NULL DEFAULT 0,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (tipo, mes, categoria)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_diario(
+  tipo TEXT NOT NULL,
+  dia TEXT NOT NULL,            -- 'YYYY-MM-DD'
+  categoria TEXT NOT NULL,
+  valor REAL NOT NULL DEFAULT 0,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (tipo, dia, categoria)
+) WITHOUT ROWID;
+"""
+
+# corpo dos triggers: {R} = NEW/OLD, {s} = +/- ; as linhas zeradas são removidas
+_ROLLUP_ADD = """
+  INSERT INTO rollup_mensal(tipo, mes, categoria, valor, n)
+  VALUES ('{t}', substr(NEW."Data", 1, 7), COALESCE(NEW."Categoria", ''), COALESCE(NEW."Valor", 0), 1)
+  ON CONFLICT(tipo, mes, categoria) DO UPDATE SET valor = valor + excluded.valor, n = n + 1;
+  INSERT INTO rollup_diario(tipo, dia, categoria, valor, n)
+  VALUES ('{t}', substr(NEW."Data", 1, 10), COALESCE(NEW."Categoria", ''), COALESCE(NEW."Valor", 0), 1)
+  ON CONFLICT(tipo, dia, categoria) DO UPDATE SET valor = valor + excluded.valor, n = n + 1;
+"""
+_ROLLUP_SUB = """
+  UPDATE rollup_mensal SET valor = valor - COALESCE(OLD."Valor", 0), n = n - 1
+   WHERE tipo = '{t}' AND mes = substr(OLD."Data", 1, 7) AND categoria = COALESCE(OLD."Categoria", '');
+  DELETE FROM rollup_mensal
+   WHERE tipo = '{t}' AND mes = substr(OLD."Data", 1, 7) AND categoria = COALESCE(OLD."Categoria", '') AND n <= 0;
+  UPDATE rollup_diario SET valor = valor - COALESCE(OLD."Valor", 0), n = n - 1
+   WHERE tipo = '{t}' AND dia = substr(OLD."Data", 1, 10) AND categoria = COALESCE(OLD."Categoria", '');
+  DELETE FROM rollup_diario
+   WHERE tipo = '{t}' AND dia = substr(OLD."Data", 1, 10) AND categoria = COALESCE(OLD."Categoria", '') AND n <= 0;
+"""
+
+def _rollup_triggers(t: str) -> str:
+    add, sub = _ROLLUP_ADD.format(t=t), _ROLLUP_SUB.format(t=t)
+    return f"""
+CREATE TRIGGER IF NOT EXISTS trg_{t}_rollup_ins AFTER INSERT ON "{t}"
+WHEN NEW."Data" IS NOT NULL BEGIN {add} END;
+CREATE TRIGGER IF NOT EXISTS trg_{t}_rollup_del AFTER DELETE ON "{t}"
+WHEN OLD."Data" IS NOT NULL BEGIN {sub} END;
+CREATE TRIGGER IF NOT EXISTS trg_{t}_rollup_upd_old AFTER UPDATE OF "Valor", "Data", "Categoria" ON "{t}"
+WHEN OLD."Data" IS NOT NULL BEGIN {sub} END;
+CREATE TRIGGER IF NOT EXISTS trg_{t}_rollup_upd_new AFTER UPDATE OF "Valor", "Data", "Categoria" ON "{t}"
+WHEN NEW."Data" IS NOT NULL BEGIN {add} END;
+"""
+
+def rebuild_rollups(con: sqlite3.Connection) -> None:
+    """Recalcula os rollups do zero (1ª criação ou se ficarem fora de sincronia)."""
+    con.execute("DELETE FROM rollup_mensal")
+    con.execute("DELETE FROM rollup_diario")
+    for t in sorted(_FLUXO_TABLES):
+        con.execute(f"""
+            INSERT INTO rollup_mensal(tipo, mes, categoria, valor, n)
+            SELECT ?, substr("Data", 1, 7), COALESCE("Categoria", ''), SUM(COALESCE("Valor", 0)), COUNT(*)
+              FROM "{t}" WHERE "Data" IS NOT NULL GROUP BY 2, 3""", (t,))
+        con.execute(f"""
+            INSERT INTO rollup_diario(tipo, dia, categoria, valor, n)
+            SELECT ?, substr("Data", 1, 10), COALESCE("Categoria", ''), SUM(COALESCE("Valor", 0)), COUNT(*)
+              FROM "{t}" WHERE "Data" IS NOT NULL GROUP BY 2, 3""", (t,))
+
+def ensure_rollups(con: sqlite3.Connection) -> None:
+    novo = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='rollup_mensal'").fetchone() is None
+    con.executescript(DDL_ROLLUPS + "".join(_rollup_triggers(t) for t in sorted(_FLUXO_TABLES)))
+    if novo:
+        rebuild_rollups(con)
+
+# ============================================================
+# Fluxo de Caixa — estatística por categoria (Welford)
+#   cat_stats(tabela, cat, n, media, m2) mantida por triggers: inserir/remover um
+#   lançamento atualiza contagem, média e M2 em O(1). Desvio amostral = sqrt(m2/(n-1)).
+#   (nomes 'tabela'/'cat' evitam ambiguidade com Tipo/Categoria nos JOINs)
+# ============================================================
+DDL_CAT_STATS = """
+CREATE TABLE IF NOT EXISTS cat_stats(
+  tabela TEXT NOT NULL,
+  cat TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  media REAL NOT NULL DEFAULT 0,
+  m2 REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (tabela, cat)
+) WITHOUT ROWID;
+"""
+
+_STATS_ADD = """
+  INSERT INTO cat_stats(tabela, cat, n, media, m2)
+  VALUES ('{t}', COALESCE(NEW."Categoria", ''), 1, 1.0 * COALESCE(NEW."Valor", 0), 0)
+  ON CONFLICT(tabela, cat) DO UPDATE SET
+    n = n + 1,
+    media = media + (excluded.media - media) / (n + 1),
+    m2 = m2 + (excluded.media - media) * ((excluded.media - media) - (excluded.media - media) / (n + 1));
+"""
+_STATS_SUB = """
+  UPDATE cat_stats SET
+    n = n - 1,
+    media = CASE WHEN n > 1 THEN (media * n - 1.0 * COALESCE(OLD."Valor", 0)) / (n - 1) ELSE 0 END,
+    m2 = CASE WHEN n > 1 THEN MAX(m2 - (1.0 * COALESCE(OLD."Valor", 0) - media)
+                                     * (1.0 * COALESCE(OLD."Valor", 0) - (media * n - 1.0 * COALESCE(OLD."Valor", 0)) / (n - 1)), 0)
+         ELSE 0 END
+   WHERE tabela = '{t}' AND cat = COALESCE(OLD."Categoria", '');
+  DELETE FROM cat_stats WHERE tabela = '{t}' AND cat = COALESCE(OLD."Categoria", '') AND n <= 0;
+"""
+
+def _cat_stats_triggers(t: str) -> str:
+    add, sub = _STATS_ADD.format(t=t), _STATS_SUB.format(t=t)
+    return f"""
+CREATE TRIGGER IF NOT EXISTS trg_{t}_stats_ins AFTER INSERT ON "{t}" BEGIN {add} END;
+CREATE TRIGGER IF NOT EXISTS trg_{t}_stats_del AFTER DELETE ON "{t}" BEGIN {sub} END;
+CREATE TRIGGER IF NOT EXISTS trg_{t}_stats_upd_old AFTER UPDATE OF "Valor", "Categoria" ON "{t}" BEGIN {sub} END;
+CREATE TRIGGER IF NOT EXISTS trg_{t}_stats_upd_new AFTER UPDATE OF "Valor", "Categoria" ON "{t}" BEGIN {add} END;
+"""
+
+def rebuild_cat_stats(con: sqlite3.Connection) -> None:
+    """Recalcula cat_stats em duas passadas (média, depois M2) — corrige deriva numérica."""
+    con.execute("DELETE FROM cat_stats")
+    for t in sorted(_FLUXO_TABLES):
+        con.execute(f"""
+            WITH a AS (SELECT COALESCE("Categoria", '') AS cat, AVG(1.0 * COALESCE("Valor", 0)) AS m
+                         FROM "{t}" GROUP BY 1)
+            INSERT INTO cat_stats(tabela, cat, n, media, m2)
+            SELECT ?, a.cat, COUNT(*), a.m, SUM((1.0 * COALESCE(x."Valor", 0) - a.m) * (1.0 * COALESCE(x."Valor", 0) - a.m))
+              FROM "{t}" x JOIN a ON a.cat = COALESCE(x."Categoria", '')
+             GROUP BY a.cat""", (t,))
+
+def ensure_cat_stats(con: sqlite3.Connection) -> None:
+    novo = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='cat_stats'").fetchone() is None
+    con.executescript(DDL_CAT_STATS + "".join(_cat_stats_triggers(t) for t in sorted(_FLUXO_TABLES)))
+    if novo:
+        rebuild_cat_stats(con)
+
+# ============================================================
+# Versões do cache no banco
+#   cache_versao(tag, versao): +1 por transação que escreveu nas tabelas da tag. connect()
+#   descobre as tabelas pelo authorizer do SQLite (chamado ao preparar cada comando, não a
+#   cada linha) e chama cache.marcar() antes do commit; scripts com conexão própria chamam
+#   cache.marcar() direto. O cache lê a tabela só quando PRAGMA data_version muda.
+# ============================================================
+DDL_CACHE_VERSAO = """
+CREATE TABLE IF NOT EXISTS cache_versao(
+  tag TEXT PRIMARY KEY,
+  versao INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+# tag do cache -> tabelas físicas ('precos' mora no store quotes)
+CACHE_TABELAS = {
+    "receitas": ("receitas",), "despesas": ("despesas",), "investimentos": ("investimentos",),
+    "cat_receitas": ("cat_receitas",), "cat_despesas": ("cat_despesas",), "cat_investimentos": ("cat_investimentos",),
+    "trades": ("trades",), "proventos": ("proventos",), "ativos": ("ativos",), "benchmarks": ("benchmarks",),
+    "precos": ("quotes", "quote_tickers"),
+}
+
+_TAG_DA_TABELA = {t: tag for tag, tabelas in CACHE_TABELAS.items() for t in tabelas}
+_ESCRITAS = (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE)
+
+def _rastrear_escritas(con: sqlite3.Connection) -> set:
+    """Instala um authorizer que anota as tabelas escritas pela conexão; devolve o conjunto."""
+    escritas: set = set()
+    def _auth(acao, arg1, _arg2, _banco, _origem):
+        if acao in _ESCRITAS and arg1:
+            escritas.add(arg1)
+        return sqlite3.SQLITE_OK
+    con.set_authorizer(_auth)
+    return escritas
+
+def tags_escritas(tabelas) -> list[str]:
+    """Tags de services.cache afetadas por escritas nessas tabelas."""
+    return sorted({_TAG_DA_TABELA[t] for t in tabelas if t in _TAG_DA_TABELA})
+
+def ensure_cache_versao(con: sqlite3.Connection) -> None:
+    con.executescript(DDL_CACHE_VERSAO)
+    con.executemany("INSERT OR IGNORE INTO cache_versao(tag) VALUES (?)",
+                    [(t,) for t in (cache.MARCA, *CACHE_TABELAS)])
+    # versões anteriores somavam por linha (trigger FOR EACH ROW): caro em cargas grandes
+    con.executescript("\n".join(f'DROP TRIGGER IF EXISTS "trg_{t}_cache_{ev}";'
+                                for t in _TAG_DA_TABELA for ev in "iud"))
+
+def anomalia_sql(table: str, alias: str, z: float = 2.0) -> str:
+    """
+    Expressão SQL ('⚠️' ou '') para |z| >= z usando cat_stats — uma busca na PK por linha.
+    Sem sqrt: (x - média)² · (n - 1) >= z² · m2.
+    """
+    return f"""COALESCE((SELECT CASE WHEN s.n >= 2 AND s.m2 > 0
+                 AND (1.0 * {alias}."Valor" - s.media) * (1.0 * {alias}."Valor" - s.media) * (s.n - 1) >= {float(z) ** 2} * s.m2
+                 THEN '⚠️' ELSE '' END
+            FROM cat_stats s WHERE s.tabela = '{table}' AND s.cat = COALESCE({alias}."Categoria", '')), '')"""
+
+def _dia(v) -> str | None:
+    return pd.to_datetime(v).strftime("%Y-%m-%d") if v else None
+
+def load_rollup(tipo: str, start=None, end=None, categorias=None, por: str = "mes") -> pd.DataFrame:
+    """
+    Totais de um tipo ('receitas'/'despesas'/'investimentos') por período e categoria.
+      por="mes" -> colunas AnoMes, Categoria, Valor, N  (meses inteiros do rollup_mensal;
+                   meses cortados pelo filtro de datas vêm somados do rollup_diario)
+      por="dia" -> colunas Data, Categoria, Valor, N
+    """
+    if tipo not in _FLUXO_TABLES:
+        raise ValueError(f"tipo inválido: {tipo}")
+    ini, fim = _dia(start), _dia(end)
+    cats = [str(c) for c in (categorias or [])]
+    cat_sql = f' AND categoria IN ({",".join("?" * len(cats))})' if cats else ""
+
+    _ensure_schema()
+    with connect() as con:
+        if por == "dia":
+            q = f"SELECT dia AS Data, categoria AS Categoria, valor AS Valor, n AS N FROM rollup_diario WHERE tipo = ?{cat_sql}"
+            p: list = [tipo] + cats
+            if ini: q += " AND dia >= ?"; p.append(ini)
+            if fim: q += " AND dia <= ?"; p.append(fim)
+            return _read_df(con, q + " ORDER BY dia", p)
+
+        # meses inteiros dentro do intervalo saem do rollup mensal; as bordas parciais, do diário
+        ini_m = ini[:7] if ini else None
+        fim_m = fim[:7] if fim else None
+        ini_cheio = not ini or ini.endswith("-01")
+        fim_cheio = not fim or (pd.Timestamp(fim) + pd.Timedelta(days=1)).day == 1
+        q = f"SELECT mes, categoria, valor, n FROM rollup_mensal WHERE tipo = ?{cat_sql}"
+        p = [tipo] + cats
+        if ini_m: q += f" AND mes {'>=' if ini_cheio else '>'} ?"; p.append(ini_m)
+        if fim_m: q += f" AND mes {'<=' if fim_cheio else '<'} ?"; p.append(fim_m)
+        bordas = sorted({m for m, cheio in ((ini_m, ini_cheio), (fim_m, fim_cheio)) if m and not cheio})
+        if bordas and not (ini_m and fim_m and ini_m > fim_m):
+            q += f"""
+            UNION ALL
+            SELECT substr(dia, 1, 7), categoria, SUM(valor), SUM(n) FROM rollup_diario
+             WHERE tipo = ?{cat_sql} AND substr(dia, 1, 7) IN ({",".join("?" * len(bordas))})"""
+            p += [tipo] + cats + bordas
+            if ini: q += " AND dia >= ?"; p.append(ini)
+            if fim: q += " AND dia <= ?"; p.append(fim)
+            q += " GROUP BY 1, 2"
+        df = _read_df(con, q, p)
+
+    df.columns = ["AnoMes", "Categoria", "Valor", "N"]
+    df["AnoMes"] = pd.to_datetime(df["AnoMes"] + "-01", errors="coerce")
+    return df.sort_values(["AnoMes", "Categoria"]).reset_index(drop=True)
+
+# ============================================================
+# Dicionários (pd.Categorical)
+#   Categoria do fluxo usa o cadastro cat_<tabela>; Ticker usa quote_tickers + ativos.
+#   Categorias = cadastro ∪ valores presentes, ordenadas: frames da mesma origem compartilham
+#   o dtype e filtros/groupby rodam sobre códigos inteiros. Agrupar com observed=True.
+# ============================================================
+_CAT_CADASTRO = {"receitas": "cat_receitas", "despesas": "cat_despesas", "investimentos": "cat_investimentos"}
+
+@cache.memoize("cat_receitas", "cat_despesas", "cat_investimentos", maxsize=3)
+def cadastro_categorias(tabela: str) -> tuple:
+    if tabela not in _CAT_CADASTRO:
+        return ()
+    with connect() as con:
+        try:
+            return tuple(r[0] for r in con.execute(
+                f'SELECT Categoria FROM "{_CAT_CADASTRO[tabela]}" WHERE Categoria IS NOT NULL'))
+        except sqlite3.Error:
+            return ()
+
+@cache.memoize("precos", "ativos", maxsize=1)
+def cadastro_tickers() -> tuple:
+    out: list = []
+    with connect() as con:
+        for q in ("SELECT ticker FROM quote_tickers", "SELECT Ticker FROM ativos"):
+            try:
+                out += [r[0] for r in con.execute(q) if r[0] is not None]
+            except sqlite3.Error:
+                pass
+    return tuple(out)
+
+def como_categoria(s: pd.Series, cadastro: Iterable[str] = ()) -> pd.Series:
+    """Series de texto -> Categorical (NaN continua NaN)."""
+    cats = pd.Index(pd.unique(pd.Series([*cadastro, *pd.unique(s.dropna())], dtype=object))).sort_values()
+    return s.astype(pd.CategoricalDtype(cats))
+
 # ============================================================
 # Trades
 # ============================================================
 def load_trades() -> pd.DataFrame:
-    df = load_table("trades")
+    return _trades_padrao(load_table("trades"))
+
+def _trades_padrao(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame(columns=["data","Ticker","tipo","quantidade","preco","taxas","descricao"])
     # renomeia para o padrão usado em performance/portfolio
@@ -491,8 +1291,13 @@ def load_trades() -> pd.DataFrame:
         if c in d.columns:
             d[c] = pd.to_numeric(d[c], errors="coerce")
     d["tipo"] = d["tipo"].astype(str)
+    if "Ticker" in d.columns:
+        d["Ticker"] = como_categoria(d["Ticker"], cadastro_tickers())
     return d
 
+def delete_trades(ids: Iterable[int]) -> list[int]:
+    return delete_rows("trades", ids)
+
 def insert_trade(dt: str, ticker: str, tipo: str, qtd: float, preco: float, taxas: float, desc: str | None) -> None:
     ensure_core_schema()
     payload = {
@@ -508,41 +1313,69 @@ def insert_trade(dt: str, ticker: str, tipo: str, qtd: float, preco: float, taxa
         cols = ", ".join(payload.keys())
         binds = ", ".join([f":{k}" for k in payload.keys()])
         con.execute(f"INSERT INTO trades ({cols}) VALUES ({binds})", payload)
+    cache.bump("trades")
 
 # ============================================================
 # Dados de Mercado (preços/proventos/ativos/benchmarks)
 #  -> funções retornam nomes que o performance.py espera
 # ============================================================
+# Preços: tudo passa por services/quotes (tabela 'quotes'); a tag de cache continua "precos".
 def load_precos(ticker: str | None = None, start: str | None = None, end: str | None = None) -> pd.DataFrame:
     _ensure_schema()
-    q = "SELECT Data, Ticker, Close FROM precos WHERE 1=1"
-    params: Dict[str, Any] = {}
-    if ticker:
-        q += " AND Ticker = :t"; params["t"] = ticker
-    if start:
-        q += " AND Data >= :s"; params["s"] = pd.to_datetime(start, errors="coerce").strftime("%Y-%m-%d")
-    if end:
-        q += " AND Data <= :e"; params["e"] = pd.to_datetime(end, errors="coerce").strftime("%Y-%m-%d")
     with connect() as con:
-        df = _read_df(con, q, params)
-    if df.empty:
-        return pd.DataFrame(columns=["Ticker","data","preco"])
-    d = df.rename(columns={"Data":"data","Close":"preco"}).copy()
+        rows = quotes.read_quotes(con, [ticker] if ticker else None,
+                                  pd.to_datetime(start) if start else None,
+                                  pd.to_datetime(end) if end else None)
+    if not rows:
+        return pd.DataFrame(columns=["Ticker","data","preco","fonte"])
+    d = pd.DataFrame(rows, columns=["Ticker","data","preco","fonte"])
+    d["Ticker"] = como_categoria(d["Ticker"], cadastro_tickers())
     d["data"] = pd.to_datetime(d["data"], errors="coerce")
     d["preco"] = pd.to_numeric(d["preco"], errors="coerce")
-    return d.sort_values(["Ticker","data"]).reset_index(drop=True)
+    return d
+
+def _precos_rows(df: pd.DataFrame, fonte: str) -> list:
+    d = df.rename(columns={"Data":"data","Close":"preco"})
+    d = d.dropna(subset=["Ticker","data","preco"])
+    src = d["fonte"] if "fonte" in d.columns else pd.Series(fonte, index=d.index)
+    return list(zip(d["Ticker"], pd.to_datetime(d["data"], errors="coerce"), d["preco"].astype(float), src))
 
 def save_precos(df: pd.DataFrame) -> None:
-    if df is None or df.empty:
-        return
-    d = df.rename(columns={"data":"Data","preco":"Close"}).copy()
-    if "Data" in d.columns:
-        d["Data"] = pd.to_datetime(d["Data"], errors="coerce").dt.strftime("%Y-%m-%d")
-    replace_table("precos", d)
+    _ensure_schema()
+    with connect() as con:
+        quotes.clear_quotes(con)
+        if df is not None and not df.empty:
+            quotes.upsert_quotes(con, _precos_rows(df, "manual"))
+    cache.bump("precos")
 
 def append_precos(df: pd.DataFrame) -> None:
-    d = df.rename(columns={"data":"Data","preco":"Close"}).copy()
-    append_rows("precos", d)
+    upsert_precos(df)
+
+def upsert_precos(df: pd.DataFrame, fonte: str = "manual") -> int:
+    if df is None or df.empty:
+        return 0
+    _ensure_schema()
+    with connect() as con:
+        n = quotes.upsert_quotes(con, _precos_rows(df, fonte))
+    cache.bump("precos")
+    return n
+
+def upsert_preco(ticker: str, data: str, preco: float, fonte: str = "manual") -> None:
+    _ensure_schema()
+    with connect() as con:
+        quotes.upsert_quotes(con, [(ticker, pd.to_datetime(data), float(preco), fonte)])
+    cache.bump("precos")
+
+def delete_precos(keys: Iterable[tuple]) -> int:
+    """keys = [(ticker, data), ...]; retorna quantas cotações saíram."""
+    keys = [(t, pd.to_datetime(d)) for t, d in (keys or []) if t and d]
+    if not keys:
+        return 0
+    with connect() as con:
+        n = quotes.delete_quotes(con, keys)
+    if n:
+        cache.bump("precos")
+    return n
 
 def load_proventos(ticker: str | None = None) -> pd.DataFrame:
     _ensure_schema()
@@ -552,12 +1385,16 @@ def load_proventos(ticker: str | None = None) -> pd.DataFrame:
         q += " WHERE Ticker = ?"; params = (ticker,)
     with connect() as con:
         df = _read_df(con, q, params)
+    return _proventos_padrao(df)
+
+def _proventos_padrao(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame(columns=["id","data","Ticker","tipo","valor","valor_total"])
     d = df.rename(columns={"Data":"data","Tipo":"tipo","Valor":"valor"}).copy()
     d["data"] = pd.to_datetime(d["data"], errors="coerce")
     d["valor"] = pd.to_numeric(d["valor"], errors="coerce")
     d["valor_total"] = d["valor"]  # compat com performance.py (groupby usa 'valor_total')
+    d["Ticker"] = como_categoria(d["Ticker"], cadastro_tickers())
     return d.sort_values(["Ticker","data","id"]).reset_index(drop=True)
 
 def save_proventos(df: pd.DataFrame) -> None:
@@ -568,6 +1405,9 @@ def append_proventos(df: pd.DataFrame) -> None:
     d = df.rename(columns={"data":"Data","tipo":"Tipo","valor":"Valor"}).copy()
     append_rows("proventos", d)
 
+def delete_proventos(ids: Iterable[int]) -> list[int]:
+    return delete_rows("proventos", ids)
+
 def load_ativos() -> pd.DataFrame:
     df = load_table("ativos")
     if df.empty:
@@ -18,7 +18,7 @@ def fifo_realized_per_month(trades: pd.DataFrame, class_map: dict[str,str] | Non
     t = t.sort_values("data")
 
     rows = []
-    for tick, tx in t.groupby("Ticker"):
+    for tick, tx in t.groupby("Ticker", observed=True):
         lots = deque()  # cada lote: [qtd_restante, preco_unitario]
         for _, r in tx.iterrows():
             q = float(r["quantidade"]); p = float(r["preco"]); taxas = float(r.get("taxas",0.0))
@@ -78,6 +78,11 @@ def update_receita_row(row_id: int, payload: dict) -> None: _db.update_receita_r
 def update_despesa_row(row_id: int, payload: dict) -> None: _db.update_despesa_row(row_id, payload)
 def update_invest_row(row_id: int, payload: dict) -> None:  _db.update_invest_row(row_id, payload)
 
+# UPDATE em lote: [(id, payload), ...] numa transação; devolve só as linhas alteradas
+def update_receitas_rows(changes) -> pd.DataFrame:      return _db.update_receitas_rows(changes)
+def update_despesas_rows(changes) -> pd.DataFrame:      return _db.update_despesas_rows(changes)
+def update_investimentos_rows(changes) -> pd.DataFrame: return _db.update_investimentos_rows(changes)
+
 def delete_receitas(ids: list[int]) -> None:      _db.delete_receitas(ids)
 def delete_despesas(ids: list[int]) -> None:      _db.delete_despesas(ids)
 def delete_investimentos(ids: list[int]) -> None: _db.delete_investimentos(ids)
@@ -98,5 +103,8 @@ def filter_period_and_categories(df, start, end, categorias):
     if end:
         f = f[pd.to_datetime(f["Data"], errors="coerce") <= pd.to_datetime(end).normalize()]
     if categorias:
-        f = f[f["Categoria"].astype(str).isin([str(c) for c in categorias])]
+        col = f["Categoria"]
+        if not isinstance(col.dtype, pd.CategoricalDtype):   # Categorical: isin compara códigos
+            col = col.astype(str)
+        f = f[col.isin([str(c) for c in categorias])]
     return f
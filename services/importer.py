@@ -0,0 +1,664 @@
+# services/importer.py
+# Importação em massa de extratos (banco/corretora) em OFX ou CSV para receitas/despesas/investimentos.
+#
+#   ler (streaming) -> normalizar -> categorizar -> hash -> gravar em lotes
+#
+# Cada etapa é um gerador: o arquivo nunca é carregado inteiro, só um lote fica em memória.
+# Deduplicação: coluna import_hash com índice UNIQUE parcial + INSERT OR IGNORE. O hash é
+# sha1(tabela|data|valor|descrição normalizada#n), onde n é a ocorrência daquela mesma chave
+# no arquivo (contada por arquivo, mesmo importando vários de uma vez) — duas compras idênticas
+# no mesmo dia continuam sendo duas linhas, e reimportar um extrato (ou um período sobreposto)
+# não duplica nada. Lançamentos digitados à mão recebem o hash na primeira importação, então
+# também não são duplicados.
+#
+#   python -m services.importer extratos/2023.ofx extratos/nubank.csv --db finance.db
+#   python -m services.importer fatura.csv --destino despesas --regras regras.json --dry-run
+#   python -m services.importer --trades negociacoes_b3_2023.csv notas.csv
+from __future__ import annotations
+
+import argparse, codecs, csv, datetime as dt, hashlib, io, json, re, sqlite3, time, unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services import cache
+from services import db as _db
+from services import upgrade_portfolio_db as _upg
+
+FLUXO = ("receitas", "despesas", "investimentos")
+CHUNK = 5000
+
+# colunas gravadas por tabela (lançamento de extrato = já liquidado)
+_INSERT_COLS = {
+    "receitas":      ("Valor", "Recebido", "Recorrente", "Data", "Categoria", "Descrição", "import_hash"),
+    "despesas":      ("Valor", "Pago", "Fixo", "Data", "Categoria", "Descrição", "import_hash"),
+    "investimentos": ("Valor", "Recebido", "Fixo", "Data", "Categoria", "Descrição", "import_hash"),
+}
+
+# regras padrão de categorização (substring na descrição normalizada, sem acento, maiúscula)
+REGRAS_PADRAO: Dict[str, Dict[str, List[str]]] = {
+    "despesas": {
+        "Alimentação": ["IFOOD", "RESTAURANTE", "PADARIA", "MERCADO", "SUPERMERC", "ACOUGUE", "LANCHONETE"],
+        "Transporte":  ["UBER", "99APP", "99 POP", "POSTO", "COMBUST", "ESTACIONAMENTO", "PEDAGIO", "METRO"],
+        "Moradia":     ["ALUGUEL", "CONDOMINIO", "ENERGIA", "ENEL", "SABESP", "AGUA", "GAS ", "INTERNET", "IPTU"],
+        "Lazer":       ["NETFLIX", "SPOTIFY", "CINEMA", "INGRESSO", "STEAM", "PRIME VIDEO"],
+    },
+    "receitas": {
+        "Salário": ["SALARIO", "PAGTO SAL", "FOLHA", "PROVENTOS SAL"],
+        "Extra":   ["PIX RECEBIDO", "TED RECEBIDA", "REEMBOLSO", "CASHBACK"],
+    },
+    "investimentos": {
+        "Renda Fixa": ["CDB", "LCI", "LCA", "TESOURO", "DEBENTURE"],
+        "Ações":      ["ACOES", "BOVESPA", "B3 "],
+        "Fundos":     ["FUNDO", "FII", "FIC "],
+        "Cripto":     ["BITCOIN", "CRIPTO", "BINANCE"],
+    },
+}
+
+
+@dataclass
+class Lancamento:
+    data: str                      # 'YYYY-MM-DD'
+    valor: float                   # com sinal no arquivo; positivo depois de normalizar
+    descricao: str
+    categoria: Optional[str] = None
+    tabela: Optional[str] = None
+    hash: Optional[str] = None
+
+
+@dataclass
+class Relatorio:
+    lidos: int = 0
+    invalidos: int = 0
+    inseridos: int = 0
+    duplicados: int = 0
+    lotes: int = 0
+    segundos: float = 0.0
+    por_tabela: Counter = field(default_factory=Counter)
+
+    @property
+    def linhas_por_s(self) -> float:
+        return round(self.lidos / self.segundos, 1) if self.segundos > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {"lidos": self.lidos, "invalidos": self.invalidos, "inseridos": self.inseridos,
+                "duplicados": self.duplicados, "lotes": self.lotes, "segundos": round(self.segundos, 3),
+                "linhas_por_s": self.linhas_por_s, "por_tabela": dict(self.por_tabela)}
+
+# ======== Conversões ========
+def _sem_acento(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+
+
+def norm_desc(s: str) -> str:
+    return re.sub(r"\s+", " ", _sem_acento(str(s or "")).upper()).strip()
+
+
+def parse_valor(s) -> Optional[float]:
+    """'1.234,56', '-1,234.56', 'R$ 10,00', '(10,00)' -> float."""
+    if s is None:
+        return None
+    if isinstance(s, (int, float)):
+        return float(s)
+    t = str(s).strip().replace("R$", "").replace(" ", "").replace("\xa0", "")
+    if not t:
+        return None
+    neg = t.startswith("(") and t.endswith(")")
+    t = t.strip("()")
+    if t.endswith("-"):                       # '123,45-' (alguns bancos)
+        neg, t = True, t[:-1]
+    if "," in t and "." in t:
+        t = t.replace(".", "").replace(",", ".") if t.rfind(",") > t.rfind(".") else t.replace(",", "")
+    elif "," in t:
+        t = t.replace(",", ".")
+    try:
+        v = float(t)
+    except ValueError:
+        return None
+    return -v if neg else v
+
+
+_DATE_FMTS = ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%Y", "%Y%m%d", "%d.%m.%Y")
+
+
+def parse_data(s) -> Optional[str]:
+    t = re.split(r"[ T]", str(s or "").strip(), maxsplit=1)[0]
+    if not t:
+        return None
+    for fmt in _DATE_FMTS:
+        try:
+            return dt.datetime.strptime(t, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+# ======== Leitores (geradores) ========
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)")
+
+
+def _abrir_texto(path: Path, encoding: Optional[str] = None) -> io.TextIOBase:
+    if encoding:
+        return open(path, encoding=encoding, newline="")
+    with open(path, "rb") as f:
+        amostra = f.read(65536)
+    try:
+        # incremental: a amostra pode terminar no meio de um caractere multibyte
+        codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+        enc = "utf-8-sig"
+    except UnicodeDecodeError:
+        enc = "latin-1"
+    return open(path, encoding=enc, newline="")
+
+
+def iter_ofx(path, encoding: Optional[str] = None) -> Iterator[Lancamento]:
+    """OFX 1.x (SGML, tags sem fechamento) ou 2.x (XML), linha a linha."""
+    cur: Optional[dict] = None
+    with _abrir_texto(Path(path), encoding) as f:
+        for line in f:
+            for fecha, tag, valor in _OFX_TAG.findall(line):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    if not fecha:
+                        cur = {}
+                    elif cur is not None:
+                        valor_f = parse_valor(cur.get("TRNAMT"))
+                        data = parse_data((cur.get("DTPOSTED") or "")[:8])
+                        desc = cur.get("MEMO") or cur.get("NAME") or ""
+                        yield Lancamento(data or "", valor_f if valor_f is not None else float("nan"), desc.strip())
+                        cur = None
+                elif cur is not None and not fecha and valor.strip():
+                    cur[tag] = valor.strip()
+
+
+_CSV_COLS = {
+    "data":      ("data", "date", "dt", "data lancamento", "data do lancamento", "data movimento", "data_movimento"),
+    "valor":     ("valor", "amount", "value", "valor (r$)", "valor r$", "quantia"),
+    "descricao": ("descricao", "historico", "memo", "title", "lancamento", "estabelecimento", "description"),
+    "categoria": ("categoria", "category"),
+    "credito":   ("credito", "entrada", "credit"),
+    "debito":    ("debito", "saida", "debit"),
+}
+
+
+def _mapear_colunas(header: List[str]) -> Dict[str, str]:
+    norm = {_sem_acento(h).strip().lower(): h for h in header if h}
+    out = {}
+    for campo, nomes in _CSV_COLS.items():
+        for n in nomes:
+            if n in norm:
+                out[campo] = norm[n]; break
+    return out
+
+
+def iter_csv(path, delimiter: Optional[str] = None, encoding: Optional[str] = None) -> Iterator[Lancamento]:
+    with _abrir_texto(Path(path), encoding) as f:
+        primeira = f.readline()
+        delim = delimiter or (";" if primeira.count(";") >= primeira.count(",") else ",")
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter=delim)
+        cols = _mapear_colunas(reader.fieldnames or [])
+        if "data" not in cols or not ({"valor"} <= cols.keys() or {"credito", "debito"} & cols.keys()):
+            raise ValueError(f"{path}: colunas de data/valor não reconhecidas em {reader.fieldnames}")
+        for row in reader:
+            if "valor" in cols:
+                v = parse_valor(row.get(cols["valor"]))
+            else:
+                v = (parse_valor(row.get(cols.get("credito"))) or 0.0) - abs(parse_valor(row.get(cols.get("debito"))) or 0.0)
+            yield Lancamento(parse_data(row.get(cols["data"])) or "",
+                             v if v is not None else float("nan"),
+                             str(row.get(cols.get("descricao"), "") or "").strip(),
+                             (str(row.get(cols["categoria"]) or "").strip() or None) if "categoria" in cols else None)
+
+
+def iter_arquivo(path, **kw) -> Iterator[Lancamento]:
+    return iter_ofx(path, kw.get("encoding")) if Path(path).suffix.lower() in (".ofx", ".qfx") else iter_csv(path, **kw)
+
+# ======== Pipeline ========
+def normalizar(stream: Iterable[Lancamento], rel: Relatorio, destino: Optional[str] = None) -> Iterator[Lancamento]:
+    """Descarta linhas sem data/valor; crédito -> receitas, débito -> despesas (ou 'destino')."""
+    for l in stream:
+        rel.lidos += 1
+        if not l.data or l.valor != l.valor or l.valor == 0:
+            rel.invalidos += 1
+            continue
+        l.tabela = destino or ("receitas" if l.valor > 0 else "despesas")
+        l.valor = round(abs(l.valor), 2)
+        l.descricao = re.sub(r"\s+", " ", l.descricao).strip()
+        yield l
+
+
+class Categorizador:
+    def __init__(self, regras: Optional[Dict[str, Dict[str, List[str]]]] = None, padrao: str = "Outros"):
+        self.padrao = padrao
+        self._regras: Dict[str, List[Tuple[str, str]]] = {}
+        for tabela, cats in (regras or REGRAS_PADRAO).items():
+            self._regras[tabela] = [(norm_desc(k), cat) for cat, chaves in cats.items() for k in chaves]
+
+    @classmethod
+    def de_arquivo(cls, path) -> "Categorizador":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def categoria(self, tabela: str, descricao: str) -> str:
+        d = norm_desc(descricao)
+        for chave, cat in self._regras.get(tabela, ()):
+            if chave in d:
+                return cat
+        return self.padrao
+
+    def __call__(self, stream: Iterable[Lancamento]) -> Iterator[Lancamento]:
+        for l in stream:
+            if not l.categoria:
+                l.categoria = self.categoria(l.tabela, l.descricao)
+            yield l
+
+
+def _chave(tabela: str, data: str, valor: float, descricao: str) -> str:
+    return f"{tabela}|{data}|{float(valor):.2f}|{norm_desc(descricao)}"
+
+
+def _sha(chave: str, n: int) -> str:
+    return hashlib.sha1(f"{chave}#{n}".encode("utf-8")).hexdigest()
+
+
+def com_hash(stream: Iterable[Lancamento]) -> Iterator[Lancamento]:
+    """Hash com o índice de ocorrência da chave no stream (use um stream por arquivo)."""
+    ocorr: Counter = Counter()
+    for l in stream:
+        k = _chave(l.tabela, l.data, l.valor, l.descricao)
+        l.hash = _sha(k, ocorr[k]); ocorr[k] += 1
+        yield l
+
+
+def lotes(stream: Iterable[Lancamento], n: int = CHUNK) -> Iterator[List[Lancamento]]:
+    buf: List[Lancamento] = []
+    for l in stream:
+        buf.append(l)
+        if len(buf) >= n:
+            yield buf; buf = []
+    if buf:
+        yield buf
+
+# ======== Banco ========
+def ensure_import_schema(conn: sqlite3.Connection) -> None:
+    """Tabelas do fluxo (+ rollups/estatísticas) e a coluna import_hash com índice UNIQUE parcial."""
+    conn.executescript(_db.DDL_CORE_TABLES)
+    _db.ensure_rollups(conn)
+    _db.ensure_cat_stats(conn)
+    for t in FLUXO:
+        cols = {str(r[1]).lower() for r in conn.execute(f'PRAGMA table_info("{t}")')}
+        if "import_hash" not in cols:
+            conn.execute(f'ALTER TABLE "{t}" ADD COLUMN import_hash TEXT')
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS ux_{t}_import_hash ON "{t}"(import_hash) '
+                     "WHERE import_hash IS NOT NULL")
+
+
+def backfill_hashes(conn: sqlite3.Connection) -> int:
+    """Dá hash aos lançamentos sem import_hash (digitados à mão) — na próxima ocorrência livre da chave."""
+    n = 0
+    for t in FLUXO:
+        pend = conn.execute(f'SELECT id, Data, Valor, "Descrição" FROM "{t}" WHERE import_hash IS NULL ORDER BY id').fetchall()
+        if not pend:
+            continue
+        usados = {h for (h,) in conn.execute(f'SELECT import_hash FROM "{t}" WHERE import_hash IS NOT NULL')}
+        ocorr: Counter = Counter()
+        upd = []
+        for rid, data, valor, desc in pend:
+            k = _chave(t, str(data or "")[:10], valor or 0.0, desc or "")
+            while _sha(k, ocorr[k]) in usados:
+                ocorr[k] += 1
+            h = _sha(k, ocorr[k]); usados.add(h); ocorr[k] += 1
+            upd.append((h, rid))
+        conn.executemany(f'UPDATE "{t}" SET import_hash=? WHERE id=?', upd)
+        n += len(upd)
+    return n
+
+
+def _linha(l: Lancamento) -> tuple:
+    # (Valor, status=1, flag=0, Data, Categoria, Descrição, hash) — mesma ordem de _INSERT_COLS
+    return (l.valor, 1, 0, l.data, l.categoria, l.descricao, l.hash)
+
+
+def gravar(conn: sqlite3.Connection, lotes_: Iterable[List[Lancamento]], rel: Relatorio,
+           dry_run: bool = False) -> None:
+    """Um lote = uma transação com um executemany por tabela (INSERT OR IGNORE no hash)."""
+    for lote in lotes_:
+        rel.lotes += 1
+        por_tabela: Dict[str, list] = {}
+        for l in lote:
+            por_tabela.setdefault(l.tabela, []).append(l)
+        if dry_run:
+            for t, ls in por_tabela.items():
+                hs = [l.hash for l in ls]
+                existentes = set()
+                for i in range(0, len(hs), 900):
+                    parte = hs[i:i + 900]
+                    existentes |= {h for (h,) in conn.execute(
+                        f'SELECT import_hash FROM "{t}" WHERE import_hash IN ({",".join("?" * len(parte))})', parte)}
+                novos = sum(1 for h in hs if h not in existentes)
+                rel.inseridos += novos; rel.duplicados += len(hs) - novos; rel.por_tabela[t] += novos
+            continue
+        with conn:
+            tocadas = []
+            for t, ls in por_tabela.items():
+                cols = ", ".join(f'"{c}"' for c in _INSERT_COLS[t])
+                # rowcount do executemany soma só as linhas do próprio INSERT (não as dos triggers);
+                # as ignoradas pelo índice de hash contam 0
+                cur = conn.executemany(f'INSERT OR IGNORE INTO "{t}" ({cols}) '
+                                       f'VALUES ({",".join("?" * len(_INSERT_COLS[t]))})',
+                                       [_linha(l) for l in ls])
+                novos = max(cur.rowcount, 0)
+                rel.inseridos += novos; rel.duplicados += len(ls) - novos; rel.por_tabela[t] += novos
+                if novos:
+                    tocadas.append(t)
+            if tocadas:
+                cache.marcar(conn, *tocadas)
+
+
+def importar(paths: Iterable, conn: sqlite3.Connection, destino: Optional[str] = None,
+             categorizador: Optional[Categorizador] = None, chunk: int = CHUNK,
+             dry_run: bool = False, **leitor) -> Relatorio:
+    """Importa os arquivos na conexão dada (schema garantido antes). Retorna o relatório."""
+    if destino and destino not in FLUXO:
+        raise ValueError(f"destino inválido: {destino}")
+    rel = Relatorio()
+    t0 = time.perf_counter()
+    ensure_import_schema(conn)
+    if not dry_run:
+        with conn:
+            if backfill_hashes(conn):
+                cache.marcar(conn, *FLUXO)
+    cat = categorizador or Categorizador()
+
+    def _todos():
+        # ocorrências contadas por arquivo: extratos sobrepostos geram o mesmo #n para a mesma linha
+        for p in paths:
+            yield from com_hash(cat(normalizar(iter_arquivo(p, **leitor), rel, destino)))
+
+    gravar(conn, lotes(_todos(), chunk), rel, dry_run)
+    rel.segundos = time.perf_counter() - t0
+    if rel.inseridos and not dry_run:
+        cache.bump(*[t for t, n in rel.por_tabela.items() if n])
+    return rel
+
+
+def importar_arquivos(paths: Iterable, db_path: Optional[str] = None, **kw) -> Relatorio:
+    """Atalho: abre o banco (padrão: FINANCE_DB) e importa."""
+    conn = sqlite3.connect(str(db_path or _db.DB_PATH))
+    try:
+        return importar(paths, conn, **kw)
+    finally:
+        conn.close()
+
+# ======== Notas de corretagem / exportação B3 -> trades ========
+# Duas passadas em blocos (pandas, vetorizado), sem carregar a nota inteira:
+#   1) valida: descarta hashes já gravados e soma a quantidade por (ticker, dia, C/V); a checagem
+#      de venda descoberta roda sobre esse agregado (posicao_acumulada + cumsum), que cresce com
+#      os dias negociados, não com as linhas;
+#   2) grava: relê os blocos e faz um executemany por bloco (INSERT OR IGNORE no hash).
+# Deduplicação como no fluxo: import_hash = sha1(trades|data|ticker|tipo|qtd|preço#n), n contado
+# por arquivo. Tudo numa transação: ou a nota entra inteira, ou nada entra.
+_TRADE_COLS = {
+    "data":   ("data", "data do negocio", "data pregao", "data do pregao", "date", "dt"),
+    "ticker": ("ticker", "codigo de negociacao", "codigo", "ativo", "papel", "symbol", "titulo"),
+    "tipo":   ("tipo", "tipo de movimentacao", "c/v", "operacao", "compra/venda", "side"),
+    "qtd":    ("quantidade", "qtd", "qtde", "quantity"),
+    "preco":  ("preco", "preco unitario", "price", "preco (r$)"),
+    "taxas":  ("taxas", "custos", "corretagem", "fees"),
+    "desc":   ("descricao", "observacao", "nota", "instituicao"),
+}
+_TIPO = {"C": "C", "COMPRA": "C", "BUY": "C", "V": "V", "VENDA": "V", "SELL": "V"}
+_TOL = 1e-4
+
+
+class VendaDescoberta(ValueError):
+    """Venda maior que a posição na data; 'linhas' traz as vendas rejeitadas."""
+    def __init__(self, linhas):
+        self.linhas = linhas
+        super().__init__(f"{len(linhas)} venda(s) superam a quantidade disponível: "
+                         + ", ".join(f"{r.data} {r.ticker} {r.qtd:g}" for r in linhas.head(5).itertuples()))
+
+
+def _por_valor(s, f):
+    """s.map(f) chamando f uma vez por valor distinto (datas, tipos e preços se repetem muito)."""
+    import pandas as pd
+    u = pd.unique(s)
+    return s.map(dict(zip(u, map(f, u))))
+
+
+def _norm_trades(df):
+    import pandas as pd
+    norm = {_sem_acento(str(c)).strip().lower(): c for c in df.columns}
+    cols = {campo: next((norm[n] for n in nomes if n in norm), None) for campo, nomes in _TRADE_COLS.items()}
+    faltam = [c for c in ("data", "ticker", "tipo", "qtd", "preco") if cols[c] is None]
+    if faltam:
+        raise ValueError(f"colunas não reconhecidas ({', '.join(faltam)}) em {list(df.columns)}")
+
+    def _num(c):
+        s = df[cols[c]] if cols[c] else pd.Series(0.0, index=df.index)
+        return pd.to_numeric(s, errors="coerce") if s.dtype.kind in "if" else _por_valor(s, parse_valor).astype(float)
+
+    tk = df[cols["ticker"]].astype(str).str.strip().str.upper()
+    out = pd.DataFrame({
+        "data": _por_valor(df[cols["data"]], parse_data),
+        "ticker": tk.where(~tk.str.match(r"^[A-Z]{4}\d{1,2}F$"), tk.str[:-1]),   # mercado fracionário
+        "tipo": _por_valor(df[cols["tipo"]].astype(str), lambda t: _TIPO.get(norm_desc(t))),
+        "qtd": _num("qtd").abs(), "preco": _num("preco"), "taxas": _num("taxas").fillna(0.0),
+        "desc": df[cols["desc"]].astype(str).where(df[cols["desc"]].notna(), None) if cols["desc"] else None,
+    })
+    return out
+
+
+def iter_trades(path, chunk: int = CHUNK, delimiter: Optional[str] = None, encoding: Optional[str] = None):
+    """Blocos normalizados (DataFrame: data, ticker, tipo, qtd, preco, taxas, desc)."""
+    import pandas as pd
+    p = Path(path)
+    if p.suffix.lower() in (".xlsx", ".xls"):      # exportação da Área do Investidor B3
+        blocos = [pd.read_excel(p, dtype=str)]
+    else:
+        with _abrir_texto(p, encoding) as f:
+            primeira = f.readline()
+            enc = f.encoding
+        delim = delimiter or (";" if primeira.count(";") >= primeira.count(",") else ",")
+        blocos = pd.read_csv(p, sep=delim, dtype=str, encoding=enc, chunksize=chunk)
+    for b in blocos:
+        yield _norm_trades(b)
+
+
+def _coluna(cols: set, *nomes: str) -> List[str]:
+    low = {c.lower(): c for c in cols}
+    return [low[n.lower()] for n in nomes if n.lower() in low]
+
+
+def _ativo_ids(conn: sqlite3.Connection, tickers: List[str]) -> Dict[str, object]:
+    """Garante os tickers em 'ativos' e devolve ticker -> id (schema da carteira) ou o próprio ticker."""
+    conn.executemany("INSERT OR IGNORE INTO ativos(Ticker) VALUES (?)", [(t,) for t in tickers])
+    if not _coluna(_db._table_columns(conn, "ativos"), "id"):
+        return {t: t for t in tickers}
+    out = {}
+    for i in range(0, len(tickers), 900):
+        parte = tickers[i:i + 900]
+        out.update({str(t).upper(): i_ for i_, t in conn.execute(
+            f"SELECT id, Ticker FROM ativos WHERE Ticker IN ({','.join('?' * len(parte))})", parte)})
+    return out
+
+
+def _posicoes_existentes(conn: sqlite3.Connection, cols: set, chave: str, ids: list):
+    import pandas as pd
+    qtd = "COALESCE(" + ", ".join(f'"{c}"' for c in _coluna(cols, "Qtd", "quantidade")) + ", 0)"
+    tipo = _coluna(cols, "Tipo")[0]
+    data = _coluna(cols, "Data")[0]
+    linhas = []
+    for i in range(0, len(ids), 900):
+        parte = ids[i:i + 900]
+        linhas += conn.execute(
+            f'SELECT "{chave}", substr("{data}",1,10), '
+            f'SUM(CASE WHEN upper("{tipo}")=\'V\' THEN -{qtd} ELSE {qtd} END) '
+            f'FROM trades WHERE "{chave}" IN ({",".join("?" * len(parte))}) GROUP BY 1, 2', parte).fetchall()
+    return pd.DataFrame(linhas, columns=["chave", "data", "delta"])
+
+
+def checar_venda_descoberta(novos, existentes):
+    """
+    Posição acumulada por ativo (existentes + novos) em ordem de data, compras antes das vendas
+    no mesmo dia — mesma regra do trg_no_short_sell (date(data) <= date(NEW.data)).
+    Retorna as vendas novas que deixam a posição negativa nelas mesmas ou depois (venda
+    retroativa): para cada ponto negativo, a última venda nova até ali.
+    """
+    import pandas as pd
+    n = novos.assign(delta=novos["qtd"].where(novos["tipo"] == "C", -novos["qtd"]), novo=True,
+                     ordem=(novos["tipo"] == "V").astype(int), pos=range(len(novos)))
+    e = existentes.assign(novo=False, ordem=-1)
+    partes = [x for x in (e, n[["chave", "data", "delta", "novo", "ordem", "pos"]]) if not x.empty]
+    tudo = pd.concat(partes, ignore_index=True)
+    tudo = tudo.sort_values(["chave", "data", "ordem"], kind="mergesort")
+    saldo = tudo.groupby("chave", sort=False)["delta"].cumsum()
+    culpada = tudo["pos"].where(tudo["novo"].astype(bool) & (tudo["ordem"] == 1)).groupby(tudo["chave"]).ffill()
+    ruins = culpada[saldo < -_TOL].dropna().astype(int).unique()
+    return novos.iloc[sorted(ruins)]
+
+
+def _trades_validos(paths: Iterable, chunk: int, rel: Optional[Relatorio], **leitor):
+    """Blocos válidos de cada arquivo, com import_hash (mesmo resultado a cada passada)."""
+    for p in paths:
+        ocorr: Counter = Counter()
+        for b in iter_trades(p, chunk, **leitor):
+            ok = b["data"].notna() & b["tipo"].notna() & (b["qtd"] > 0) & b["preco"].notna() & (b["ticker"] != "")
+            if rel is not None:
+                rel.lidos += len(b); rel.invalidos += int((~ok).sum())
+            b = b[ok]
+            chaves = [f"trades|{d}|{t}|{tp}|{q:.6f}|{px:.6f}" for d, t, tp, q, px in
+                      zip(b["data"], b["ticker"], b["tipo"], b["qtd"], b["preco"])]
+            hs = []
+            for k in chaves:
+                hs.append(_sha(k, ocorr[k])); ocorr[k] += 1
+            yield b.assign(hash=hs)
+
+
+def _hashes_existentes(conn: sqlite3.Connection, hs: List[str]) -> set:
+    out = set()
+    for i in range(0, len(hs), 900):
+        parte = hs[i:i + 900]
+        out |= {h for (h,) in conn.execute(
+            f'SELECT import_hash FROM trades WHERE import_hash IN ({",".join("?" * len(parte))})', parte)}
+    return out
+
+
+def importar_trades(paths: Iterable, conn: sqlite3.Connection, chunk: int = CHUNK, dry_run: bool = False,
+                    **leitor) -> Relatorio:
+    import pandas as pd
+    paths = list(paths)
+    rel = Relatorio()
+    t0 = time.perf_counter()
+    conn.executescript(_db.DDL_TRADES_TABLE + _db.DDL_MARKET_TABLES)
+    if not _coluna(_db._table_columns(conn, "trades"), "import_hash"):
+        conn.execute("ALTER TABLE trades ADD COLUMN import_hash TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_trades_import_hash ON trades(import_hash) "
+                 "WHERE import_hash IS NOT NULL")
+    conn.commit()
+
+    cols = _db._table_columns(conn, "trades")
+    por_id = bool(_coluna(cols, "ativo_id"))
+    chave = "ativo_id" if por_id else (_coluna(cols, "Ticker") or ["Ticker"])[0]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 1ª passada: só o agregado por (ticker, dia, tipo) fica em memória
+        grupo = ["ticker", "data", "tipo"]
+        agregado = None
+        for b in _trades_validos(paths, chunk, rel, **leitor):
+            novos = b[~b["hash"].isin(_hashes_existentes(conn, b["hash"].tolist()))]
+            rel.duplicados += len(b) - len(novos)
+            parte = novos.groupby(grupo, as_index=False)["qtd"].sum()
+            if not parte.empty:
+                agregado = parte if agregado is None else \
+                    pd.concat([agregado, parte], ignore_index=True).groupby(grupo, as_index=False)["qtd"].sum()
+        if agregado is None:
+            conn.rollback()
+            rel.segundos = time.perf_counter() - t0
+            return rel
+
+        ids = _ativo_ids(conn, sorted(agregado["ticker"].unique().tolist()))
+        agregado["chave"] = agregado["ticker"].map(ids)
+        # schema da carteira com posicao_acumulada: validação por merge_asof sobre a posição mantida por trigger
+        usa_posicao = por_id and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='posicao_acumulada'").fetchone() is not None
+        if usa_posicao:
+            ruins = _upg.validar_vendas(conn, agregado.assign(ativo_id=agregado["chave"], quantidade=agregado["qtd"]))
+        else:
+            ruins = checar_venda_descoberta(agregado, _posicoes_existentes(conn, cols, chave, list(set(ids.values()))))
+        if len(ruins):
+            raise VendaDescoberta(ruins)
+        if dry_run:
+            conn.rollback()
+            rel.inseridos = rel.por_tabela["trades"] = int(rel.lidos - rel.invalidos - rel.duplicados)
+            rel.segundos = time.perf_counter() - t0
+            return rel
+
+        # a nota inteira já foi validada acima: o trigger de venda descoberta sai durante a carga
+        # (o antigo refaria a soma por linha; o novo barraria uma venda que vem antes da compra
+        # num bloco anterior do arquivo) e volta ao final, na mesma transação
+        trg = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' AND tbl_name='trades' "
+                           "AND name='trg_no_short_sell'").fetchall()
+        for nome, _ in trg:
+            conn.execute(f'DROP TRIGGER "{nome}"')
+
+        campos = [(c, v) for alvo, v in (
+            (("Data",), "data"), (("ativo_id",), "chave"), (("Ticker",), "ticker"), (("Tipo",), "tipo"),
+            (("Qtd", "quantidade"), "qtd"), (("Preco",), "preco"), (("Taxas",), "taxas"), (("Descricao",), "desc"),
+            (("import_hash",), "hash"),
+        ) for c in _coluna(cols, *alvo)]
+        lista = ", ".join(f'"{c}"' for c, _ in campos)
+        sql = f'INSERT OR IGNORE INTO trades ({lista}) VALUES ({",".join("?" * len(campos))})'
+        # 2ª passada: relê os blocos (hashes idênticos) e grava um bloco por vez
+        for b in _trades_validos(paths, chunk, None, **leitor):
+            b = b.sort_values("data", kind="mergesort").assign(chave=lambda x: x["ticker"].map(ids))
+            valores = b[[v for _, v in campos]].astype(object).where(b[[v for _, v in campos]].notna(), None)
+            cur = conn.executemany(sql, valores.itertuples(index=False, name=None))
+            rel.inseridos += max(cur.rowcount, 0)
+            rel.lotes += 1
+        for _, ddl in trg:
+            conn.execute(ddl)
+        if rel.inseridos:
+            cache.marcar(conn, "trades")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    rel.por_tabela["trades"] = rel.inseridos
+    rel.segundos = time.perf_counter() - t0
+    if rel.inseridos:
+        cache.bump("trades")
+    return rel
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Importa extratos OFX/CSV (fluxo de caixa) ou notas/exportações B3 (trades).")
+    ap.add_argument("arquivos", nargs="+", help=".ofx/.qfx ou .csv (com --trades: .csv/.xlsx)")
+    ap.add_argument("--db", default=str(_db.DB_PATH), help="caminho do SQLite (padrão: FINANCE_DB)")
+    ap.add_argument("--trades", action="store_true", help="arquivos são notas de corretagem/negociações B3")
+    ap.add_argument("--chunk", type=int, default=CHUNK, help="linhas por transação/bloco")
+    ap.add_argument("--regras", help="JSON {tabela: {categoria: [palavras]}} (substitui as regras padrão)")
+    ap.add_argument("--destino", choices=FLUXO, help="força a tabela (ex.: fatura de cartão -> despesas)")
+    ap.add_argument("--delimitador", help="delimitador do CSV (padrão: detecta ; ou ,)")
+    ap.add_argument("--encoding", help="encoding dos arquivos (padrão: utf-8, senão latin-1)")
+    ap.add_argument("--dry-run", action="store_true", help="só valida/conta, sem gravar")
+    args = ap.parse_args()
+
+    leitor = {k: v for k, v in (("delimiter", args.delimitador), ("encoding", args.encoding)) if v}
+    if args.trades:
+        conn = sqlite3.connect(args.db)
+        try:
+            rel = importar_trades(args.arquivos, conn, chunk=args.chunk, dry_run=args.dry_run, **leitor)
+        except VendaDescoberta as e:
+            raise SystemExit(f"Nada importado: {e}")
+        finally:
+            conn.close()
+    else:
+        rel = importar_arquivos(args.arquivos, args.db, destino=args.destino, chunk=args.chunk, dry_run=args.dry_run,
+                                categorizador=Categorizador.de_arquivo(args.regras) if args.regras else None, **leitor)
+    r = rel.as_dict()
+    print(f"lidos={r['lidos']} invalidos={r['invalidos']} inseridos={r['inseridos']} "
+          f"duplicados={r['duplicados']} lotes={r['lotes']} {r['segundos']}s ({r['linhas_por_s']} linhas/s)"
+          + (" [dry-run]" if args.dry_run else ""))
+    for t, n in sorted(r["por_tabela"].items()):
+        print(f"  {t}: {n}")
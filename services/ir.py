@@ -1,8 +1,15 @@
 # services/ir.py
+import sqlite3
+
+import numpy as np
 import pandas as pd
-from . import db
+from . import cache, db
+from . import irpf
+from .cache import memoize
 
 # --------- Catálogos úteis (PF) ----------
+CODIGO_PGBL = 36
+
 PAGAMENTOS_CODIGOS = {
     10: "Médicos no Brasil (CPF/CNPJ)",
     11: "Dentistas no Brasil (CPF/CNPJ)",
@@ -28,25 +35,203 @@ DARF_CODIGOS = {
     "irpj_bolsa_real": "3317"
 }
 
+# --------- SCHEMA (PF) ----------
+# Chave natural de cada tabela = índice UNIQUE: o upsert é um INSERT … ON CONFLICT nativo.
+PF_CHAVES = {
+    "pf_fontes_pagadoras": ("ano", "cnpj"),
+    "pf_pagamentos": ("ano", "codigo_pagamento", "doc_prestador", "data"),
+    "pf_rv_mensal": ("ano", "mes"),
+    "pf_bens_direitos": ("ano", "grupo", "codigo", "discriminacao"),
+}
+
+PF_COLUNAS = {
+    "pf_fontes_pagadoras": {
+        "ano": "INTEGER", "cnpj": "TEXT", "razao_social": "TEXT", "tipo": "TEXT",
+        "rend_bruto": "REAL", "irrf": "REAL", "contrib_prev_oficial": "REAL",
+        "pensao_alimenticia": "REAL", "decimo_terceiro_bruto": "REAL", "meses_trabalhados": "INTEGER",
+    },
+    "pf_pagamentos": {
+        "ano": "INTEGER", "codigo_pagamento": "INTEGER", "doc_prestador": "TEXT", "nome_prestador": "TEXT",
+        "valor": "REAL", "data": "TEXT", "reembolso": "INTEGER", "valor_reembolsado": "REAL",
+    },
+    "pf_rv_mensal": {
+        "ano": "INTEGER", "mes": "INTEGER",
+        "vendas_acoes_comum": "REAL", "lucro_acoes_comum": "REAL",
+        "vendas_daytrade": "REAL", "lucro_daytrade": "REAL",
+        "vendas_outros": "REAL", "lucro_outros": "REAL",
+        "irrf_daytrade": "REAL", "irrf_outros": "REAL",
+        "prejuizo_acum_anter": "REAL", "imposto_devido": "REAL", "darfs_6015_pagos": "REAL",
+        "darf_6015": "REAL",
+    },
+    "pf_bens_direitos": {
+        "ano": "INTEGER", "grupo": "INTEGER", "codigo": "INTEGER", "discriminacao": "TEXT",
+        "doc_relacionado": "TEXT", "localizacao": "TEXT", "perc_part": "REAL", "data_aquisicao": "TEXT",
+        "situacao_ano_ant": "REAL", "situacao_ano": "REAL",
+    },
+}
+
+# Resumo por ano-calendário já calculado. Qualquer escrita em fontes/pagamentos/RV do ano
+# apaga a linha (triggers); resumo_anual() recalcula na próxima leitura e grava de novo.
+_RESUMO_FONTES = ("pf_fontes_pagadoras", "pf_pagamentos", "pf_rv_mensal")
+RESUMO_VERSAO = 2   # subir quando a regra de cálculo mudar (linhas antigas viram cache-miss)
+
+DDL_RESUMO_ANUAL = """
+CREATE TABLE IF NOT EXISTS pf_resumo_anual(
+  ano INTEGER PRIMARY KEY,
+  versao INTEGER NOT NULL,
+  rend_bruto REAL, irrf REAL, deducoes REAL, pgbl REAL, desconto_simplificado REAL,
+  base_completo REAL, base_simplificado REAL,
+  imposto_completo REAL, imposto_simplificado REAL,
+  recomendado TEXT, darf_bolsa REAL,
+  atualizado TEXT DEFAULT (datetime('now','localtime'))
+);
+""" + "".join(f"""
+DROP TRIGGER IF EXISTS trg_{t}_resumo_ai;
+CREATE TRIGGER trg_{t}_resumo_ai AFTER INSERT ON {t}
+BEGIN DELETE FROM pf_resumo_anual WHERE ano = NEW.ano; END;
+DROP TRIGGER IF EXISTS trg_{t}_resumo_au;
+CREATE TRIGGER trg_{t}_resumo_au AFTER UPDATE ON {t}
+BEGIN DELETE FROM pf_resumo_anual WHERE ano IN (OLD.ano, NEW.ano); END;
+DROP TRIGGER IF EXISTS trg_{t}_resumo_ad;
+CREATE TRIGGER trg_{t}_resumo_ad AFTER DELETE ON {t}
+BEGIN DELETE FROM pf_resumo_anual WHERE ano = OLD.ano; END;
+""" for t in _RESUMO_FONTES)
+
+_pf_ok = False
+
+def ensure_pf_schema(con=None):
+    """Cria/migra as tabelas pf_* e os índices UNIQUE das chaves (uma vez por processo)."""
+    global _pf_ok
+    if _pf_ok and con is None:
+        return
+    if con is None:
+        with db.connect() as c:
+            ensure_pf_schema(c)
+        _pf_ok = True
+        return
+    for t, cols in PF_COLUNAS.items():
+        defs = ", ".join(f'"{c}" {typ}' for c, typ in cols.items())
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{t}"(id INTEGER PRIMARY KEY AUTOINCREMENT, {defs})')
+        existentes = {c.lower() for c in db._table_columns(con, t)}
+        for c, typ in cols.items():
+            if c.lower() not in existentes:
+                con.execute(f'ALTER TABLE "{t}" ADD COLUMN "{c}" {typ}')
+        chave = ", ".join(f'"{k}"' for k in PF_CHAVES[t])
+        # bancos antigos podem ter duplicatas da chave: o upsert antigo só atualizava a de menor id.
+        # Só chaves completas (NULLs são distintos no índice UNIQUE); as removidas vão para <t>_duplicadas
+        completa = " AND ".join(f'"{k}" IS NOT NULL' for k in PF_CHAVES[t])
+        sobra = (f'{completa} AND id NOT IN (SELECT MIN(id) FROM "{t}" WHERE {completa} GROUP BY {chave})')
+        if con.execute(f'SELECT 1 FROM "{t}" WHERE {sobra} LIMIT 1').fetchone():
+            con.execute(f'CREATE TABLE IF NOT EXISTS "{t}_duplicadas" AS SELECT * FROM "{t}" WHERE 0')
+            comuns = ", ".join(f'"{c}"' for c in db._table_columns(con, f"{t}_duplicadas"))
+            n = con.execute(f'INSERT INTO "{t}_duplicadas" ({comuns}) SELECT {comuns} FROM "{t}" WHERE {sobra}').rowcount
+            con.execute(f'DELETE FROM "{t}" WHERE {sobra}')
+            print(f"[ir] {t}: {n} linha(s) duplicada(s) na chave movida(s) para {t}_duplicadas.")
+        con.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{t}_chave" ON "{t}"({chave})')
+    # pf_resumo_anual é só cache: com colunas desatualizadas, recria
+    if db._table_columns(con, "pf_resumo_anual") and "pgbl" not in db._table_columns(con, "pf_resumo_anual"):
+        con.execute("DROP TABLE pf_resumo_anual")
+    con.executescript(DDL_RESUMO_ANUAL)
+
 # --------- LOADS GENÉRICOS ----------
 def load_table(name):
     return db.load_table(name)
 
+def _cols_sql(cols):
+    return ", ".join(f'"{c}"' for c in cols)
+
+def _upsert_sql(table, cols, key_fields):
+    if table not in PF_CHAVES:
+        raise ValueError(f"tabela IR desconhecida: {table}")
+    chave = PF_CHAVES[table]
+    if key_fields and set(key_fields) != set(chave):
+        raise ValueError(f"{table}: chave deve ser {chave}")
+    faltam = [k for k in chave if k not in cols]
+    if faltam:
+        raise ValueError(f"{table}: payload sem campos da chave {faltam}")
+    sets = ", ".join(f'"{c}"=excluded."{c}"' for c in cols if c not in chave) or f'"{chave[0]}"=excluded."{chave[0]}"'
+    binds = ", ".join(f":{c}" for c in cols)
+    return (f'INSERT INTO "{table}" ({_cols_sql(cols)}) VALUES ({binds}) '
+            f'ON CONFLICT({_cols_sql(chave)}) DO UPDATE SET {sets}')
+
+def _py(v):
+    # numpy/pandas -> tipos que o sqlite3 aceita
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    if isinstance(v, pd.Timestamp):
+        return v.strftime("%Y-%m-%d")
+    return v.item() if hasattr(v, "item") else v
+
 def upsert_row(table, payload, key_fields=None):
     """
-    key_fields: lista de campos que definem unicidade (ano+mes+cnpj etc.)
-    Se existir, faz UPDATE; senão, INSERT.
+    key_fields: campos que definem unicidade (ano+mes+cnpj etc.) — precisam bater com PF_CHAVES.
+    INSERT … ON CONFLICT DO UPDATE pelo índice UNIQUE; retorna o id da linha.
     """
-    df = db.load_table(table)
-    if key_fields:
-        mask = pd.Series([True] * len(df))
-        for k in key_fields:
-            mask = mask & (df[k] == payload.get(k))
-        if df[mask].shape[0] > 0:
-            row_id = int(df[mask].iloc[0]["id"])
-            db.update_row(table, row_id, payload)
-            return row_id
-    return db.insert_row(table, payload)
+    ensure_pf_schema()
+    p = {k: _py(v) for k, v in payload.items()}
+    with db.connect() as con:
+        row_id = con.execute(_upsert_sql(table, list(p), key_fields) + " RETURNING id", p).fetchone()[0]
+    cache.bump(table)
+    _renovar_resumo(table, [p])
+    return int(row_id)
+
+def upsert_rows(table, rows, key_fields=None):
+    """Várias linhas (lista de dicts com as mesmas chaves) num único executemany/transação."""
+    rows = [{k: _py(v) for k, v in dict(r).items()} for r in rows or []]
+    if not rows:
+        return 0
+    ensure_pf_schema()
+    cols = list(rows[0].keys())
+    with db.connect() as con:
+        con.executemany(_upsert_sql(table, cols, key_fields), rows)
+    cache.bump(table)
+    _renovar_resumo(table, rows)
+    return len(rows)
+
+def _renovar_resumo(table, rows):
+    # o trigger já invalidou; recalcula agora para a troca de ano no assistente ser só leitura
+    if table in _RESUMO_FONTES:
+        for ano in {r.get("ano") for r in rows if r.get("ano") is not None}:
+            resumo_anual(ano)
+
+# --------- RESUMO ANUAL ----------
+def calcular_resumo(rend, irrf, dedu, pgbl=0.0, ano=None):
+    """Completo vs simplificado para os totais do ano (tabela progressiva de services.irpf)."""
+    c = irpf.cenarios(rend, irrf, dedu, pgbl, ano).iloc[0]
+    return {
+        "rend_bruto": float(rend), "irrf": float(irrf), "deducoes": float(dedu), "pgbl": float(pgbl),
+        "desconto_simplificado": float(c["desconto_simplificado"]),
+        "base_completo": float(c["base_completo"]), "base_simplificado": float(c["base_simplificado"]),
+        "imposto_completo": round(float(c["imposto_completo"]), 2),
+        "imposto_simplificado": round(float(c["imposto_simplificado"]), 2),
+        "recomendado": c["melhor"],
+    }
+
+def _totais_ano(con, ano):
+    # SUMs pelo prefixo 'ano' dos índices UNIQUE — sem carregar as tabelas
+    rend, irrf = con.execute("SELECT IFNULL(SUM(rend_bruto),0), IFNULL(SUM(irrf),0) "
+                             "FROM pf_fontes_pagadoras WHERE ano = ?", (ano,)).fetchone()
+    dedu, pgbl = con.execute(
+        "SELECT IFNULL(SUM(CASE WHEN codigo_pagamento = ? THEN 0 ELSE valor END),0), "
+        "       IFNULL(SUM(CASE WHEN codigo_pagamento = ? THEN valor ELSE 0 END),0) "
+        "FROM pf_pagamentos WHERE ano = ?", (CODIGO_PGBL, CODIGO_PGBL, ano)).fetchone()
+    darf = con.execute("SELECT IFNULL(SUM(darf_6015),0) FROM pf_rv_mensal WHERE ano = ?", (ano,)).fetchone()[0]
+    return float(rend), float(irrf), float(dedu), float(pgbl), float(darf)
+
+def resumo_anual(ano):
+    """Resumo do ano: uma linha de pf_resumo_anual; recalculada só se algum pf_* do ano mudou."""
+    ensure_pf_schema()
+    ano = int(ano)
+    with db.connect() as con:
+        con.row_factory = sqlite3.Row
+        row = con.execute("SELECT * FROM pf_resumo_anual WHERE ano = ? AND versao = ?", (ano, RESUMO_VERSAO)).fetchone()
+        if row is not None:
+            return dict(row)
+        rend, irrf, dedu, pgbl, darf = _totais_ano(con, ano)
+        r = {"ano": ano, "versao": RESUMO_VERSAO, **calcular_resumo(rend, irrf, dedu, pgbl, ano), "darf_bolsa": darf}
+        con.execute(f"INSERT OR REPLACE INTO pf_resumo_anual ({_cols_sql(r)}) "
+                    f"VALUES ({', '.join(':' + c for c in r)})", r)
+    return r
 
 # --------- TEXTOS “PRONTOS PARA DECLARAÇÃO” ----------
 def texto_bem_direito(row):
@@ -60,51 +245,168 @@ def texto_bem_direito(row):
             f"Informar situação em 31/12 do ano anterior e do ano-base. "
             f"Manter informes/corretoras como documentação de suporte.")
 
+def _brl(v):
+    return f"{float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
 def resumo_darf_bolsa_pf(row):
     mes = int(row["mes"])
     devido = float(row.get("imposto_devido") or 0)
     irrf = float(row.get("irrf_daytrade") or 0) + float(row.get("irrf_outros") or 0)
     codigo = DARF_CODIGOS["bolsa_pf"]
-    txt = (f"Mês {mes:02d}: Imposto devido R$ {devido:,.2f}. "
-           f"IRRF a compensar R$ {irrf:,.2f}. Emitir DARF código {codigo} "
-           f"no Sicalc até o último dia útil do mês seguinte.")
-    return txt.replace(",", "X").replace(".", ",").replace("X", ".")
+    darf = row.get("darf_6015")
+    valor = f"de R$ {_brl(darf)} " if darf else ""
+    return (f"Mês {mes:02d}: Imposto devido R$ {_brl(devido)}. "
+            f"IRRF a compensar R$ {_brl(irrf)}. Emitir DARF código {codigo} {valor}"
+            f"no Sicalc até o último dia útil do mês seguinte.")
+
+# --------- MOTOR DE APURAÇÃO (Bolsa PF) ----------
+# Lê os trades uma vez e apura mês a mês, para todos os anos (o prejuízo atravessa anos):
+#   - day-trade = min(compra, venda) do mesmo (ticker, dia); o resto é operação comum
+#   - custo médio ponderado por ticker (regra da RFB; taxas entram no custo/abatem a venda)
+#   - categorias com prejuízo compensável só entre si: ações comum (15%, isenção até 20k
+#     de vendas no mês), day-trade (20%), FII (20%)
+#   - IRRF ("dedo-duro") compensa no próprio ano; DARF 6015 abaixo de R$ 10 acumula
+# Resultado em cache até 'trades'/'ativos' mudarem.
+ALIQUOTAS = {"comum": 0.15, "daytrade": 0.20, "fii": 0.20}
+ISENCAO_VENDAS_ACOES = 20000.0
+DARF_MINIMO = 10.0
+IRRF_COMUM = 0.00005    # 0,005% sobre o valor de alienação
+IRRF_DAYTRADE = 0.01    # 1% sobre o resultado positivo
+
+def _trades_bolsa():
+    t = db.load_trades()
+    if t.empty:
+        return t
+    if "Ticker" not in t.columns and "ativo_id" in t.columns:
+        a = db.load_table("ativos")
+        a.columns = [str(c).lower() for c in a.columns]
+        t["Ticker"] = t["ativo_id"].map(a.set_index("id")["ticker"]) if {"id", "ticker"} <= set(a.columns) else None
+    t = t.dropna(subset=["data", "Ticker", "quantidade", "preco"]).copy()
+    t["Ticker"] = t["Ticker"].astype(str).str.upper().str.strip()
+    t["compra"] = t["tipo"].astype(str).str.upper().str.startswith("C")
+    t["taxas"] = pd.to_numeric(t.get("taxas"), errors="coerce").fillna(0.0) if "taxas" in t else 0.0
+    t["dia"] = t["data"].dt.normalize()
+    return t
+
+def _classe_fii(tickers):
+    """FII pela classe cadastrada em 'ativos'; sem cadastro, pelo sufixo 11 (heurística)."""
+    classes = {}
+    a = db.load_table("ativos")
+    if not a.empty:
+        cols = {str(c).lower(): c for c in a.columns}
+        if "ticker" in cols and "classe" in cols:
+            classes = dict(zip(a[cols["ticker"]].astype(str).str.upper(), a[cols["classe"]].astype(str).str.upper()))
+    return pd.Series([("FII" in classes[x]) if x in classes and classes[x] not in ("", "NONE", "NAN")
+                      else x.endswith("11") for x in tickers], index=tickers)
+
+def _operacoes_dia(t):
+    """Por (ticker, dia): separa day-trade (vetorizado) e sobras de compra/venda comuns."""
+    q = t["quantidade"].abs()
+    bruto = q * t["preco"]
+    t = t.assign(bq=q.where(t["compra"], 0.0), sq=q.where(~t["compra"], 0.0),
+                 bval=(bruto + t["taxas"]).where(t["compra"], 0.0),      # custo com taxas
+                 sval=(bruto - t["taxas"]).where(~t["compra"], 0.0),     # venda líquida
+                 sbruto=bruto.where(~t["compra"], 0.0))
+    d = t.groupby(["Ticker", "dia"], as_index=False)[["bq", "sq", "bval", "sval", "sbruto"]].sum()
+    dt_q = d[["bq", "sq"]].min(axis=1)
+    fb = (dt_q / d["bq"]).where(d["bq"] > 0, 0.0)
+    fs = (dt_q / d["sq"]).where(d["sq"] > 0, 0.0)
+    d["dt_vendas"] = d["sbruto"] * fs
+    d["dt_lucro"] = d["sval"] * fs - d["bval"] * fb
+    d["bq"], d["bval"] = d["bq"] - dt_q, d["bval"] * (1 - fb)
+    d["sq"], d["sval"], d["sbruto"] = d["sq"] - dt_q, d["sval"] * (1 - fs), d["sbruto"] * (1 - fs)
+    return d.sort_values(["Ticker", "dia"], kind="mergesort").reset_index(drop=True)
+
+def _custo_medio(d):
+    """Resultado das vendas comuns pelo preço médio (um laço por ticker sobre os dias com operação)."""
+    lucro = np.zeros(len(d))
+    bq, bval, sq, sval = (d[c].to_numpy(float) for c in ("bq", "bval", "sq", "sval"))
+    for idx in d.groupby("Ticker", sort=False).indices.values():
+        pos = custo = 0.0
+        for i in idx:
+            if bq[i] > 0:
+                pos += bq[i]; custo += bval[i]
+            if sq[i] > 0:
+                pm = custo / pos if pos > 1e-12 else 0.0
+                q = min(sq[i], pos)
+                lucro[i] = sval[i] - pm * q
+                pos -= q; custo -= pm * q
+    return lucro
+
+@memoize("trades", "ativos", maxsize=1)
+def apuracao_bolsa():
+    """Apuração mensal (todos os anos): vendas/lucro por categoria, prejuízos, IRRF, imposto e DARF 6015."""
+    t = _trades_bolsa()
+    if t.empty:
+        return pd.DataFrame()
+    d = _operacoes_dia(t)
+    d["lucro_comum"] = _custo_medio(d)
+    d["fii"] = d["Ticker"].map(_classe_fii(pd.Index(d["Ticker"].unique())))
+    d["mes"] = d["dia"].dt.to_period("M")
+    fii = d["fii"]
+    m = pd.DataFrame({
+        "mes": d["mes"],
+        "vendas_acoes_comum": d["sbruto"].where(~fii, 0.0), "lucro_acoes_comum": d["lucro_comum"].where(~fii, 0.0),
+        "vendas_daytrade": d["dt_vendas"].where(~fii, 0.0), "lucro_daytrade": d["dt_lucro"].where(~fii, 0.0),
+        "vendas_outros": (d["sbruto"] + d["dt_vendas"]).where(fii, 0.0),
+        "lucro_outros": (d["lucro_comum"] + d["dt_lucro"]).where(fii, 0.0),
+    }).groupby("mes").sum()
+    m = m[(m["vendas_acoes_comum"] + m["vendas_daytrade"] + m["vendas_outros"]) > 0]
+    if m.empty:
+        return pd.DataFrame()
+    m["irrf_outros"] = (m["vendas_acoes_comum"] + m["vendas_outros"]) * IRRF_COMUM
+    m["irrf_daytrade"] = m["lucro_daytrade"].clip(lower=0) * IRRF_DAYTRADE
+
+    # compensação de prejuízo / IRRF / DARF mínimo: dependem do mês anterior (poucas linhas)
+    isento = (m["vendas_acoes_comum"] <= ISENCAO_VENDAS_ACOES).to_numpy()
+    lucros = {"comum": m["lucro_acoes_comum"].to_numpy(), "daytrade": m["lucro_daytrade"].to_numpy(),
+              "fii": m["lucro_outros"].to_numpy()}
+    irrf = (m["irrf_outros"] + m["irrf_daytrade"]).to_numpy()
+    anos = m.index.year.to_numpy()
+    n = len(m)
+    saida = {k: np.zeros(n) for k in ("prejuizo_acum_anter", "base_calculo", "imposto_devido",
+                                      "irrf_compensado", "darf_6015", "prej_comum", "prej_daytrade", "prej_fii")}
+    prej = dict.fromkeys(ALIQUOTAS, 0.0)
+    irrf_saldo = pendente = 0.0
+    for i in range(n):
+        if i and anos[i] != anos[i - 1]:
+            irrf_saldo = 0.0
+        saida["prejuizo_acum_anter"][i] = sum(prej.values())
+        imposto = base_total = 0.0
+        for cat, aliq in ALIQUOTAS.items():
+            l = lucros[cat][i]
+            if l < 0:
+                prej[cat] -= l
+            elif l > 0 and not (cat == "comum" and isento[i]):
+                base = max(0.0, l - prej[cat]); prej[cat] = max(0.0, prej[cat] - l)
+                base_total += base; imposto += base * aliq
+        disp = irrf[i] + irrf_saldo
+        comp = min(disp, imposto); irrf_saldo = disp - comp
+        devido = imposto - comp + pendente
+        pagar = devido if devido >= DARF_MINIMO else 0.0
+        pendente = devido - pagar
+        saida["base_calculo"][i], saida["imposto_devido"][i] = base_total, imposto
+        saida["irrf_compensado"][i], saida["darf_6015"][i] = comp, round(pagar, 2)
+        saida["prej_comum"][i], saida["prej_daytrade"][i], saida["prej_fii"][i] = prej["comum"], prej["daytrade"], prej["fii"]
+    for k, v in saida.items():
+        m[k] = v
+    m = m.round(2)
+    m.insert(0, "ano", anos)
+    m.insert(1, "mes", m.index.month)
+    return m.reset_index(drop=True)
+
+PF_RV_CAMPOS = [
+    "ano", "mes", "vendas_acoes_comum", "lucro_acoes_comum", "vendas_daytrade", "lucro_daytrade",
+    "vendas_outros", "lucro_outros", "irrf_daytrade", "irrf_outros",
+    "prejuizo_acum_anter", "imposto_devido", "darf_6015",
+]
 
-# --------- CONSOLIDAÇÕES (ganchos nos seus dados) ----------
 def consolidar_pf_bolsa_auto(ano):
     """
-    Opcional: pré-preenche pf_rv_mensal usando suas tabelas 'trades' e 'proventos'.
-    Se não quiser ainda, pode ignorar. Depois a gente refina com XIRR/PM/Venda.
+    Linhas de pf_rv_mensal do ano a partir da apuração (cache). Não inclui 'darfs_6015_pagos',
+    que é informado pelo usuário — o rascunho não sobrescreve pagamentos.
     """
-    try:
-        trades = db.load_trades()
-    except Exception:
-        return pd.DataFrame()
-    if trades.empty:
-        return pd.DataFrame()
-    trades = trades[trades["Data"].dt.year == ano].copy()
-    trades["mes"] = trades["Data"].dt.month
-
-    # Simplificação: separa day trade vs comum por flag 'Tipo' (ex.: 'DT'/'C')
-    def _signed_val(r):
-        return r["Valor"] * (1 if r["Tipo"] in ("V", "VD") else -1)
-
-    agg = trades.groupby("mes").agg(vendas=("Valor", "sum")).reset_index()
-    # placeholders: lucros e IRRF devem vir do motor de apuração; aqui deixamos zeros
-    agg["vendas_acoes_comum"] = agg["vendas"]
-    agg["lucro_acoes_comum"] = 0.0
-    agg["vendas_daytrade"] = 0.0
-    agg["lucro_daytrade"] = 0.0
-    agg["vendas_outros"] = 0.0
-    agg["lucro_outros"] = 0.0
-    agg["irrf_daytrade"] = 0.0
-    agg["irrf_outros"] = 0.0
-    agg["prejuizo_acum_anter"] = 0.0
-    agg["imposto_devido"] = 0.0
-    agg["darfs_6015_pagos"] = 0.0
-    agg["ano"] = ano
-    return agg[[
-        "ano","mes","vendas_acoes_comum","lucro_acoes_comum","vendas_daytrade","lucro_daytrade",
-        "vendas_outros","lucro_outros","irrf_daytrade","irrf_outros",
-        "prejuizo_acum_anter","imposto_devido","darfs_6015_pagos"
-    ]]
+    ap = apuracao_bolsa()
+    if ap.empty:
+        return pd.DataFrame(columns=PF_RV_CAMPOS)
+    return ap.loc[ap["ano"] == int(ano), PF_RV_CAMPOS].reset_index(drop=True)
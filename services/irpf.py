@@ -0,0 +1,97 @@
+# services/irpf.py
+# Tabela progressiva anual do IRPF e avaliação vetorizada de cenários.
+#
+#   imposto(bases, ano)                -> imposto progressivo (np.searchsorted nas faixas)
+#   cenarios(rend, irrf, dedu, pgbl=…) -> completo x simplificado para N cenários de uma vez
+#   curva_pgbl(rend, irrf, dedu, ano)  -> aporte PGBL x imposto economizado (até o teto de 12%)
+#
+# Anos fora da tabela usam a faixa conhecida mais próxima (anterior ou posterior).
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+PGBL_TETO = 0.12                 # da renda tributável, só no modelo completo
+DESCONTO_SIMPLIFICADO = 0.20
+
+
+@dataclass(frozen=True)
+class TabelaIR:
+    limites: Tuple[float, ...]     # limite superior de cada faixa (a última é aberta)
+    aliquotas: Tuple[float, ...]   # len(limites) + 1
+    teto_simplificado: float
+
+    def __post_init__(self):
+        lim = np.asarray(self.limites, dtype=float)
+        aliq = np.asarray(self.aliquotas, dtype=float)
+        piso = np.concatenate([[0.0], lim])
+        # imposto acumulado no início de cada faixa
+        acum = np.concatenate([[0.0], np.cumsum(np.diff(piso) * aliq[:-1])])
+        object.__setattr__(self, "_lim", lim)
+        object.__setattr__(self, "_aliq", aliq)
+        object.__setattr__(self, "_piso", piso)
+        object.__setattr__(self, "_acum", acum)
+
+    def imposto(self, base) -> np.ndarray:
+        b = np.maximum(np.asarray(base, dtype=float), 0.0)
+        i = np.searchsorted(self._lim, b, side="left")     # faixa de cada base
+        return self._acum[i] + (b - self._piso[i]) * self._aliq[i]
+
+    def aliquota_marginal(self, base) -> np.ndarray:
+        return self._aliq[np.searchsorted(self._lim, np.maximum(np.asarray(base, dtype=float), 0.0), side="left")]
+
+
+_ALIQ = (0.0, 0.075, 0.15, 0.225, 0.275)
+
+# ano-calendário -> tabela anual
+TABELAS: Dict[int, TabelaIR] = {
+    **{a: TabelaIR((22847.76, 33919.80, 45012.60, 55976.16), _ALIQ, 16754.34) for a in range(2015, 2023)},
+    2023: TabelaIR((24511.92, 33919.80, 45012.60, 55976.16), _ALIQ, 16754.34),
+    2024: TabelaIR((26963.20, 33919.80, 45012.60, 55976.16), _ALIQ, 16754.34),
+}
+
+
+def tabela(ano) -> TabelaIR:
+    anos = sorted(TABELAS)
+    a = int(ano) if ano is not None else anos[-1]
+    return TABELAS.get(a) or TABELAS[anos[0] if a < anos[0] else anos[-1]]
+
+
+def imposto(bases, ano=None) -> np.ndarray:
+    return tabela(ano).imposto(bases)
+
+
+def cenarios(rend, irrf=0.0, deducoes=0.0, pgbl=0.0, ano=None) -> pd.DataFrame:
+    """
+    Completo x simplificado para arrays de cenários (broadcast entre os argumentos).
+    PGBL dedutível limitado a 12% da renda tributável; no simplificado o desconto é 20% (com teto).
+    Imposto = devido - IRRF (negativo = restituição).
+    """
+    t = tabela(ano)
+    rend, irrf, dedu, pgbl = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (rend, irrf, deducoes, pgbl)))
+    pgbl_ded = np.minimum(pgbl, PGBL_TETO * rend)
+    desconto = np.minimum(DESCONTO_SIMPLIFICADO * rend, t.teto_simplificado)
+    base_c = np.maximum(rend - dedu - pgbl_ded, 0.0)
+    base_s = np.maximum(rend - desconto, 0.0)
+    imp_c = t.imposto(base_c) - irrf
+    imp_s = t.imposto(base_s) - irrf
+    return pd.DataFrame({
+        "rend_bruto": rend.ravel(), "irrf": irrf.ravel(), "deducoes": dedu.ravel(),
+        "pgbl": pgbl.ravel(), "pgbl_dedutivel": pgbl_ded.ravel(), "desconto_simplificado": desconto.ravel(),
+        "base_completo": base_c.ravel(), "base_simplificado": base_s.ravel(),
+        "imposto_completo": imp_c.ravel(), "imposto_simplificado": imp_s.ravel(),
+        "aliquota_marginal": t.aliquota_marginal(base_c).ravel(),
+        "melhor": np.where(imp_c.ravel() < imp_s.ravel(), "Modelo Completo", "Modelo Simplificado"),
+        "imposto": np.minimum(imp_c, imp_s).ravel(),
+    })
+
+
+def curva_pgbl(rend, irrf=0.0, deducoes=0.0, ano=None, passos: int = 25) -> pd.DataFrame:
+    """Aporte PGBL (0 até 12% da renda) x imposto no melhor modelo e economia frente a não aportar."""
+    aportes = np.linspace(0.0, PGBL_TETO * float(rend or 0.0), max(int(passos), 2))
+    df = cenarios(rend, irrf, deducoes, aportes, ano)
+    df["economia"] = df["imposto"].iloc[0] - df["imposto"]
+    return df
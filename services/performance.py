@@ -5,10 +5,13 @@ import pandas as pd
 import numpy as np
 from typing import Tuple, Optional
 from services.db import load_trades, load_precos, load_proventos, load_ativos, load_benchmarks, save_portfolio_daily
+from services.cache import memoize
+from services import price_matrix, snapshot
 
 def _to_date(x): return pd.to_datetime(x, errors="coerce")
 
-def build_positions_daily(as_of: Optional[str] = None) -> pd.DataFrame:
+def build_positions_daily(as_of: Optional[str] = None, usar_snapshot: Optional[bool] = None,
+                          usar_matriz: Optional[bool] = None) -> pd.DataFrame:
     """
     Constrói série diária de:
       - vm_total: soma(qtd_dia * preço_dia) em BRL
@@ -16,37 +19,54 @@ def build_positions_daily(as_of: Optional[str] = None) -> pd.DataFrame:
       - retiradas: vendas líquidas (receita) do dia
       - proventos: proventos do dia
     Usa o último preço disponível (forward-fill) por ticker.
+    usar_snapshot: lê trades/preços/proventos de services.snapshot (padrão: FINANCE_SNAPSHOT).
+    usar_matriz: preços fatiados de services.price_matrix em vez do pivot (padrão: FINANCE_MATRIZ).
     """
     ativos = load_ativos()
-    trades = load_trades()
-    precos = load_precos()
-    prov = load_proventos()
+    matriz = price_matrix.abrir() if (price_matrix.ATIVO if usar_matriz is None else usar_matriz) else None
+    if snapshot.ATIVO if usar_snapshot is None else usar_snapshot:
+        snapshot.atualizar(("trades", "proventos") + (("precos",) if matriz is None else ()))
+        trades = snapshot.load_trades(refrescar=False)
+        precos = snapshot.load_precos(refrescar=False) if matriz is None else None
+        prov = snapshot.load_proventos(refrescar=False)
+    else:
+        trades, prov = load_trades(), load_proventos()
+        precos = load_precos() if matriz is None else None
+
+    if matriz is not None:
+        p_ini, p_fim = matriz.inicio, matriz.fim
+    elif not precos.empty:
+        p_ini, p_fim = precos["data"].min(), precos["data"].max()
+    else:
+        p_ini = p_fim = None
 
-    if trades.empty and precos.empty:
+    if trades.empty and p_ini is None:
         return pd.DataFrame(columns=["data","vm_total","aportes","retiradas","proventos"])
 
     # calendário
     min_d = min([d for d in [
         trades["data"].min() if not trades.empty else None,
-        precos["data"].min() if not precos.empty else None
-    ] if pd.notna(d)])
+        p_ini,
+    ] if d is not None and pd.notna(d)])
     end_d = _to_date(as_of) if as_of else max(trades["data"].max() if not trades.empty else pd.Timestamp.today(),
-                                              precos["data"].max() if not precos.empty else pd.Timestamp.today())
+                                              p_fim if p_fim is not None else pd.Timestamp.today())
     days = pd.date_range(min_d, end_d, freq="D")
 
     # Quantidades por ticker no tempo (cumsum)
     if not trades.empty:
         qmov = trades.copy()
         qmov["q"] = np.where(qmov["tipo"].str.upper()=="C", qmov["quantidade"].astype(float), -qmov["quantidade"].astype(float))
-        q_daily = (qmov.groupby(["Ticker","data"])["q"].sum().unstack(fill_value=0)
+        q_daily = (qmov.groupby(["Ticker","data"], observed=True)["q"].sum().unstack(fill_value=0)
                         .reindex(columns=days, fill_value=0))
         qpos = q_daily.cumsum(axis=1)
     else:
         qpos = pd.DataFrame(index=[], columns=days)
 
     # Preços por dia (forward fill)
-    if not precos.empty:
-        p = (precos.pivot_table(index="Ticker", columns="data", values="preco", aggfunc="last")
+    if matriz is not None:
+        p = matriz.janela(days[0], days[-1])   # já vem com ffill; view do memmap quando cabe
+    elif not precos.empty:
+        p = (precos.pivot_table(index="Ticker", columns="data", values="preco", aggfunc="last", observed=True)
                     .reindex(columns=days).sort_index(axis=1))
         p = p.ffill(axis=1)  # carrega último preço conhecido
     else:
@@ -140,8 +160,11 @@ def sharpe_ratio(returns_daily: np.ndarray, rf_daily: float = 0.0, trading_days:
     if vol == 0: return 0.0
     return float((mu * trading_days) / (vol * math.sqrt(trading_days)))
 
-def compute_metrics(as_of: Optional[str] = None, bench_serie: Optional[str] = None):
-    vm = build_positions_daily(as_of=as_of)
+# recalcula só quando alguma das tabelas de origem muda (ex.: scheduler de cotações -> 'precos')
+@memoize("trades", "precos", "proventos", "ativos", "benchmarks", maxsize=8)
+def compute_metrics(as_of: Optional[str] = None, bench_serie: Optional[str] = None,
+                    usar_snapshot: Optional[bool] = None, usar_matriz: Optional[bool] = None):
+    vm = build_positions_daily(as_of=as_of, usar_snapshot=usar_snapshot, usar_matriz=usar_matriz)
     if vm.empty:
         return {"twr":0.0,"irr":0.0,"vol":0.0,"dd":0.0,"sharpe":0.0}, vm, pd.DataFrame()
 
@@ -11,7 +11,7 @@ def compute_positions(trades: pd.DataFrame, prices: pd.DataFrame, ativos: pd.Dat
     """
     Calcula posições atuais por Ticker com PM (médio), VM e P/L não realizado.
     trades: [id, data, Ticker, ativo_id, tipo ('C'/'V'), quantidade, preco, taxas, descricao]
-    prices: [id, data, ativo_id, Ticker, preco]
+    prices: [id, data, ativo_id, Ticker, preco] ou uma MatrizPrecos (services.price_matrix)
     ativos: [id, ticker, nome, classe, categoria, corretora, liquidez, objetivo_pct]
     """
     if trades is None: trades = pd.DataFrame()
@@ -29,19 +29,23 @@ def compute_positions(trades: pd.DataFrame, prices: pd.DataFrame, ativos: pd.Dat
     t["taxas"] = pd.to_numeric(t.get("taxas", 0.0), errors="coerce").fillna(0.0)
     t = t.sort_values("data")
 
-    p = prices.copy()
-    if p.empty:
-        p = pd.DataFrame(columns=["data","Ticker","preco"])
-    p["data"] = _to_date(p["data"])
-    if as_of is not None:
-        as_of = _to_date(as_of)
-        p = p[p["data"] <= as_of]
-
-    # último preço por ticker
-    if not p.empty:
-        last_price = p.sort_values(["Ticker","data"]).groupby("Ticker", as_index=False).last()[["Ticker","preco"]]
+    if hasattr(prices, "ultimo"):
+        # MatrizPrecos (services.price_matrix): o último preço até as_of é uma linha do memmap
+        last_price = prices.ultimo(_to_date(as_of) if as_of is not None else None).reset_index()
     else:
-        last_price = pd.DataFrame(columns=["Ticker","preco"])
+        p = prices.copy()
+        if p.empty:
+            p = pd.DataFrame(columns=["data","Ticker","preco"])
+        p["data"] = _to_date(p["data"])
+        if as_of is not None:
+            as_of = _to_date(as_of)
+            p = p[p["data"] <= as_of]
+
+        # último preço por ticker
+        if not p.empty:
+            last_price = p.sort_values(["Ticker","data"]).groupby("Ticker", as_index=False, observed=True).last()[["Ticker","preco"]]
+        else:
+            last_price = pd.DataFrame(columns=["Ticker","preco"])
 
     # cadastro de ativos
     a = ativos.copy()
@@ -56,7 +60,9 @@ def compute_positions(trades: pd.DataFrame, prices: pd.DataFrame, ativos: pd.Dat
     # cálculo por ticker (PM médio e P/L realizado simples alocando taxas nas compras)
     rows = []
     realized_by_ticker: Dict[str, float] = {}
-    for tick, tx in t.groupby("Ticker"):
+    # dict e não 'in last_price["Ticker"].values': num Categorical o 'in' olha as categorias
+    preco_de = dict(zip(last_price["Ticker"].astype(str), last_price["preco"]))
+    for tick, tx in t.groupby("Ticker", observed=True):
         qty = 0.0
         cost = 0.0  # custo total de posição (para PM)
         realized = 0.0
@@ -81,8 +87,8 @@ def compute_positions(trades: pd.DataFrame, prices: pd.DataFrame, ativos: pd.Dat
                     cost -= min(cost, custo_saida)
         pm = cost / qty if qty else 0.0
         # preço de mercado: do prices; se não houver, usa último preço de trade
-        if tick in last_price["Ticker"].values:
-            price = float(last_price.loc[last_price["Ticker"] == tick, "preco"].iloc[0])
+        if tick in preco_de:
+            price = float(preco_de[tick])
         else:
             last_tr = tx.iloc[-1] if len(tx) else None
             price = float(last_tr["preco"]) if last_tr is not None else 0.0
@@ -0,0 +1,283 @@
+# services/price_matrix.py
+# Matriz de preços em disco (np.memmap): linhas = dias corridos, colunas = tickers,
+# fechamento com forward-fill (NaN antes da 1ª cotação). Serve fatias sem pivotar 'precos'.
+#
+#   m = abrir()                         # refresca se quotes mudou e mapeia o arquivo
+#   m.janela("2020-01-01", "2024-12-31") -> DataFrame tickers x dias (view do memmap quando cabe)
+#   m.ultimo("2024-06-30")              -> Series Ticker -> último preço até a data
+#   m.valores                           -> ndarray (dias x capacidade); m.valores[:, :n].T = tickers x dias
+#
+# 500 tickers x 20 anos = 7.300 x 512 float64 ≈ 30 MB no arquivo; só as páginas lidas vão para a RAM.
+# Incremental: triggers em quotes anotam (ticker_id, menor dia alterado) em matriz_suja; atualizar()
+# estende o arquivo com os dias novos e reescreve só o trecho [dia_min, fim] das colunas sujas.
+# Rebuild completo quando faltam colunas (capacidade), quando entra cotação antes do 1º dia ou
+# quando muda o dtype (FINANCE_MATRIZ_DTYPE=float32 reduz o arquivo à metade).
+#
+#   python -m services.price_matrix [--completo]
+#   FINANCE_MATRIZ=0 faz performance/portfolio voltarem ao pivot de db.load_precos.
+from __future__ import annotations
+
+import argparse, json, os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services import db, quotes
+
+ATIVO = os.environ.get("FINANCE_MATRIZ", "1").strip().lower() not in ("0", "false", "no")
+DTYPE = np.dtype(os.environ.get("FINANCE_MATRIZ_DTYPE", "float64").strip() or "float64")
+PASTA = Path(os.environ.get("FINANCE_MATRIZ_DIR", "").strip()
+             or db.DB_PATH.with_name(db.DB_PATH.stem + "_matriz"))
+ARQ_DADOS = PASTA / "precos.bin"
+ARQ_META = PASTA / "meta.json"
+
+DDL_MATRIZ = """
+CREATE TABLE IF NOT EXISTS matriz_suja (
+  ticker_id INTEGER PRIMARY KEY,
+  dia_min   INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS trg_matriz_quotes_ai AFTER INSERT ON quotes
+BEGIN
+  INSERT INTO matriz_suja(ticker_id, dia_min) VALUES (NEW.ticker_id, NEW.day)
+  ON CONFLICT(ticker_id) DO UPDATE SET dia_min = MIN(dia_min, excluded.dia_min);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_matriz_quotes_au AFTER UPDATE ON quotes
+BEGIN
+  INSERT INTO matriz_suja(ticker_id, dia_min) VALUES (OLD.ticker_id, MIN(OLD.day, NEW.day))
+  ON CONFLICT(ticker_id) DO UPDATE SET dia_min = MIN(dia_min, excluded.dia_min);
+  INSERT INTO matriz_suja(ticker_id, dia_min) VALUES (NEW.ticker_id, NEW.day)
+  ON CONFLICT(ticker_id) DO UPDATE SET dia_min = MIN(dia_min, excluded.dia_min);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_matriz_quotes_ad AFTER DELETE ON quotes
+BEGIN
+  INSERT INTO matriz_suja(ticker_id, dia_min) VALUES (OLD.ticker_id, OLD.day)
+  ON CONFLICT(ticker_id) DO UPDATE SET dia_min = MIN(dia_min, excluded.dia_min);
+END;
+"""
+
+
+def _dia_ts(dia: int) -> pd.Timestamp:
+    return pd.Timestamp(quotes.date_of(dia))
+
+
+@dataclass(frozen=True)
+class MatrizPrecos:
+    tickers: Tuple[str, ...]
+    dia0: int
+    valores: np.ndarray            # memmap (dias x capacidade); colunas além de len(tickers) = NaN
+
+    def __post_init__(self):
+        object.__setattr__(self, "_col", {t: j for j, t in enumerate(self.tickers)})
+
+    @property
+    def vazia(self) -> bool:
+        return not self.tickers or self.valores.shape[0] == 0
+
+    @property
+    def inicio(self) -> Optional[pd.Timestamp]:
+        return None if self.vazia else _dia_ts(self.dia0)
+
+    @property
+    def fim(self) -> Optional[pd.Timestamp]:
+        return None if self.vazia else _dia_ts(self.dia0 + self.valores.shape[0] - 1)
+
+    def _colunas(self, tickers: Optional[Iterable[str]]):
+        if tickers is None:
+            return list(self.tickers), slice(0, len(self.tickers))
+        nomes = [quotes.norm_ticker(t) for t in tickers]
+        return nomes, [self._col.get(t, -1) for t in nomes]
+
+    def janela(self, inicio, fim, tickers: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """
+        Preços (tickers x dias corridos de inicio a fim). Dias antes da matriz = NaN, depois = último
+        valor conhecido. Com tickers=None e o intervalo dentro da matriz o DataFrame é uma view.
+        """
+        d0, d1 = quotes.day_of(pd.Timestamp(inicio)), quotes.day_of(pd.Timestamp(fim))
+        dias = pd.date_range(_dia_ts(d0), _dia_ts(d1), freq="D")
+        nomes, cols = self._colunas(tickers)
+        if self.vazia or d1 < d0:
+            return pd.DataFrame(np.nan, index=nomes, columns=dias)
+        n = self.valores.shape[0]
+        a, b = d0 - self.dia0, d1 - self.dia0 + 1
+        if isinstance(cols, slice) and a >= 0 and b <= n:
+            return pd.DataFrame(self.valores[a:b, cols].T, index=nomes, columns=dias, copy=False)
+        linhas = np.arange(a, b)
+        c = np.arange(len(nomes)) if isinstance(cols, slice) else np.asarray(cols, dtype=np.int64)
+        bloco = np.array(self.valores[np.ix_(np.clip(linhas, 0, n - 1), np.maximum(c, 0))], dtype=float)
+        bloco[linhas < 0] = np.nan
+        bloco[:, c < 0] = np.nan
+        return pd.DataFrame(bloco.T, index=nomes, columns=dias)
+
+    def ultimo(self, data=None, tickers: Optional[Iterable[str]] = None) -> pd.Series:
+        """Último preço até 'data' (padrão: fim da matriz) por ticker; tickers sem cotação ficam de fora."""
+        nomes, cols = self._colunas(tickers)
+        if self.vazia:
+            return pd.Series(dtype=float, name="preco").rename_axis("Ticker")
+        i = self.valores.shape[0] - 1 if data is None else quotes.day_of(pd.Timestamp(data)) - self.dia0
+        if i < 0:
+            return pd.Series(dtype=float, name="preco").rename_axis("Ticker")
+        linha = np.array(self.valores[min(i, self.valores.shape[0] - 1)], dtype=float)
+        v = linha[cols] if isinstance(cols, slice) else np.where(np.asarray(cols) >= 0, linha[np.maximum(cols, 0)], np.nan)
+        s = pd.Series(v, index=pd.Index(nomes, name="Ticker"), name="preco")
+        return s.dropna()
+
+
+# ============================================================
+# Arquivo
+# ============================================================
+def _ler_meta() -> Optional[dict]:
+    try:
+        return json.loads(ARQ_META.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_meta(meta: dict) -> None:
+    tmp = ARQ_META.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, ARQ_META)
+
+
+def _mapear(meta: dict, modo: str = "r+") -> np.ndarray:
+    forma = (int(meta["dias"]), int(meta["capacidade"]))
+    if forma[0] == 0:
+        return np.empty((0, forma[1]), dtype=meta["dtype"])
+    return np.memmap(ARQ_DADOS, dtype=meta["dtype"], mode=modo, shape=forma)
+
+
+def _capacidade(n: int) -> int:
+    return max(64, -(-int(n * 1.25) // 64) * 64)      # folga de 25%, múltiplo de 64
+
+
+def _ffill(col: np.ndarray) -> np.ndarray:
+    ok = ~np.isnan(col)
+    idx = np.maximum.accumulate(np.where(ok, np.arange(col.size), 0))
+    out = col[idx]
+    out[: np.argmax(ok) if ok.any() else col.size] = np.nan
+    return out
+
+
+def _coluna(con, ticker_id: int, dia0: int, dias: int, desde: int) -> np.ndarray:
+    """Trecho [desde, dia0+dias) da coluna, com ffill a partir da última cotação anterior a 'desde'."""
+    n = dia0 + dias - desde
+    col = np.full(n, np.nan)
+    ant = con.execute("SELECT close FROM quotes WHERE ticker_id = ? AND day < ? ORDER BY day DESC LIMIT 1",
+                      (ticker_id, desde)).fetchone()
+    rows = con.execute("SELECT day, close FROM quotes WHERE ticker_id = ? AND day >= ? ORDER BY day",
+                       (ticker_id, desde)).fetchall()
+    if rows:
+        d = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)) - desde
+        col[d[d < n]] = np.fromiter((r[1] for r in rows), dtype=float, count=len(rows))[d < n]
+    if ant is not None and (not rows or rows[0][0] > desde):
+        col[0] = ant[0]
+    return _ffill(col)
+
+
+# ============================================================
+# Rebuild / refresh
+# ============================================================
+def _rebuild(con) -> dict:
+    ids = con.execute("""
+        SELECT t.id, t.ticker FROM quote_tickers t
+        WHERE EXISTS (SELECT 1 FROM quotes q WHERE q.ticker_id = t.id) ORDER BY t.ticker
+    """).fetchall()
+    dmin, dmax = con.execute("SELECT MIN(day), MAX(day) FROM quotes").fetchone()
+    PASTA.mkdir(parents=True, exist_ok=True)
+    meta = {"dtype": DTYPE.name, "dia0": int(dmin or 0), "dias": 0 if dmin is None else int(dmax - dmin + 1),
+            "capacidade": _capacidade(len(ids)), "tickers": [t for _, t in ids],
+            "ids": [int(i) for i, _ in ids]}
+    tmp = ARQ_DADOS.with_suffix(".tmp")
+    if meta["dias"]:
+        mm = np.memmap(tmp, dtype=DTYPE, mode="w+", shape=(meta["dias"], meta["capacidade"]))
+        mm[:] = np.nan
+        for j, (tid, _) in enumerate(ids):             # uma coluna por vez: memória ~ um ticker
+            mm[:, j] = _coluna(con, tid, meta["dia0"], meta["dias"], meta["dia0"])
+        mm.flush()
+        del mm
+        os.replace(tmp, ARQ_DADOS)
+    elif ARQ_DADOS.exists():
+        ARQ_DADOS.unlink()
+    _gravar_meta(meta)
+    return {"modo": "completo", "tickers": len(ids), "dias": meta["dias"]}
+
+
+def _estender(meta: dict, novos_dias: int) -> None:
+    antigos = meta["dias"]
+    linha = np.array(_mapear(meta)[antigos - 1]) if antigos else None
+    with open(ARQ_DADOS, "r+b" if ARQ_DADOS.exists() else "w+b") as f:
+        f.truncate((antigos + novos_dias) * meta["capacidade"] * DTYPE.itemsize)
+    meta["dias"] = antigos + novos_dias
+    mm = _mapear(meta)
+    mm[antigos:] = linha if linha is not None else np.nan     # dias novos herdam o último preço
+    mm.flush()
+
+
+def atualizar(completo: bool = False) -> dict:
+    """Aplica o que os triggers anotaram em matriz_suja (ou reconstrói). Retorna um resumo."""
+    db.ensure_core_schema()
+    with db.connect() as con:
+        con.executescript(DDL_MATRIZ)
+        con.execute("BEGIN IMMEDIATE")
+        meta = _ler_meta()
+        sujos = dict(con.execute("SELECT ticker_id, dia_min FROM matriz_suja").fetchall())
+        dmin, dmax = con.execute("SELECT MIN(day), MAX(day) FROM quotes").fetchone()
+        ids_novos = set(sujos) - set(meta["ids"]) if meta else set()
+        precisa_rebuild = (
+            completo or meta is None or meta["dtype"] != DTYPE.name or not ARQ_DADOS.exists() and meta["dias"]
+            or (dmin is not None and meta["dias"] and dmin < meta["dia0"])
+            or (dmin is not None and not meta["dias"])
+            or len(meta["ids"]) + len(ids_novos) > meta["capacidade"]
+        )
+        if precisa_rebuild:
+            r = _rebuild(con)
+        elif not sujos:
+            r = {"modo": "sem mudanças"}
+        else:
+            fim = meta["dia0"] + meta["dias"] - 1
+            if dmax is not None and dmax > fim:
+                _estender(meta, dmax - fim)
+            nomes = dict(con.execute("SELECT id, ticker FROM quote_tickers").fetchall())
+            for tid in sorted(ids_novos, key=lambda i: nomes.get(i, "")):
+                meta["ids"].append(int(tid)); meta["tickers"].append(nomes[tid])
+            mm = _mapear(meta)
+            col_de = {tid: j for j, tid in enumerate(meta["ids"])}
+            for tid, dia in sujos.items():
+                desde = max(int(dia), meta["dia0"])
+                mm[desde - meta["dia0"]:, col_de[tid]] = _coluna(con, tid, meta["dia0"], meta["dias"], desde)
+            mm.flush()
+            del mm
+            _gravar_meta(meta)
+            r = {"modo": "incremental", "colunas": len(sujos), "dias": meta["dias"]}
+        con.execute("DELETE FROM matriz_suja")
+    return r
+
+
+def abrir(refrescar: bool = True) -> MatrizPrecos:
+    """Mapeia a matriz (somente leitura; escrita em fatias vira cópia privada)."""
+    if refrescar:
+        db.ensure_core_schema()
+        with db.connect() as con:
+            con.executescript(DDL_MATRIZ)
+            pendente = con.execute("SELECT EXISTS(SELECT 1 FROM matriz_suja)").fetchone()[0]
+        if pendente or _ler_meta() is None:
+            atualizar()
+    meta = _ler_meta() or {"dtype": DTYPE.name, "dia0": 0, "dias": 0, "capacidade": 0, "tickers": []}
+    return MatrizPrecos(tuple(meta["tickers"]), int(meta["dia0"]), _mapear(meta, "c"))
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Reconstrói/atualiza a matriz de preços em memmap (dias x tickers).")
+    ap.add_argument("--completo", action="store_true", help="reconstrói do zero")
+    args = ap.parse_args(argv)
+    print(atualizar(args.completo))
+    m = abrir(refrescar=False)
+    if not m.vazia:
+        print(f"{len(m.tickers)} tickers, {m.inicio.date()} .. {m.fim.date()}, "
+              f"{m.valores.nbytes / 1e6:.1f} MB em {ARQ_DADOS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# services/profiler.py
+# Instrumentação dos callbacks Dash: tempo, bytes de entrada/saída e input que disparou cada chamada.
+#
+#   instrumentar(app)   # em app.py; envolve cada callback registrado (app.callback e dash.callback)
+#
+#   GET /__perf               -> JSON: chamadas, erros, p50/p90/p99/máx (ms), bytes médios, últimos gatilhos
+#                                (+ sql_top: db.sql_resumo das consultas que passaram por db.connect)
+#   GET /__perf?perfil=1      -> inclui o cProfile (texto pstats) das N chamadas mais lentas
+#   GET /__perf?reset=1       -> zera as janelas
+#
+#   FINANCE_PERF=0              desliga tudo (sem wrapper, sem rota)
+#   FINANCE_PERF_PROFILE=N      guarda cProfile das N chamadas mais lentas (padrão 0 = sem cProfile)
+#   FINANCE_PERF_PUBLICO=1      libera /__perf fora de localhost
+#
+# Percentis sobre uma janela móvel (deque) por callback, calculados só quando a rota é lida.
+from __future__ import annotations
+
+import cProfile, functools, heapq, io, itertools, os, pstats, sys, threading, time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Tuple
+
+import numpy as np
+
+JANELA = 500
+_ATIVO = os.environ.get("FINANCE_PERF", "1").strip().lower() not in ("0", "false", "no")
+_N_PERFIS = int(os.environ.get("FINANCE_PERF_PROFILE", "0") or 0)
+_PUBLICO = os.environ.get("FINANCE_PERF_PUBLICO", "").strip().lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_tempos: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=JANELA))
+_bytes_in: Dict[str, Deque[int]] = defaultdict(lambda: deque(maxlen=JANELA))
+_bytes_out: Dict[str, Deque[int]] = defaultdict(lambda: deque(maxlen=JANELA))
+_gatilhos: Dict[str, Deque[str]] = defaultdict(lambda: deque(maxlen=10))
+_chamadas: Dict[str, int] = defaultdict(int)
+_erros: Dict[str, int] = defaultdict(int)
+_perfis: List[Tuple[float, int, str, str, str]] = []     # min-heap (ms, seq, callback, gatilho, pstats)
+_seq = itertools.count()
+
+
+def _nome(output_key: str) -> str:
+    return output_key.strip(".").replace("...", " | ")
+
+
+def registrar(cb: str, ms: float, b_in: int, b_out: int, gatilho: str, erro: bool = False) -> None:
+    with _lock:
+        _chamadas[cb] += 1
+        _tempos[cb].append(ms)
+        _bytes_in[cb].append(b_in)
+        _bytes_out[cb].append(b_out)
+        _gatilhos[cb].append(gatilho)
+        if erro:
+            _erros[cb] += 1
+
+
+def _guardar_perfil(prof: cProfile.Profile, ms: float, cb: str, gatilho: str) -> None:
+    with _lock:
+        if len(_perfis) >= _N_PERFIS and ms <= _perfis[0][0]:
+            return
+    s = io.StringIO()
+    pstats.Stats(prof, stream=s).sort_stats("cumulative").print_stats(25)
+    with _lock:
+        item = (ms, next(_seq), cb, gatilho, s.getvalue())
+        if len(_perfis) < _N_PERFIS:
+            heapq.heappush(_perfis, item)
+        elif ms > _perfis[0][0]:
+            heapq.heapreplace(_perfis, item)
+
+
+def _envolver(cb_key: str, func):
+    if getattr(func, "__perf__", False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        import flask
+        g = kwargs.get("callback_context")
+        trig = ",".join(t.get("prop_id", "") for t in (getattr(g, "triggered_inputs", None) or [])) or "inicial"
+        b_in = flask.request.content_length or 0 if flask.has_request_context() else 0
+        prof = cProfile.Profile() if _N_PERFIS > 0 else None
+        t0 = time.perf_counter()
+        erro = False
+        out = None
+        try:
+            if prof is not None:
+                prof.enable()
+            out = func(*args, **kwargs)
+            return out
+        except Exception as e:
+            # PreventUpdate/NoUpdate são controle de fluxo do Dash, não erro do callback
+            erro = type(e).__name__ not in ("PreventUpdate", "NoUpdate")
+            raise
+        finally:
+            if prof is not None:
+                prof.disable()
+            ms = (time.perf_counter() - t0) * 1000.0
+            b_out = len(out) if isinstance(out, (str, bytes)) else 0
+            registrar(cb_key, ms, b_in, b_out, trig, erro)
+            if prof is not None:
+                _guardar_perfil(prof, ms, cb_key, trig)
+
+    wrapper.__perf__ = True
+    return wrapper
+
+
+def _instrumentar_mapa(app) -> None:
+    for key, cb in list(app.callback_map.items()):
+        f = cb.get("callback")
+        if f is not None and not getattr(f, "__perf__", False):
+            cb["callback"] = _envolver(key, f)
+
+
+def _pct(v) -> dict:
+    a = np.fromiter(v, dtype=float)
+    if not a.size:
+        return {}
+    p50, p90, p99 = np.percentile(a, [50, 90, 99])
+    return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2), "max_ms": round(a.max(), 2)}
+
+
+def relatorio(com_perfis: bool = False) -> dict:
+    with _lock:
+        snap = {k: (list(_tempos[k]), list(_bytes_in[k]), list(_bytes_out[k]), list(_gatilhos[k]),
+                    _chamadas[k], _erros[k]) for k in _tempos}
+        perfis = sorted(_perfis, reverse=True)
+    cbs = []
+    for k, (t, bi, bo, gat, n, err) in snap.items():
+        cbs.append({"callback": _nome(k), "chamadas": n, "erros": err, "janela": len(t), **_pct(t),
+                    "bytes_in_medio": int(np.mean(bi)) if bi else 0,
+                    "bytes_out_medio": int(np.mean(bo)) if bo else 0,
+                    "ultimos_gatilhos": gat[-3:]})
+    cbs.sort(key=lambda c: c.get("p90_ms", 0.0), reverse=True)
+    out = {"janela": JANELA, "callbacks": cbs}
+    dash_mod = sys.modules.get("components.dashboards")
+    if dash_mod is not None and hasattr(dash_mod, "tempos_recentes"):
+        recentes = dash_mod.tempos_recentes(10)
+        if recentes:
+            out["dashboards_etapas_ms"] = recentes
+    db_mod = sys.modules.get("services.db")
+    if db_mod is not None and hasattr(db_mod, "sql_resumo"):
+        sql = db_mod.sql_resumo(10)
+        if not sql.empty:
+            out["sql_top"] = sql.round(2).astype(object).where(sql.notna(), None).to_dict("records")
+    if _N_PERFIS:
+        out["perfis_mais_lentos"] = [{"callback": _nome(cb), "ms": round(ms, 2), "gatilho": gat,
+                                      **({"pstats": txt} if com_perfis else {})}
+                                     for ms, _, cb, gat, txt in perfis]
+    return out
+
+
+def reset() -> None:
+    with _lock:
+        for d in (_tempos, _bytes_in, _bytes_out, _gatilhos, _chamadas, _erros):
+            d.clear()
+        _perfis.clear()
+
+
+def instrumentar(app) -> None:
+    """Liga a instrumentação no app Dash (idempotente)."""
+    if not _ATIVO or getattr(app, "_perf_instrumentado", False):
+        return
+    app._perf_instrumentado = True
+    server = app.server
+
+    # registrado depois do _setup_server do Dash: o callback_map já inclui os dash.callback globais
+    @server.before_request
+    def _perf_wrap():
+        if any(not getattr(c.get("callback"), "__perf__", False) for c in app.callback_map.values()):
+            _instrumentar_mapa(app)
+
+    @server.route("/__perf")
+    def _perf_rota():
+        import flask
+        if not _PUBLICO and flask.request.remote_addr not in ("127.0.0.1", "::1", None):
+            flask.abort(404)
+        if flask.request.args.get("reset"):
+            reset()
+        return flask.jsonify(relatorio(com_perfis=bool(flask.request.args.get("perfil"))))
@@ -0,0 +1,234 @@
+# services/quotes.py
+# Armazenamento canônico de cotações diárias.
+#
+#   quote_tickers(id, ticker)                      -- dicionário de tickers
+#   quotes(ticker_id, day, close, source)          -- WITHOUT ROWID, PK (ticker_id, day)
+#
+# 'day' = dias desde 1970-01-01 (inteiro). A PK cobre as leituras por ticker/intervalo:
+# o fechamento mora na própria folha da árvore, sem lookup extra.
+# Substitui 'cotacoes' (sync_quotes) e as duas variantes de 'precos'
+# (Data/Ticker/Close do db.py e data/ativo_id/preco do upgrade_portfolio_db).
+#
+# Não importa nada de 'services' para poder ser usado pelos scripts executados direto.
+#   python services/quotes.py --db finance.db --migrate
+from __future__ import annotations
+
+import argparse, datetime as dt, sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+DateLike = Union[str, dt.date, dt.datetime]
+
+_EPOCH_ORD = dt.date(1970, 1, 1).toordinal()
+_JD_EPOCH = 2440587.5          # julianday('1970-01-01')
+_SQL_MAX_VARS = 900
+
+DDL_QUOTES = """
+CREATE TABLE IF NOT EXISTS quote_tickers (
+  id     INTEGER PRIMARY KEY,
+  ticker TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS quotes (
+  ticker_id INTEGER NOT NULL REFERENCES quote_tickers(id),
+  day       INTEGER NOT NULL,
+  close     REAL    NOT NULL,
+  source    TEXT,
+  PRIMARY KEY (ticker_id, day)
+) WITHOUT ROWID;
+"""
+
+# ======== Conversões ========
+def day_of(d: DateLike) -> int:
+    if isinstance(d, dt.datetime):
+        d = d.date()
+    elif isinstance(d, str):
+        d = dt.date.fromisoformat(d.strip()[:10])
+    elif hasattr(d, "date") and not isinstance(d, dt.date):  # pandas.Timestamp
+        d = d.date()
+    return d.toordinal() - _EPOCH_ORD
+
+
+def day_of_lenient(d) -> Optional[int]:
+    """day_of que aceita também DD/MM/AAAA e devolve None para o que não for data."""
+    try:
+        return day_of(d)
+    except (ValueError, TypeError, AttributeError):
+        pass
+    for fmt in ("%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y"):
+        try:
+            return day_of(dt.datetime.strptime(str(d).strip()[:10], fmt))
+        except ValueError:
+            continue
+    return None
+
+
+def date_of(day: int) -> dt.date:
+    return dt.date.fromordinal(int(day) + _EPOCH_ORD)
+
+
+def norm_ticker(t: str) -> str:
+    t = str(t or "").strip().upper()
+    return t[:-3] if t.endswith(".SA") else t
+
+
+def _chunks(seq: Sequence, n: int = _SQL_MAX_VARS):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+# ======== Schema / migração ========
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+
+def _cols(conn: sqlite3.Connection, table: str) -> set:
+    return {str(r[1]).lower() for r in conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+
+
+def ensure_quote_schema(conn: sqlite3.Connection) -> None:
+    """Cria o store; na primeira vez, importa o que houver nas tabelas antigas."""
+    novo = not _table_exists(conn, "quotes")
+    conn.executescript(DDL_QUOTES)
+    if novo:
+        migrate_legacy(conn)
+
+
+def migrate_legacy(conn: sqlite3.Connection) -> int:
+    """
+    Copia cotacoes/precos para 'quotes' (INSERT OR IGNORE: não sobrescreve o que já existe).
+    Linhas com data/preço ilegível são puladas (contadas no aviso), sem abortar a migração.
+    """
+    fontes: List[str] = []
+    if _table_exists(conn, "cotacoes"):
+        fontes.append("SELECT ticker, data, preco_brl, COALESCE(fonte, 'cotacoes') FROM cotacoes")
+    if _table_exists(conn, "precos"):
+        cols = _cols(conn, "precos")
+        if {"ticker", "close"} <= cols:
+            fontes.append("SELECT Ticker, Data, Close, 'precos' FROM precos "
+                          "WHERE Ticker IS NOT NULL AND Close IS NOT NULL")
+        if {"ativo_id", "preco"} <= cols and _table_exists(conn, "ativos"):
+            fontes.append("SELECT a.ticker, p.data, p.preco, 'precos' FROM precos p "
+                          "JOIN ativos a ON a.id = p.ativo_id WHERE p.preco IS NOT NULL")
+    n = ruins = 0
+    for sql in fontes:
+        rows = []
+        for t, d, px, src in conn.execute(sql).fetchall():
+            if not t or not d or px is None:
+                continue
+            day = day_of_lenient(d)
+            try:
+                px = float(px)
+            except (TypeError, ValueError):
+                day = None
+            if day is None:
+                ruins += 1
+                continue
+            rows.append((t, date_of(day), px, src))
+        n += upsert_quotes(conn, rows, overwrite=False)
+    if ruins:
+        print(f"[quotes] migração: {ruins} linha(s) antiga(s) com data/preço inválido ignorada(s).")
+    return n
+
+# ======== Escrita ========
+def ticker_ids(conn: sqlite3.Connection, tickers: Iterable[str], create: bool = True) -> Dict[str, int]:
+    """ticker normalizado -> id (uma consulta por bloco; cria os que faltarem se create=True)."""
+    wanted = sorted({norm_ticker(t) for t in tickers if t})
+    out: Dict[str, int] = {}
+    for part in _chunks(wanted):
+        q = ",".join("?" * len(part))
+        out.update({t: int(i) for i, t in conn.execute(
+            f"SELECT id, ticker FROM quote_tickers WHERE ticker IN ({q})", part)})
+    missing = [t for t in wanted if t not in out]
+    if missing and create:
+        conn.executemany("INSERT OR IGNORE INTO quote_tickers (ticker) VALUES (?)", [(t,) for t in missing])
+        out.update(ticker_ids(conn, missing, create=False))
+    return out
+
+
+def upsert_quotes(conn: sqlite3.Connection, rows: Iterable[Tuple[str, DateLike, float, Optional[str]]],
+                  overwrite: bool = True) -> int:
+    """
+    Grava [(ticker, data, close, source), ...] com um executemany.
+    Não faz commit: quem chama controla a transação.
+    """
+    rows = [(norm_ticker(t), day_of(d), float(px), src) for t, d, px, src in rows]
+    if not rows:
+        return 0
+    ids = ticker_ids(conn, [r[0] for r in rows])
+    params = [(ids[t], day, px, src) for t, day, px, src in rows]
+    if overwrite:
+        conn.executemany("""
+            INSERT INTO quotes (ticker_id, day, close, source) VALUES (?, ?, ?, ?)
+            ON CONFLICT(ticker_id, day) DO UPDATE SET close=excluded.close, source=excluded.source
+        """, params)
+    else:
+        conn.executemany("INSERT OR IGNORE INTO quotes (ticker_id, day, close, source) VALUES (?, ?, ?, ?)", params)
+    return len(params)
+
+
+def delete_quotes(conn: sqlite3.Connection, keys: Iterable[Tuple[str, DateLike]]) -> int:
+    keys = [(norm_ticker(t), day_of(d)) for t, d in keys if t and d]
+    if not keys:
+        return 0
+    ids = ticker_ids(conn, [t for t, _ in keys], create=False)
+    params = [(ids[t], day) for t, day in keys if t in ids]
+    if not params:
+        return 0
+    # chaves numa tabela temporária e um único DELETE pela PK
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _sel_quotes(ticker_id INTEGER, day INTEGER, "
+                 "PRIMARY KEY (ticker_id, day)) WITHOUT ROWID")
+    conn.execute("DELETE FROM temp._sel_quotes")
+    conn.executemany("INSERT OR IGNORE INTO temp._sel_quotes(ticker_id, day) VALUES (?, ?)", params)
+    return len(conn.execute("DELETE FROM quotes WHERE (ticker_id, day) IN "
+                            "(SELECT ticker_id, day FROM temp._sel_quotes) RETURNING day").fetchall())
+
+
+def clear_quotes(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM quotes")
+
+# ======== Leitura ========
+def read_quotes(conn: sqlite3.Connection, tickers: Optional[Iterable[str]] = None,
+                start: Optional[DateLike] = None, end: Optional[DateLike] = None
+                ) -> List[Tuple[str, str, float, Optional[str]]]:
+    """[(ticker, data_iso, close, source), ...] ordenado por ticker/data."""
+    where, params = [], []
+    if tickers is not None:
+        ids = list(ticker_ids(conn, tickers, create=False).values())
+        if not ids:
+            return []
+        where.append(f"q.ticker_id IN ({','.join('?' * len(ids))})"); params += ids
+    if start is not None:
+        where.append("q.day >= ?"); params.append(day_of(start))
+    if end is not None:
+        where.append("q.day <= ?"); params.append(day_of(end))
+    sql = (f"SELECT t.ticker, date(q.day + {_JD_EPOCH}), q.close, q.source "
+           "FROM quotes q JOIN quote_tickers t ON t.id = q.ticker_id")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY t.ticker, q.day"
+    return conn.execute(sql, params).fetchall()
+
+
+def quote_days(conn: sqlite3.Connection, ticker: str, start: DateLike, end: DateLike) -> set:
+    """Dias (inteiros) com cotação para um ticker no intervalo — varredura só na PK."""
+    ids = ticker_ids(conn, [ticker], create=False)
+    if not ids:
+        return set()
+    return {d for (d,) in conn.execute(
+        "SELECT day FROM quotes WHERE ticker_id=? AND day BETWEEN ? AND ?",
+        (next(iter(ids.values())), day_of(start), day_of(end)))}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Store canônico de cotações (quotes).")
+    ap.add_argument("--db", required=True)
+    ap.add_argument("--migrate", action="store_true", help="reimporta cotacoes/precos antigos (sem sobrescrever)")
+    args = ap.parse_args()
+    con = sqlite3.connect(args.db)
+    try:
+        with con:
+            ensure_quote_schema(con)
+            if args.migrate:
+                print(f"{migrate_legacy(con)} linha(s) lidas das tabelas antigas.")
+        n, = con.execute("SELECT COUNT(*) FROM quotes").fetchone()
+        print(f"quotes: {n} linha(s).")
+    finally:
+        con.close()
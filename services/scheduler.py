@@ -0,0 +1,136 @@
+# services/scheduler.py
+# Sincronização periódica de cotações dentro do servidor Dash (thread daemon).
+#
+# Configuração por variáveis de ambiente (mesmo padrão do FINANCE_DB):
+#   FINANCE_SYNC_ENABLED   "1" liga (padrão), "0" desliga
+#   FINANCE_SYNC_INTERVAL  segundos entre execuções (padrão 900)
+#   FINANCE_SYNC_JITTER    segundos aleatórios somados ao intervalo (padrão 60)
+#   FINANCE_SYNC_ALWAYS    "1" ignora o horário do pregão
+from __future__ import annotations
+
+import datetime as dt
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from services import cache
+
+try:
+    from zoneinfo import ZoneInfo
+    _TZ_B3 = ZoneInfo("America/Sao_Paulo")
+except Exception:  # tzdata ausente (Windows sem o pacote)
+    _TZ_B3 = dt.timezone(dt.timedelta(hours=-3))
+
+# pregão regular + margem para o fechamento/leilão
+PREGAO_INICIO = dt.time(10, 0)
+PREGAO_FIM = dt.time(18, 0)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+def em_pregao(agora: Optional[dt.datetime] = None) -> bool:
+    """Dia útil entre PREGAO_INICIO e PREGAO_FIM no horário de Brasília (feriados não são tratados)."""
+    agora = agora or dt.datetime.now(_TZ_B3)
+    return agora.weekday() < 5 and PREGAO_INICIO <= agora.time() <= PREGAO_FIM
+
+
+class QuoteScheduler:
+    """
+    Executa `job()` a cada `interval` (+ jitter) segundos numa thread daemon.
+    Execuções sobrepostas são coalescidas: se uma já está rodando, o disparo é ignorado.
+    Ao terminar com sucesso, invalida apenas os caches dependentes de preço.
+    """
+
+    def __init__(self, job: Callable[[], None], interval: int = 900, jitter: int = 60,
+                 only_trading_hours: bool = True):
+        self.job = job
+        self.interval = max(30, int(interval))
+        self.jitter = max(0, int(jitter))
+        self.only_trading_hours = only_trading_hours
+        self.last_run: Optional[dt.datetime] = None
+        self.last_error: Optional[str] = None
+        self._running = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_now(self) -> bool:
+        """Roda o job já; retorna False se outra execução estava em andamento."""
+        if not self._running.acquire(blocking=False):
+            return False
+        try:
+            self.job()
+            self.last_error = None
+            cache.bump(*cache.PRICE_TAGS)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[scheduler] falha na sincronização: {self.last_error}")
+        finally:
+            self.last_run = dt.datetime.now()
+            self._running.release()
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if not self.only_trading_hours or em_pregao():
+                self.run_now()
+            espera = self.interval + random.uniform(0, self.jitter)
+            if self._stop.wait(espera):
+                break
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="quote-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+def _sync_quotes_job() -> None:
+    from services.db import DB_PATH
+    from services.sync_quotes import sync
+    t0 = time.perf_counter()
+    sync(str(DB_PATH))
+    print(f"[scheduler] cotações sincronizadas em {time.perf_counter() - t0:.1f}s")
+    try:
+        from services import price_matrix
+        if price_matrix.ATIVO:
+            price_matrix.atualizar()      # só as colunas/dias que o sync tocou
+    except Exception as e:                # a matriz é derivada; abrir() tenta de novo na leitura
+        print(f"[scheduler] matriz de preços não atualizada: {type(e).__name__}: {e}")
+    try:
+        from services import snapshot
+        if snapshot.ATIVO:
+            snapshot.atualizar(("precos",))   # leitores encontram o snapshot em dia, sem trava
+    except Exception as e:
+        print(f"[scheduler] snapshot de preços não atualizado: {type(e).__name__}: {e}")
+
+
+_scheduler: Optional[QuoteScheduler] = None
+
+
+def start_quote_scheduler() -> Optional[QuoteScheduler]:
+    """Liga o scheduler global (idempotente). Retorna None se desativado por ambiente."""
+    global _scheduler
+    if os.environ.get("FINANCE_SYNC_ENABLED", "1").strip() == "0":
+        return None
+    if _scheduler is None:
+        _scheduler = QuoteScheduler(
+            _sync_quotes_job,
+            interval=_env_int("FINANCE_SYNC_INTERVAL", 900),
+            jitter=_env_int("FINANCE_SYNC_JITTER", 60),
+            only_trading_hours=os.environ.get("FINANCE_SYNC_ALWAYS", "0").strip() != "1",
+        )
+    _scheduler.start()
+    return _scheduler
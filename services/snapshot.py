@@ -0,0 +1,382 @@
+# services/snapshot.py
+# Snapshot colunar das tabelas analíticas, particionado por ano, para leituras pesadas
+# (rollups de vários anos, backtests) sem passar por pd.read_sql_query.
+#
+#   <banco>_snapshot/<tabela>/ano=2024.parquet          (pyarrow instalado)
+#   <banco>_snapshot/<tabela>/ano=2024/<coluna>.npy     (fallback numpy: uma coluna por arquivo)
+#
+#   atualizar()                  -> refresca só o que mudou (retorna {tabela: anos reescritos})
+#   carregar("despesas", anos=…) -> DataFrame com Data já em datetime64
+#   load_trades() / load_precos() / load_proventos()
+#                                -> mesmas colunas de db.load_*; servem direto para
+#                                   performance.build_positions_daily e portfolio.compute_positions
+#
+# Incremental: snapshot_estado guarda a maior chave (id; 'day' nas cotações) já exportada.
+# Linhas novas acima dela apontam os anos a reescrever; triggers marcam em snapshot_sujo o
+# ano de UPDATE/DELETE e de INSERT abaixo da marca (ex.: backfill de cotações antigas).
+# Leitura não trava o banco: snapshot_estado.versao guarda o contador de cache_versao da
+# exportação; se ainda bate e snapshot_sujo está vazio, nada a fazer (só lookups por PK).
+# BEGIN IMMEDIATE só quando há o que refrescar — em geral já feito pelo scheduler após o sync.
+# Leitura sem cópia: .npy via np.load(mmap_mode="c"; escrita vira cópia privada), parquet via pyarrow com memory_map;
+# com várias partições sobra um único concat.
+#
+#   python -m services.snapshot [--tabelas trades,precos] [--completo]
+#   FINANCE_SNAPSHOT=1 faz performance.build_positions_daily ler daqui por padrão.
+from __future__ import annotations
+
+import argparse, json, os, shutil, sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services import db, quotes
+
+ATIVO = os.environ.get("FINANCE_SNAPSHOT", "").strip().lower() in ("1", "true", "yes")
+PASTA = Path(os.environ.get("FINANCE_SNAPSHOT_DIR", "").strip()
+             or db.DB_PATH.with_name(db.DB_PATH.stem + "_snapshot"))
+
+try:
+    import pyarrow.parquet as _pq
+    FORMATO = "parquet"
+except Exception:
+    _pq = None
+    FORMATO = "npy"
+
+# 'precos' vem do store canônico (quotes, chave 'day'); as demais usam id/Data
+TABELAS = ("receitas", "despesas", "investimentos", "trades", "proventos", "precos")
+
+DDL_SNAPSHOT = """
+CREATE TABLE IF NOT EXISTS snapshot_estado (
+  tabela    TEXT PRIMARY KEY,
+  chave_max INTEGER,
+  formato   TEXT,
+  linhas    INTEGER,
+  versao    INTEGER,
+  atualizado TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE TABLE IF NOT EXISTS snapshot_sujo (
+  tabela TEXT NOT NULL,
+  ano    INTEGER NOT NULL,
+  PRIMARY KEY (tabela, ano)
+) WITHOUT ROWID;
+"""
+
+_ANO_DATA = "COALESCE(CAST(substr({r}.Data, 1, 4) AS INTEGER), 0)"
+_ANO_DAY = f"CAST(strftime('%Y', {{r}}.day + {quotes._JD_EPOCH}) AS INTEGER)"
+
+
+def _origem(tabela: str) -> tuple:
+    """(tabela física, chave, expressão do ano para OLD/NEW)."""
+    if tabela == "precos":
+        return "quotes", "day", _ANO_DAY
+    return tabela, "id", _ANO_DATA
+
+
+_SCHEMA_OK = False
+
+
+def ensure_snapshot_schema(con) -> None:
+    """Tabelas de controle + triggers (uma vez por processo)."""
+    global _SCHEMA_OK
+    if _SCHEMA_OK:
+        return
+    con.executescript(DDL_SNAPSHOT)
+    if "versao" not in db._table_columns(con, "snapshot_estado"):
+        con.execute("ALTER TABLE snapshot_estado ADD COLUMN versao INTEGER")
+    # versões antigas usavam INSERT OR IGNORE: num upsert (ON CONFLICT DO UPDATE) o conflito do
+    # comando externo prevalece sobre o do trigger e a 2ª marca do mesmo ano abortava a escrita
+    for (nome,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                               "AND name LIKE 'trg_snap_%' AND sql LIKE '%OR IGNORE%'").fetchall():
+        con.execute(f"DROP TRIGGER IF EXISTS {nome}")
+    for tabela in TABELAS:
+        fisica, chave, ano = _origem(tabela)
+        if not db._table_columns(con, fisica):
+            continue
+        marca = f"(SELECT chave_max FROM snapshot_estado WHERE tabela = '{tabela}')"
+        sujo = "INSERT INTO snapshot_sujo(tabela, ano) VALUES"
+        nada = "ON CONFLICT DO NOTHING"
+        con.executescript(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_snap_{tabela}_ai AFTER INSERT ON {fisica}
+        WHEN NEW.{chave} <= {marca}
+        BEGIN {sujo} ('{tabela}', {ano.format(r='NEW')}) {nada}; END;
+        CREATE TRIGGER IF NOT EXISTS trg_snap_{tabela}_au AFTER UPDATE ON {fisica}
+        BEGIN {sujo} ('{tabela}', {ano.format(r='OLD')}), ('{tabela}', {ano.format(r='NEW')}) {nada}; END;
+        CREATE TRIGGER IF NOT EXISTS trg_snap_{tabela}_ad AFTER DELETE ON {fisica}
+        BEGIN {sujo} ('{tabela}', {ano.format(r='OLD')}) {nada}; END;
+        """)
+    _SCHEMA_OK = True
+
+
+# ============================================================
+# Leitura do SQLite (um ano ou tudo)
+# ============================================================
+def _ler_sql(con, tabela: str, anos: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    if tabela == "precos":
+        where, params = "", []
+        if anos is not None:
+            faixas = [(quotes.day_of(f"{a:04d}-01-01"), quotes.day_of(f"{a + 1:04d}-01-01")) for a in anos]
+            where = " WHERE " + " OR ".join("(q.day >= ? AND q.day < ?)" for _ in faixas)
+            params = [x for f in faixas for x in f]
+        sql = (f"SELECT t.ticker AS Ticker, q.day, q.close AS preco, q.source AS fonte "
+               f"FROM quotes q JOIN quote_tickers t ON t.id = q.ticker_id{where} ORDER BY t.ticker, q.day")
+        df = pd.read_sql_query(sql, con, params=params)
+        df["data"] = pd.to_datetime(df["day"].astype("int64"), unit="D")
+        return df
+    where, params = "", []
+    if anos is not None:
+        conds = []
+        for a in anos:
+            if a == 0:
+                conds.append("(Data IS NULL OR NOT Data GLOB '[0-9][0-9][0-9][0-9]*')")
+            else:
+                conds.append("(Data >= ? AND Data < ?)"); params += [f"{a:04d}", f"{a + 1:04d}"]
+        where = " WHERE " + " OR ".join(conds)
+    df = pd.read_sql_query(f'SELECT * FROM "{tabela}"{where} ORDER BY id', con, params=params)
+    df["_ano"] = pd.to_numeric(df["Data"].astype("string").str.slice(0, 4), errors="coerce").fillna(0).astype(int)
+    df["Data"] = pd.to_datetime(df["Data"], errors="coerce")
+    return df
+
+
+def _ano_de(df: pd.DataFrame, tabela: str) -> pd.Series:
+    if tabela == "precos":
+        return df["data"].dt.year
+    return df.pop("_ano")
+
+
+# ============================================================
+# Partições em disco
+# ============================================================
+def _caminho(tabela: str, ano: int) -> Path:
+    base = PASTA / tabela / f"ano={ano}"
+    return base.with_suffix(".parquet") if FORMATO == "parquet" else base
+
+
+def _gravar_npy(df: pd.DataFrame, destino: Path) -> None:
+    tmp = destino.with_name(destino.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    tipos = {}
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            arr, tipos[c] = s.to_numpy("datetime64[ns]"), "data"
+        elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            arr, tipos[c] = s.to_numpy(), "num"
+        else:
+            nulo = s.isna().to_numpy()
+            arr, tipos[c] = s.fillna("").astype(str).to_numpy(dtype="U"), "texto"
+            if nulo.any():
+                np.save(tmp / f"{c}.nulo.npy", nulo)
+        np.save(tmp / f"{c}.npy", arr, allow_pickle=False)
+    (tmp / "_colunas.json").write_text(json.dumps(tipos, ensure_ascii=False), encoding="utf-8")
+    shutil.rmtree(destino, ignore_errors=True)
+    tmp.rename(destino)
+
+
+def _ler_npy(pasta: Path, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    tipos = json.loads((pasta / "_colunas.json").read_text(encoding="utf-8"))
+    dados = {}
+    for c, tipo in tipos.items():
+        if colunas is not None and c not in colunas:
+            continue
+        arr = np.load(pasta / f"{c}.npy", mmap_mode="c" if tipo != "texto" else None, allow_pickle=False)
+        if tipo == "texto":
+            arr = arr.astype(object)
+            nulo = pasta / f"{c}.nulo.npy"
+            if nulo.exists():
+                arr[np.load(nulo)] = None
+        dados[c] = arr
+    return pd.DataFrame(dados, copy=False)
+
+
+def _gravar(df: pd.DataFrame, tabela: str, ano: int) -> None:
+    destino = _caminho(tabela, ano)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    if FORMATO == "parquet":
+        tmp = destino.with_name(destino.name + ".tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, destino)
+    else:
+        _gravar_npy(df.reset_index(drop=True), destino)
+
+
+def _remover(tabela: str, ano: int) -> None:
+    p = _caminho(tabela, ano)
+    if p.is_dir():
+        shutil.rmtree(p, ignore_errors=True)
+    elif p.exists():
+        p.unlink()
+
+
+def _anos_em_disco(tabela: str) -> List[int]:
+    pasta = PASTA / tabela
+    if not pasta.exists():
+        return []
+    anos = []
+    for p in pasta.iterdir():
+        nome = p.name[:-len(".parquet")] if p.suffix == ".parquet" else p.name
+        if nome.startswith("ano=") and not nome.endswith(".tmp") and (p.suffix == ".parquet") == (FORMATO == "parquet"):
+            anos.append(int(nome[4:]))
+    return sorted(anos)
+
+
+# ============================================================
+# Refresh incremental
+# ============================================================
+def _versao_origem(con, tabela: str) -> Optional[int]:
+    """Contador de cache_versao da tabela (mantido por trigger em todo INSERT/UPDATE/DELETE)."""
+    try:
+        r = con.execute("SELECT versao FROM cache_versao WHERE tag = ?", (tabela,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return r[0] if r else None
+
+
+def _em_dia(con, tabela: str) -> bool:
+    """Snapshot já reflete a tabela? Só leituras por PK, sem trava de escrita."""
+    try:
+        estado = con.execute("SELECT formato, versao FROM snapshot_estado WHERE tabela = ?", (tabela,)).fetchone()
+        sujo = con.execute("SELECT 1 FROM snapshot_sujo WHERE tabela = ? LIMIT 1", (tabela,)).fetchone()
+    except sqlite3.OperationalError:        # snapshot ainda não criado neste banco
+        return False
+    versao = _versao_origem(con, tabela)
+    return (estado is not None and estado[0] == FORMATO and versao is not None
+            and estado[1] == versao and sujo is None)
+
+
+def desatualizadas(tabelas: Optional[Iterable[str]] = None) -> List[str]:
+    """Tabelas cujo snapshot precisa de refresh (checagem só de leitura)."""
+    with db.connect() as con:
+        return [t for t in (tabelas or TABELAS) if not _em_dia(con, t)]
+
+
+def _atualizar_tabela(con, tabela: str, completo: bool) -> List[int]:
+    fisica, chave, _ = _origem(tabela)
+    estado = con.execute("SELECT chave_max, formato FROM snapshot_estado WHERE tabela = ?", (tabela,)).fetchone()
+    (chave_max_db,) = con.execute(f"SELECT MAX({chave}) FROM {fisica}").fetchone()
+    em_disco = _anos_em_disco(tabela)
+    completo = completo or estado is None or estado[1] != FORMATO or estado[0] is None or not em_disco
+
+    if completo:
+        df = _ler_sql(con, tabela)
+        anos_df = _ano_de(df, tabela)
+        escritos = []
+        for ano, parte in df.groupby(anos_df, sort=True):
+            _gravar(parte, tabela, int(ano)); escritos.append(int(ano))
+        for ano in set(em_disco) - set(escritos):
+            _remover(tabela, ano)
+    else:
+        anos = {a for (a,) in con.execute("SELECT ano FROM snapshot_sujo WHERE tabela = ?", (tabela,))}
+        if chave_max_db is not None and chave_max_db > estado[0]:
+            ano = _ANO_DAY if tabela == "precos" else _ANO_DATA
+            anos |= {a for (a,) in con.execute(
+                f"SELECT DISTINCT {ano.format(r=fisica)} FROM {fisica} WHERE {chave} > ?", (estado[0],))}
+        escritos = sorted(anos)
+        if escritos:
+            df = _ler_sql(con, tabela, escritos)
+            partes = dict(tuple(df.groupby(_ano_de(df, tabela))))
+            for ano in escritos:
+                if ano in partes:
+                    _gravar(partes[ano], tabela, ano)
+                else:                                  # ano esvaziado por DELETE
+                    _remover(tabela, ano)
+
+    (linhas,) = con.execute(f"SELECT COUNT(*) FROM {fisica}").fetchone()
+    con.execute("DELETE FROM snapshot_sujo WHERE tabela = ?", (tabela,))
+    con.execute("""
+        INSERT INTO snapshot_estado(tabela, chave_max, formato, linhas, versao, atualizado)
+        VALUES (?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(tabela) DO UPDATE SET chave_max=excluded.chave_max, formato=excluded.formato,
+                                          linhas=excluded.linhas, versao=excluded.versao,
+                                          atualizado=excluded.atualizado
+    """, (tabela, chave_max_db if chave_max_db is not None else 0, FORMATO, linhas, _versao_origem(con, tabela)))
+    return escritos
+
+
+def atualizar(tabelas: Optional[Iterable[str]] = None, completo: bool = False) -> Dict[str, List[int]]:
+    """
+    Exporta/refresca as tabelas pedidas (todas por padrão). Retorna {tabela: anos reescritos}.
+    Sem completo=True, tabelas em dia (ver desatualizadas) não tomam a trava de escrita.
+    """
+    tabelas = list(tabelas or TABELAS)
+    for tabela in tabelas:
+        if tabela not in TABELAS:
+            raise ValueError(f"tabela sem snapshot: {tabela}")
+    pendentes = tabelas if completo else desatualizadas(tabelas)
+    feitos = {t: [] for t in tabelas}
+    if not pendentes:
+        return feitos
+    db.ensure_core_schema()
+    with db.connect() as con:
+        ensure_snapshot_schema(con)
+        con.commit()
+        # trava de escrita durante a leitura: nada entra entre ler as linhas e mover a marca d'água
+        con.execute("BEGIN IMMEDIATE")
+        for tabela in pendentes:
+            if not db._table_columns(con, _origem(tabela)[0]):
+                feitos.pop(tabela, None)
+            elif completo or not _em_dia(con, tabela):     # outro processo pode ter refrescado antes
+                feitos[tabela] = _atualizar_tabela(con, tabela, completo)
+    return feitos
+
+
+# ============================================================
+# Leitura do snapshot
+# ============================================================
+def carregar(tabela: str, anos: Optional[Iterable[int]] = None, colunas: Optional[List[str]] = None,
+             refrescar: bool = True) -> pd.DataFrame:
+    """
+    Partições pedidas (todas por padrão) concatenadas. Com refrescar=True, confere antes se o
+    snapshot está em dia (só leitura) e refresca apenas se preciso.
+    """
+    if refrescar:
+        atualizar([tabela])
+    alvo = _anos_em_disco(tabela) if anos is None else [a for a in anos if a in set(_anos_em_disco(tabela))]
+    partes = []
+    for ano in alvo:
+        p = _caminho(tabela, ano)
+        if FORMATO == "parquet":
+            partes.append(_pq.read_table(p, columns=colunas, memory_map=True).to_pandas(split_blocks=True))
+        else:
+            partes.append(_ler_npy(p, colunas))
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=colunas or [])
+    return partes[0] if len(partes) == 1 else pd.concat(partes, ignore_index=True, copy=False)
+
+
+def load_trades(refrescar: bool = True) -> pd.DataFrame:
+    df = carregar("trades", refrescar=refrescar)
+    if not df.empty:
+        df = df.sort_values(["Data", "id"], kind="stable").reset_index(drop=True)
+    return db._trades_padrao(df)
+
+
+def load_precos(refrescar: bool = True) -> pd.DataFrame:
+    df = carregar("precos", colunas=["Ticker", "data", "preco", "fonte"], refrescar=refrescar)
+    if df.empty:
+        return pd.DataFrame(columns=["Ticker", "data", "preco", "fonte"])
+    df["Ticker"] = db.como_categoria(df["Ticker"], db.cadastro_tickers())
+    return df.sort_values(["Ticker", "data"], kind="stable").reset_index(drop=True)
+
+
+def load_proventos(refrescar: bool = True) -> pd.DataFrame:
+    return db._proventos_padrao(carregar("proventos", colunas=["id", "Data", "Ticker", "Tipo", "Valor"],
+                                         refrescar=refrescar))
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Exporta/atualiza o snapshot colunar (parquet ou .npy) das tabelas analíticas.")
+    ap.add_argument("--tabelas", help=f"lista separada por vírgula (padrão: {','.join(TABELAS)})")
+    ap.add_argument("--completo", action="store_true", help="reescreve tudo, ignorando a marca d'água")
+    args = ap.parse_args(argv)
+    tabelas = [t.strip() for t in args.tabelas.split(",") if t.strip()] if args.tabelas else None
+    for tabela, anos in atualizar(tabelas, args.completo).items():
+        print(f"{tabela:14s} {FORMATO}: " + (", ".join(map(str, anos)) if anos else "sem mudanças"))
+    print(f"pasta: {PASTA}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# services/sync_metrics.py
+# Métricas dos provedores de cotação (latência, ok/falha, cadeia de fallback por símbolo).
+# Sem dependências do pacote 'services' para poder ser importado pelos scripts executados direto:
+#   python services/sync_quotes.py --db finance.db
+#
+# Resumo das últimas execuções gravadas em 'sync_runs':
+#   python services/sync_metrics.py --db finance.db --last 20
+from __future__ import annotations
+
+import argparse, datetime as dt, json, math, sqlite3, time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# limites superiores (ms) dos baldes do histograma
+BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+
+def _bucket_label(ms: float) -> str:
+    for b in BUCKETS_MS:
+        if ms <= b:
+            return f"<={int(b)}ms" if b != math.inf else f">{int(BUCKETS_MS[-2])}ms"
+    return f">{int(BUCKETS_MS[-2])}ms"
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(q * (len(v) - 1) + 0.5))], 1)
+
+
+class SyncStats:
+    """Coletor de uma execução de sync. Os fetchers recebem (opcionalmente) uma instância."""
+
+    def __init__(self, script: str = "adhoc"):
+        self.script = script
+        self.started_at = dt.datetime.now()
+        self.finished_at: Optional[dt.datetime] = None
+        self._ms: Dict[str, List[float]] = defaultdict(list)
+        self._ok: Counter = Counter()
+        self._fail: Counter = Counter()
+        self._erros: Dict[str, Counter] = defaultdict(Counter)
+        self.chains: Dict[str, List[dict]] = defaultdict(list)
+
+    def record(self, provider: str, symbol: Optional[str], ok: bool, ms: float, erro: Optional[str] = None) -> None:
+        self._ms[provider].append(ms)
+        (self._ok if ok else self._fail)[provider] += 1
+        if erro:
+            self._erros[provider][erro[:120]] += 1
+        if symbol:
+            self.chains[symbol.upper()].append(
+                {"provider": provider, "ok": ok, "ms": round(ms, 1), **({"erro": erro} if erro else {})})
+
+    @contextmanager
+    def track(self, provider: str, symbol: Optional[str] = None):
+        """
+        Mede uma chamada. Exceção => falha (e é repassada). Para falhas sem exceção
+        (HTTP != 200, resposta vazia) o chamador faz rec["ok"] = False.
+        """
+        rec = {"ok": True, "erro": None}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        except Exception as e:
+            rec["ok"], rec["erro"] = False, f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record(provider, symbol, rec["ok"], (time.perf_counter() - t0) * 1000.0, rec["erro"])
+
+    def finish(self) -> None:
+        self.finished_at = dt.datetime.now()
+
+    def summary(self) -> dict:
+        fim = self.finished_at or dt.datetime.now()
+        providers = {}
+        for p, ms in self._ms.items():
+            hist = Counter(_bucket_label(x) for x in ms)
+            providers[p] = {
+                "calls": len(ms), "ok": self._ok[p], "fail": self._fail[p],
+                "p50_ms": _pct(ms, 0.50), "p95_ms": _pct(ms, 0.95),
+                "max_ms": round(max(ms), 1), "total_ms": round(sum(ms), 1),
+                "hist": {_bucket_label(b): hist[_bucket_label(b)] for b in BUCKETS_MS if hist[_bucket_label(b)]},
+                "erros": dict(self._erros[p].most_common(5)),
+            }
+        return {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": fim.isoformat(timespec="seconds"),
+            "duracao_ms": round((fim - self.started_at).total_seconds() * 1000.0, 1),
+            "providers": providers,
+            "chains": dict(self.chains),
+        }
+
+    def persist(self, conn: sqlite3.Connection) -> dict:
+        """Grava o resumo em 'sync_runs' (na transação corrente do chamador) e o devolve."""
+        if self.finished_at is None:
+            self.finish()
+        s = self.summary()
+        ensure_sync_runs(conn)
+        conn.execute(
+            "INSERT INTO sync_runs (script, started_at, finished_at, duracao_ms, ok, fail, summary_json) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (s["script"], s["started_at"], s["finished_at"], s["duracao_ms"],
+             sum(self._ok.values()), sum(self._fail.values()), json.dumps(s, ensure_ascii=False)))
+        return s
+
+
+def ensure_sync_runs(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        script TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        duracao_ms REAL,
+        ok INTEGER,
+        fail INTEGER,
+        summary_json TEXT
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_runs_started ON sync_runs(started_at)")
+
+
+def recent_summary(conn: sqlite3.Connection, last: int = 20, script: Optional[str] = None) -> dict:
+    """Agrega as últimas N execuções por provedor (mesmos campos de SyncStats.summary)."""
+    ensure_sync_runs(conn)
+    q = "SELECT summary_json FROM sync_runs"
+    params: list = []
+    if script:
+        q += " WHERE script = ?"; params.append(script)
+    q += " ORDER BY id DESC LIMIT ?"; params.append(int(last))
+    runs = [json.loads(r[0]) for r in conn.execute(q, params).fetchall() if r[0]]
+    agg: Dict[str, dict] = {}
+    for run in runs:
+        for p, m in run.get("providers", {}).items():
+            a = agg.setdefault(p, {"calls": 0, "ok": 0, "fail": 0, "p95_ms": [], "hist": Counter()})
+            a["calls"] += m["calls"]; a["ok"] += m["ok"]; a["fail"] += m["fail"]
+            a["p95_ms"].append(m["p95_ms"]); a["hist"].update(m.get("hist", {}))
+    for a in agg.values():
+        a["taxa_falha"] = round(a["fail"] / a["calls"], 3) if a["calls"] else 0.0
+        a["p95_ms"] = _pct(a["p95_ms"], 0.5)  # mediana dos p95 por execução
+        a["hist"] = dict(a["hist"])
+    return {"runs": len(runs), "providers": agg,
+            "duracao_ms_p50": _pct([r.get("duracao_ms", 0.0) for r in runs], 0.5)}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Resumo das execuções de sync de cotações.")
+    ap.add_argument("--db", required=True)
+    ap.add_argument("--last", type=int, default=20)
+    ap.add_argument("--script")
+    args = ap.parse_args()
+    con = sqlite3.connect(args.db)
+    try:
+        print(json.dumps(recent_summary(con, args.last, args.script), ensure_ascii=False, indent=2))
+    finally:
+        con.close()
@@ -1,7 +1,14 @@
 # services/sync_precos_direct.py
 from __future__ import annotations
-import argparse, os, datetime as dt, sqlite3, requests
-from typing import List, Dict, Optional
+import argparse, os, datetime as dt, json, sqlite3, requests
+from typing import List, Dict, Optional, Tuple
+
+try:
+    from services.sync_metrics import SyncStats
+    from services import cache, quotes
+except ImportError:  # executado como script (python services/sync_precos_direct.py)
+    from sync_metrics import SyncStats
+    import cache, quotes
 
 TODAY = dt.date.today()
 
@@ -9,67 +16,87 @@ TODAY = dt.date.today()
 def brl(v: float) -> float:
     return float(f"{float(v):.6f}")
 
-def get_usdbrl() -> float:
+def get_usdbrl(stats: Optional[SyncStats] = None) -> float:
+    stats = stats or SyncStats()
     url = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.1/dados/ultimos/1?formato=json"
-    r = requests.get(url, timeout=15); r.raise_for_status()
-    return float(str(r.json()[0]["valor"]).replace(",", "."))
+    with stats.track("bcb_usdbrl"):
+        r = requests.get(url, timeout=15); r.raise_for_status()
+        return float(str(r.json()[0]["valor"]).replace(",", "."))
 
-def get_cdi_series(start: dt.date, end: dt.date):
+def get_cdi_series(start: dt.date, end: dt.date, stats: Optional[SyncStats] = None):
+    stats = stats or SyncStats()
     url = ( "https://api.bcb.gov.br/dados/serie/bcdata.sgs.12/dados?"
             f"formato=json&dataInicial={start.strftime('%d/%m/%Y')}&dataFinal={end.strftime('%d/%m/%Y')}" )
-    r = requests.get(url, timeout=30); r.raise_for_status()
+    with stats.track("bcb_cdi"):
+        r = requests.get(url, timeout=30); r.raise_for_status()
+        js = r.json()
     out = []
-    for row in r.json():
+    for row in js:
         d = dt.datetime.strptime(row["data"], "%d/%m/%Y").date()
         val = float(str(row["valor"]).replace(",", "."))  # % a.d.
         out.append((d, val))
     return out
 
-def accrue_cdb(nominal: float, pct_cdi: float, start: dt.date, end: dt.date) -> float:
+def accrue_cdb(nominal: float, pct_cdi: float, start: dt.date, end: dt.date,
+               stats: Optional[SyncStats] = None) -> float:
     if end <= start: return nominal
     value = float(nominal)
-    for _, cdi_day in get_cdi_series(start, end):
+    for _, cdi_day in get_cdi_series(start, end, stats):
         value *= (1.0 + (cdi_day/100.0) * (pct_cdi/100.0))
     return value
 
 # ======== Provedores ========
-def price_crypto_brl(symbol: str) -> Optional[float]:
-    sym = symbol.upper(); usdbrl = get_usdbrl()
+def price_crypto_brl(symbol: str, stats: Optional[SyncStats] = None) -> Optional[float]:
+    stats = stats or SyncStats()
+    sym = symbol.upper(); usdbrl = get_usdbrl(stats)
     # Coinbase spot
     try:
-        r = requests.get(f"https://api.coinbase.com/v2/prices/{sym}-USD/spot", timeout=10)
-        if r.status_code == 200:
-            px_usd = float(r.json()["data"]["amount"])
-            return brl(px_usd * usdbrl)
+        with stats.track("coinbase", sym) as rec:
+            r = requests.get(f"https://api.coinbase.com/v2/prices/{sym}-USD/spot", timeout=10)
+            if r.status_code == 200:
+                px_usd = float(r.json()["data"]["amount"])
+                return brl(px_usd * usdbrl)
+            rec["ok"], rec["erro"] = False, f"HTTP {r.status_code}"
     except Exception:
         pass
     # Binance fallback
     try:
-        r = requests.get("https://www.binance.com/api/v3/ticker/price",
-                         params={"symbol": f"{sym}USDT"}, timeout=10)
-        if r.status_code == 200:
-            px_usdt = float(r.json()["price"])
-            return brl(px_usdt * usdbrl)
+        with stats.track("binance", sym) as rec:
+            r = requests.get("https://www.binance.com/api/v3/ticker/price",
+                             params={"symbol": f"{sym}USDT"}, timeout=10)
+            if r.status_code == 200:
+                px_usdt = float(r.json()["price"])
+                return brl(px_usdt * usdbrl)
+            rec["ok"], rec["erro"] = False, f"HTTP {r.status_code}"
     except Exception:
         pass
     return None
 
-def price_equities_brl(symbols: List[str]) -> Dict[str, float]:
+def price_equities_brl(symbols: List[str], stats: Optional[SyncStats] = None) -> Dict[str, float]:
+    stats = stats or SyncStats()
     out: Dict[str, float] = {}
     try:
-        import yfinance as yf
         yfs = [s if s.endswith(".SA") else f"{s}.SA" for s in symbols]
-        tk = yf.Tickers(" ".join(yfs))
+        try:
+            import yfinance as yf
+            tk = yf.Tickers(" ".join(yfs))
+        except Exception as e:
+            # sem I/O de rede aqui: só a falha entra nas métricas (as chamadas são por símbolo)
+            stats.record("yfinance", None, False, 0.0, f"{type(e).__name__}: {e}")
+            raise
         for s2 in yfs:
+            base = s2[:-3] if s2.endswith(".SA") else s2
             try:
-                t = tk.tickers[s2]
-                val = getattr(getattr(t, "fast_info", None), "last_price", None)
-                if val is None:
-                    h = t.history(period="1d")
-                    if not h.empty: val = float(h["Close"].iloc[-1])
-                if val is not None:
-                    base = s2[:-3] if s2.endswith(".SA") else s2
-                    out[base.upper()] = brl(val)
+                with stats.track("yfinance", base) as rec:
+                    t = tk.tickers[s2]
+                    val = getattr(getattr(t, "fast_info", None), "last_price", None)
+                    if val is None:
+                        h = t.history(period="1d")
+                        if not h.empty: val = float(h["Close"].iloc[-1])
+                    if val is not None:
+                        out[base.upper()] = brl(val)
+                    else:
+                        rec["ok"], rec["erro"] = False, "sem preço"
             except Exception:
                 continue
         return out
@@ -78,10 +105,13 @@ def price_equities_brl(symbols: List[str]) -> Dict[str, float]:
         for s in symbols:
             s2 = s.lower() if s.lower().endswith(".sa") else f"{s.lower()}.sa"
             try:
-                r = requests.get(f"https://stooq.com/q/d/l/?s={s2}&i=d", timeout=10)
-                if r.status_code == 200 and "Close" in r.text:
-                    last = r.text.strip().splitlines()[-1].split(",")[-1]
-                    out[s.upper()] = brl(float(last))
+                with stats.track("stooq", s) as rec:
+                    r = requests.get(f"https://stooq.com/q/d/l/?s={s2}&i=d", timeout=10)
+                    if r.status_code == 200 and "Close" in r.text:
+                        last = r.text.strip().splitlines()[-1].split(",")[-1]
+                        out[s.upper()] = brl(float(last))
+                    else:
+                        rec["ok"], rec["erro"] = False, f"HTTP {r.status_code}"
             except Exception:
                 continue
         return out
@@ -124,76 +154,69 @@ def load_portfolio_from_db_for_positions(conn: sqlite3.Connection):
         pass
     return rows
 
-# ======== Upserts mínimos, compatíveis com schema antigo ========
-def ensure_ativo_min(conn: sqlite3.Connection, ticker: str) -> int:
-    t = ticker.upper().strip()
-    r = conn.execute("SELECT id FROM ativos WHERE UPPER(ticker)=?", (t,)).fetchone()
-    if r: return int(r[0])
-    # Inserção mínima (só 'ticker'); outras colunas ficam NULL/DEFAULT
-    conn.execute("INSERT INTO ativos (ticker) VALUES (?)", (t,))
-    return int(conn.execute("SELECT last_insert_rowid()").fetchone()[0])
-
-def upsert_preco_min(conn: sqlite3.Connection, ativo_id: int, data_iso: str, preco: float):
-    # tenta ON CONFLICT; se não houver índice único, cai pro modo manual
-    try:
-        conn.execute("""
-            INSERT INTO precos (data, ativo_id, preco) VALUES (?, ?, ?)
-            ON CONFLICT(ativo_id, data) DO UPDATE SET preco=excluded.preco
-        """, (data_iso, int(ativo_id), float(preco)))
-    except sqlite3.OperationalError:
-        old = conn.execute("SELECT id FROM precos WHERE ativo_id=? AND data=?", (int(ativo_id), data_iso)).fetchone()
-        if old:
-            conn.execute("UPDATE precos SET preco=? WHERE id=?", (float(preco), int(old[0])))
-        else:
-            conn.execute("INSERT INTO precos (data, ativo_id, preco) VALUES (?, ?, ?)", (data_iso, int(ativo_id), float(preco)))
+# ======== Persistência (store canônico services/quotes.py) ========
+def write_precos(conn: sqlite3.Connection, coletados: List[Tuple[str, float, str]], data_iso: str) -> None:
+    """Grava [(ticker, preço, tipo), ...] numa única transação (um commit/fsync)."""
+    if not coletados:
+        return
+    quotes.ensure_quote_schema(conn)  # DDL via executescript: fora da transação dos preços
+    with conn:
+        quotes.upsert_quotes(conn, [(t, data_iso, px, f"sync_precos_direct:{tp}") for t, px, tp in coletados])
+        cache.marcar(conn, *cache.PRICE_TAGS)
 
 # ======== Execução principal ========
 def run(db_path: str):
     import yfinance  # garante erro cedo se faltar (ou remova esta linha para usar fallback Stooq)
-    with sqlite3.connect(db_path) as conn:
+    conn = sqlite3.connect(db_path)
+    stats = SyncStats("sync_precos_direct")
+    metrics: dict = {}
+    try:
         conn.execute("PRAGMA foreign_keys=ON;")
         carteira = load_portfolio_from_db_for_positions(conn)
 
         ok, fail = [], []
+        coletados: List[Tuple[str, float, str]] = []  # (ticker, preço, tipo) — gravados de uma vez no fim
 
         # Equities B3
         eq = [r["ticker"] for r in carteira if r["classe"] in {"ACAO","ETF","FII","BDR"}]
         if eq:
-            prices = price_equities_brl(list(set(eq)))
+            prices = price_equities_brl(list(set(eq)), stats)
             for t, px in prices.items():
-                try:
-                    aid = ensure_ativo_min(conn, t)
-                    upsert_preco_min(conn, aid, TODAY.isoformat(), px)
-                    ok.append((t, px, "EQ"))
-                except Exception as e:
-                    fail.append((t, str(e)))
-            conn.commit()
+                coletados.append((t, px, "EQ"))
 
         # Cripto
         cr = [r["ticker"] for r in carteira if r["classe"]=="CRIPTO"]
         for t in set(cr):
             try:
-                px = price_crypto_brl(t)
-                if px is None: 
+                px = price_crypto_brl(t, stats)
+                if px is None:
                     fail.append((t, "sem preço")); continue
-                aid = ensure_ativo_min(conn, t)
-                upsert_preco_min(conn, aid, TODAY.isoformat(), px)
-                ok.append((t, px, "CR"))
+                coletados.append((t, px, "CR"))
             except Exception as e:
                 fail.append((t, str(e)))
-        conn.commit()
 
         # CDB
         cdb_rows = [r for r in carteira if r["classe"]=="CDB" and r.get("pct_cdi") and r.get("inicio")]
         for r in cdb_rows:
             try:
-                val = accrue_cdb(r.get("nominal") or 1000.0, float(r["pct_cdi"]), r["inicio"], TODAY)
-                aid = ensure_ativo_min(conn, r["ticker"])
-                upsert_preco_min(conn, aid, TODAY.isoformat(), val)
-                ok.append((r["ticker"], val, "CDB"))
+                val = accrue_cdb(r.get("nominal") or 1000.0, float(r["pct_cdi"]), r["inicio"], TODAY, stats)
+                coletados.append((r["ticker"], val, "CDB"))
             except Exception as e:
                 fail.append((r["ticker"], str(e)))
-        conn.commit()
+
+        # Persistência: uma transação para a carteira inteira
+        try:
+            write_precos(conn, coletados, TODAY.isoformat())
+            ok.extend(coletados)
+        except Exception as e:
+            fail.extend((t, str(e)) for t, _, _ in coletados)
+
+        # Métricas dos provedores (gravadas mesmo se a escrita dos preços falhou)
+        with conn:
+            metrics = stats.persist(conn)
+            cache.marcar(conn)
+    finally:
+        conn.close()
 
     print("Atualizados (ticker, preço, tipo):")
     for t, px, tp in ok:
@@ -202,6 +225,9 @@ def run(db_path: str):
         print("\nFalhas:")
         for t, msg in fail:
             print(f"  - {t}: {msg}")
+    if metrics:
+        print("\nProvedores:")
+        print(json.dumps(metrics, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -4,31 +4,42 @@ import argparse, datetime as dt, sqlite3, json, math
 from typing import List, Dict, Tuple, Optional
 import requests
 
+try:
+    from services.sync_metrics import SyncStats
+    from services import cache, quotes
+except ImportError:  # executado como script (python services/sync_quotes.py)
+    from sync_metrics import SyncStats
+    import cache, quotes
+
 # ---------- Helpers gerais ----------
 TODAY = dt.date.today()
 
 def brl(value: float) -> float:
     return float(f"{value:.6f}")
 
-def get_usdbrl() -> float:
+def get_usdbrl(stats: Optional[SyncStats] = None) -> float:
+    stats = stats or SyncStats()
     # BCB SGS série 1 = USD/BRL (venda) – sem chave
     url = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.1/dados/ultimos/1?formato=json"
-    r = requests.get(url, timeout=15)
-    r.raise_for_status()
-    data = r.json()
+    with stats.track("bcb_usdbrl"):
+        r = requests.get(url, timeout=15)
+        r.raise_for_status()
+        data = r.json()
     # BCB retorna "valor" com vírgula decimal
     return float(str(data[0]["valor"]).replace(",", "."))  # ex.: 5.1234
 # :contentReference[oaicite:4]{index=4}
 
-def get_cdi_series(start: dt.date, end: dt.date) -> List[Tuple[dt.date, float]]:
+def get_cdi_series(start: dt.date, end: dt.date, stats: Optional[SyncStats] = None) -> List[Tuple[dt.date, float]]:
+    stats = stats or SyncStats()
     # BCB SGS série 12 = CDI (ao dia, %) – sem chave
     url = (
         "https://api.bcb.gov.br/dados/serie/bcdata.sgs.12/dados?"
         f"formato=json&dataInicial={start.strftime('%d/%m/%Y')}&dataFinal={end.strftime('%d/%m/%Y')}"
     )
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    js = r.json()
+    with stats.track("bcb_cdi"):
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
+        js = r.json()
     out = []
     for row in js:
         d = dt.datetime.strptime(row["data"], "%d/%m/%Y").date()
@@ -37,11 +48,12 @@ def get_cdi_series(start: dt.date, end: dt.date) -> List[Tuple[dt.date, float]]:
     return out
 # :contentReference[oaicite:5]{index=5}
 
-def accrue_cdb(nominal: float, pct_cdi: float, start: dt.date, end: dt.date) -> float:
+def accrue_cdb(nominal: float, pct_cdi: float, start: dt.date, end: dt.date,
+               stats: Optional[SyncStats] = None) -> float:
     """Aproximação: capitalização diária por CDI do período * pct_cdi."""
     if end <= start:
         return nominal
-    series = get_cdi_series(start, end)
+    series = get_cdi_series(start, end, stats)
     value = float(nominal)
     for d, cdi_day_pct in series:
         # CDI diário vem em % a.d.; aplicar percentual do contrato (ex.: 110% do CDI -> 1.10)
@@ -50,53 +62,67 @@ def accrue_cdb(nominal: float, pct_cdi: float, start: dt.date, end: dt.date) ->
     return value
 
 # ---------- Provedores de preço ----------
-def price_crypto_symbol(symbol: str) -> Optional[float]:
+def price_crypto_symbol(symbol: str, stats: Optional[SyncStats] = None) -> Optional[float]:
     """Tenta Coinbase spot (USD), fallback Binance (USDT), converte p/ BRL pelo USD/BRL (BCB)."""
+    stats = stats or SyncStats()
     sym = symbol.upper()
-    usd_brl = get_usdbrl()
+    usd_brl = get_usdbrl(stats)
     # 1) Coinbase spot (sem auth)
     # GET https://api.coinbase.com/v2/prices/BTC-USD/spot
     url = f"https://api.coinbase.com/v2/prices/{sym}-USD/spot"
     try:
-        r = requests.get(url, timeout=10)
-        if r.status_code == 200:
-            amount = float(r.json()["data"]["amount"])
-            return brl(amount * usd_brl)
+        with stats.track("coinbase", sym) as rec:
+            r = requests.get(url, timeout=10)
+            if r.status_code == 200:
+                amount = float(r.json()["data"]["amount"])
+                return brl(amount * usd_brl)
+            rec["ok"], rec["erro"] = False, f"HTTP {r.status_code}"
     except Exception:
         pass
     # 2) Binance public (sem auth): GET /api/v3/ticker/price?symbol=BTCUSDT
     try:
-        r = requests.get("https://www.binance.com/api/v3/ticker/price", params={"symbol": f"{sym}USDT"}, timeout=10)
-        if r.status_code == 200:
-            px_usdt = float(r.json()["price"])
-            return brl(px_usdt * usd_brl)  # USDT ~ USD
+        with stats.track("binance", sym) as rec:
+            r = requests.get("https://www.binance.com/api/v3/ticker/price", params={"symbol": f"{sym}USDT"}, timeout=10)
+            if r.status_code == 200:
+                px_usdt = float(r.json()["price"])
+                return brl(px_usdt * usd_brl)  # USDT ~ USD
+            rec["ok"], rec["erro"] = False, f"HTTP {r.status_code}"
     except Exception:
         pass
     return None
 # :contentReference[oaicite:6]{index=6}
 
-def price_equities_yf(symbols: List[str]) -> Dict[str, float]:
+def price_equities_yf(symbols: List[str], stats: Optional[SyncStats] = None) -> Dict[str, float]:
     """Usa yfinance se disponível; retorna BRL quando símbolo já é .SA; caso contrário, retorna na moeda nativa."""
+    stats = stats or SyncStats()
     out: Dict[str, float] = {}
     try:
-        import yfinance as yf  # sem conta
-        # yfinance aceita batch:
-        tick = yf.Tickers(" ".join(symbols))
+        try:
+            import yfinance as yf  # sem conta
+            # yfinance aceita batch:
+            tick = yf.Tickers(" ".join(symbols))
+        except Exception as e:
+            # sem I/O de rede aqui: só a falha entra nas métricas (as chamadas são por símbolo)
+            stats.record("yfinance", None, False, 0.0, f"{type(e).__name__}: {e}")
+            raise
         for s in symbols:
             try:
-                t = tick.tickers[s]
-                # fast_info é rápido; fallback para history
-                val = None
-                if hasattr(t, "fast_info") and t.fast_info is not None:
-                    v = t.fast_info.get("last_price")
-                    if v:
-                        val = float(v)
-                if val is None:
-                    h = t.history(period="1d")
-                    if not h.empty:
-                        val = float(h["Close"].iloc[-1])
-                if val is not None:
-                    out[s] = brl(val)
+                with stats.track("yfinance", s) as rec:
+                    t = tick.tickers[s]
+                    # fast_info é rápido; fallback para history
+                    val = None
+                    if hasattr(t, "fast_info") and t.fast_info is not None:
+                        v = t.fast_info.get("last_price")
+                        if v:
+                            val = float(v)
+                    if val is None:
+                        h = t.history(period="1d")
+                        if not h.empty:
+                            val = float(h["Close"].iloc[-1])
+                    if val is not None:
+                        out[s] = brl(val)
+                    else:
+                        rec["ok"], rec["erro"] = False, "sem preço"
             except Exception:
                 continue
     except Exception:
@@ -110,10 +136,13 @@ def price_equities_yf(symbols: List[str]) -> Dict[str, float]:
                 sym_sa = sym
             url = f"https://stooq.com/q/d/l/?s={sym_sa}&i=d"  # CSV diário
             try:
-                r = requests.get(url, timeout=10)
-                if r.status_code == 200 and "Close" in r.text:
-                    last = r.text.strip().splitlines()[-1].split(",")[-1]
-                    out[s] = brl(float(last))
+                with stats.track("stooq", s) as rec:
+                    r = requests.get(url, timeout=10)
+                    if r.status_code == 200 and "Close" in r.text:
+                        last = r.text.strip().splitlines()[-1].split(",")[-1]
+                        out[s] = brl(float(last))
+                    else:
+                        rec["ok"], rec["erro"] = False, f"HTTP {r.status_code}"
             except Exception:
                 continue
     return out
@@ -121,27 +150,17 @@ def price_equities_yf(symbols: List[str]) -> Dict[str, float]:
 
 # ---------- Integração com sua base ----------
 def ensure_schema(conn: sqlite3.Connection):
-    # Tabela de cotações (ajuste o nome/colunas para o seu padrão)
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS cotacoes (
-        ticker TEXT NOT NULL,
-        data   TEXT NOT NULL,
-        preco_brl REAL NOT NULL,
-        fonte TEXT,
-        PRIMARY KEY (ticker, data)
-    )
-    """)
+    # Cotações vão para o store canônico (services/quotes.py)
+    quotes.ensure_quote_schema(conn)
     conn.commit()
 
-def upsert_quote(conn: sqlite3.Connection, ticker: str, price_brl: float, fonte: str):
-    conn.execute("""
-        INSERT INTO cotacoes (ticker, data, preco_brl, fonte)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(ticker, data) DO UPDATE SET
-            preco_brl=excluded.preco_brl,
-            fonte=excluded.fonte
-    """, (ticker.upper(), TODAY.isoformat(), float(price_brl), fonte))
-    conn.commit()
+def upsert_quotes(conn: sqlite3.Connection, rows: List[Tuple[str, float, str]]) -> int:
+    """
+    Grava [(ticker, preco_brl, fonte), ...] do dia com um único executemany.
+    Não faz commit: quem chama controla a transação (um fsync por sync).
+    """
+    hoje = dt.date.today()  # não usa TODAY: o scheduler roda por dias no mesmo processo
+    return quotes.upsert_quotes(conn, [(t, hoje, px, fonte) for t, px, fonte in rows])
 
 def load_portfolio_from_db(conn: sqlite3.Connection) -> List[Dict]:
     """
@@ -189,8 +208,10 @@ def normalize_b3_symbols(rows: List[Dict]) -> List[str]:
         out.append(t)
     return out
 
-def sync(db_path: str):
+def sync(db_path: str) -> Optional[dict]:
+    """Sincroniza as cotações; devolve o resumo de métricas dos provedores (também gravado em sync_runs)."""
     conn = sqlite3.connect(db_path)
+    stats = SyncStats("sync_quotes")
     try:
         ensure_schema(conn)
         portfolio = load_portfolio_from_db(conn)
@@ -200,13 +221,13 @@ def sync(db_path: str):
 
         # 1) Equities em lote
         eq_symbols = normalize_b3_symbols([r for r in portfolio if r["classe"] in {"ACAO","ETF","FII","BDR"}])
-        eq_prices = price_equities_yf(eq_symbols) if eq_symbols else {}
+        eq_prices = price_equities_yf(eq_symbols, stats) if eq_symbols else {}
 
         # 2) Cripto individual
         crypto_rows = [r for r in portfolio if r["classe"] == "CRIPTO"]
         crypto_prices = {}
         for r in crypto_rows:
-            px = price_crypto_symbol(r["ticker"])
+            px = price_crypto_symbol(r["ticker"], stats)
             if px is not None:
                 crypto_prices[r["ticker"].upper()] = px
 
@@ -218,24 +239,28 @@ def sync(db_path: str):
             inicio = r.get("inicio")
             nominal = float(r.get("nominal") or 0.0)  # opcional, inclua na sua tabela
             if pct > 0 and inicio:
-                val = accrue_cdb(nominal or 1000.0, pct, inicio, TODAY)
+                val = accrue_cdb(nominal or 1000.0, pct, inicio, dt.date.today(), stats)
                 rf_prices[r["ticker"].upper()] = brl(val)
 
-        # Persistir (apenas ativos que retornaram preço)
-        for sym, price in eq_prices.items():
-            upsert_quote(conn, sym.replace(".SA",""), price, "yfinance/stooq")
-        for sym, price in crypto_prices.items():
-            upsert_quote(conn, sym, price, "coinbase/binance + BCB USD/BRL")
-        for sym, price in rf_prices.items():
-            upsert_quote(conn, sym, price, "BCB CDI accrual")
+        # Persistir (apenas ativos que retornaram preço) — um executemany, uma transação
+        rows: List[Tuple[str, float, str]] = []
+        rows += [(sym.replace(".SA",""), price, "yfinance/stooq") for sym, price in eq_prices.items()]
+        rows += [(sym, price, "coinbase/binance + BCB USD/BRL") for sym, price in crypto_prices.items()]
+        rows += [(sym, price, "BCB CDI accrual") for sym, price in rf_prices.items()]
+        with conn:
+            upsert_quotes(conn, rows)
+            metrics = stats.persist(conn)
+            cache.marcar(conn, *cache.PRICE_TAGS)   # outros processos invalidam só o que depende de preço
 
         # Resumo
         print(json.dumps({
             "equities": eq_prices,
             "crypto": crypto_prices,
-            "cdb": rf_prices
+            "cdb": rf_prices,
+            "metrics": metrics,
         }, ensure_ascii=False, indent=2))
         print("✔ Cotações atualizadas.")
+        return metrics
     finally:
         conn.close()
 
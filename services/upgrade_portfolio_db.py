@@ -134,40 +134,152 @@ BEGIN INSERT INTO audit_log(tabela,registro_id,acao) VALUES('proventos', NEW.id,
 CREATE TRIGGER IF NOT EXISTS trg_audit_proventos_ad AFTER DELETE ON proventos
 BEGIN INSERT INTO audit_log(tabela,registro_id,acao) VALUES('proventos', OLD.id, 'DELETE'); END;
 
+-- ================= Posição acumulada (running position) =================
+-- qtd_acum = quantidade do ativo ao fim do dia 'data' (compras - vendas até a data, inclusive).
+-- Mantida pelos triggers abaixo: um lançamento no dia d soma o delta nas linhas com data >= d
+-- (em carga cronológica são só as do próprio dia). A checagem de venda vira uma busca na PK.
+CREATE TABLE IF NOT EXISTS posicao_acumulada(
+  ativo_id INTEGER NOT NULL,
+  data TEXT NOT NULL,
+  qtd_acum REAL NOT NULL,
+  PRIMARY KEY (ativo_id, data)
+) WITHOUT ROWID;
+
+DROP TRIGGER IF EXISTS trg_posicao_ai;
+CREATE TRIGGER trg_posicao_ai AFTER INSERT ON trades
+BEGIN
+  INSERT OR IGNORE INTO posicao_acumulada(ativo_id, data, qtd_acum)
+  VALUES (NEW.ativo_id, date(NEW.data),
+          IFNULL((SELECT qtd_acum FROM posicao_acumulada
+                   WHERE ativo_id = NEW.ativo_id AND data < date(NEW.data)
+                   ORDER BY data DESC LIMIT 1), 0));
+  UPDATE posicao_acumulada
+     SET qtd_acum = qtd_acum + CASE WHEN NEW.tipo='C' THEN NEW.quantidade ELSE -NEW.quantidade END
+   WHERE ativo_id = NEW.ativo_id AND data >= date(NEW.data);
+END;
+
+DROP TRIGGER IF EXISTS trg_posicao_ad;
+CREATE TRIGGER trg_posicao_ad AFTER DELETE ON trades
+BEGIN
+  UPDATE posicao_acumulada
+     SET qtd_acum = qtd_acum - CASE WHEN OLD.tipo='C' THEN OLD.quantidade ELSE -OLD.quantidade END
+   WHERE ativo_id = OLD.ativo_id AND data >= date(OLD.data);
+END;
+
+DROP TRIGGER IF EXISTS trg_posicao_au;
+CREATE TRIGGER trg_posicao_au AFTER UPDATE OF data, ativo_id, tipo, quantidade ON trades
+BEGIN
+  UPDATE posicao_acumulada
+     SET qtd_acum = qtd_acum - CASE WHEN OLD.tipo='C' THEN OLD.quantidade ELSE -OLD.quantidade END
+   WHERE ativo_id = OLD.ativo_id AND data >= date(OLD.data);
+  INSERT OR IGNORE INTO posicao_acumulada(ativo_id, data, qtd_acum)
+  VALUES (NEW.ativo_id, date(NEW.data),
+          IFNULL((SELECT qtd_acum FROM posicao_acumulada
+                   WHERE ativo_id = NEW.ativo_id AND data < date(NEW.data)
+                   ORDER BY data DESC LIMIT 1), 0));
+  UPDATE posicao_acumulada
+     SET qtd_acum = qtd_acum + CASE WHEN NEW.tipo='C' THEN NEW.quantidade ELSE -NEW.quantidade END
+   WHERE ativo_id = NEW.ativo_id AND data >= date(NEW.data);
+END;
+
 -- ================= Trigger anti short-sell (venda > posição)
--- (simples; não cobre concorrência/mesmo timestamp)
-CREATE TRIGGER IF NOT EXISTS trg_no_short_sell BEFORE INSERT ON trades
+-- A venda no dia d reduz a posição de d em diante: vale a menor entre a posição em d
+-- (última linha com data <= d) e MIN(qtd_acum) das linhas com data >= d — duas buscas na PK.
+-- Assim uma venda retroativa não deixa negativa uma posição posterior.
+-- (versões antigas somavam todos os trades do ativo a cada INSERT — quadrático em cargas)
+DROP TRIGGER IF EXISTS trg_no_short_sell;
+CREATE TRIGGER trg_no_short_sell BEFORE INSERT ON trades
 WHEN NEW.tipo = 'V'
 BEGIN
   SELECT CASE
-    WHEN (
-      (SELECT IFNULL(SUM(CASE WHEN tipo='C' THEN quantidade ELSE -quantidade END),0)
-         FROM trades
-        WHERE ativo_id = NEW.ativo_id
-          AND date(data) <= date(NEW.data)
-      ) - NEW.quantidade
-    ) < -0.0001
+    WHEN MIN(IFNULL((SELECT qtd_acum FROM posicao_acumulada
+                      WHERE ativo_id = NEW.ativo_id AND data <= date(NEW.data)
+                      ORDER BY data DESC LIMIT 1), 0),
+             IFNULL((SELECT MIN(qtd_acum) FROM posicao_acumulada
+                      WHERE ativo_id = NEW.ativo_id AND data >= date(NEW.data)), 1e300))
+         - NEW.quantidade < -0.0001
     THEN RAISE(ABORT, 'Venda supera quantidade disponível.')
   END;
 END;
 
-CREATE TRIGGER IF NOT EXISTS trg_no_short_sell_upd BEFORE UPDATE ON trades
+DROP TRIGGER IF EXISTS trg_no_short_sell_upd;
+CREATE TRIGGER trg_no_short_sell_upd BEFORE UPDATE ON trades
 WHEN NEW.tipo = 'V'
 BEGIN
+  -- mesma regra do INSERT, descontando a versão antiga do próprio trade onde ela já entrava
   SELECT CASE
-    WHEN (
-      (SELECT IFNULL(SUM(CASE WHEN tipo='C' THEN quantidade ELSE -quantidade END),0)
-         FROM trades
-        WHERE ativo_id = NEW.ativo_id
-          AND date(data) <= date(NEW.data)
-          AND id <> NEW.id
-      ) - NEW.quantidade
-    ) < -0.0001
+    WHEN MIN(IFNULL((SELECT qtd_acum FROM posicao_acumulada
+                      WHERE ativo_id = NEW.ativo_id AND data <= date(NEW.data)
+                      ORDER BY data DESC LIMIT 1), 0)
+             - CASE WHEN OLD.ativo_id = NEW.ativo_id AND date(OLD.data) <= date(NEW.data)
+                    THEN CASE WHEN OLD.tipo='C' THEN OLD.quantidade ELSE -OLD.quantidade END
+                    ELSE 0 END,
+             IFNULL((SELECT MIN(qtd_acum - CASE WHEN OLD.ativo_id = NEW.ativo_id AND date(OLD.data) <= data
+                                                THEN CASE WHEN OLD.tipo='C' THEN OLD.quantidade
+                                                          ELSE -OLD.quantidade END
+                                                ELSE 0 END)
+                       FROM posicao_acumulada
+                      WHERE ativo_id = NEW.ativo_id AND data >= date(NEW.data)), 1e300))
+         - NEW.quantidade < -0.0001
     THEN RAISE(ABORT, 'Venda supera quantidade disponível.')
   END;
 END;
 """)
 
+REBUILD_POSICAO = """
+DELETE FROM posicao_acumulada;
+INSERT INTO posicao_acumulada(ativo_id, data, qtd_acum)
+SELECT ativo_id, dia, SUM(delta) OVER (PARTITION BY ativo_id ORDER BY dia)
+  FROM (SELECT ativo_id, date(data) AS dia,
+               SUM(CASE WHEN tipo='C' THEN quantidade ELSE -quantidade END) AS delta
+          FROM trades GROUP BY ativo_id, date(data));
+"""
+
+def rebuild_posicao(con: sqlite3.Connection) -> None:
+    """Recalcula posicao_acumulada a partir de trades (migração ou correção)."""
+    con.executescript(REBUILD_POSICAO)
+
+def posicao_em(con: sqlite3.Connection, ativo_id: int, data: str) -> float:
+    """Quantidade do ativo ao fim do dia 'data' — uma busca na PK de posicao_acumulada."""
+    row = con.execute("SELECT qtd_acum FROM posicao_acumulada WHERE ativo_id = ? AND data <= date(?) "
+                      "ORDER BY data DESC LIMIT 1", (int(ativo_id), str(data))).fetchone()
+    return float(row[0]) if row else 0.0
+
+def validar_vendas(con: sqlite3.Connection, novos, tol: float = 1e-4):
+    """
+    Checa um lote inteiro (DataFrame: ativo_id, data 'YYYY-MM-DD', tipo 'C'/'V', quantidade)
+    numa passada ordenada: posição existente na data (merge_asof em posicao_acumulada)
+    + soma acumulada do próprio lote, e também as posições existentes DEPOIS de cada venda
+    (uma venda retroativa não pode deixá-las negativas). Retorna as vendas do lote culpadas:
+    a última venda do lote antes de cada ponto em que a posição fica negativa.
+    """
+    import pandas as pd
+    if novos.empty:
+        return novos
+    n = novos.assign(_delta=novos["quantidade"].where(novos["tipo"] == "C", -novos["quantidade"]),
+                     _venda=(novos["tipo"] == "V").astype(int), _dia=pd.to_datetime(novos["data"]),
+                     ativo_id=novos["ativo_id"].astype("int64"), _pos=range(len(novos)))
+    n = n.sort_values(["_dia", "_venda"], kind="mergesort")          # compras antes das vendas no dia
+    ids = sorted(set(n["ativo_id"].tolist()))
+    base = pd.read_sql_query(
+        f"SELECT ativo_id, data, qtd_acum FROM posicao_acumulada WHERE ativo_id IN ({','.join('?' * len(ids))})",
+        con, params=ids)
+    base = base.assign(_dia=pd.to_datetime(base["data"]), ativo_id=base["ativo_id"].astype("int64"))
+    base = base.drop(columns="data").sort_values("_dia")
+    n["_acum_lote"] = n.groupby("ativo_id")["_delta"].cumsum()
+    n = pd.merge_asof(n, base, on="_dia", by="ativo_id", direction="backward")
+    n["_saldo"] = pd.to_numeric(n["qtd_acum"], errors="coerce").fillna(0.0) + n["_acum_lote"]
+    # linhas existentes (fim do dia) somadas ao acumulado do lote até a data; antes do lote não mudam
+    e = pd.merge_asof(base, n[["_dia", "ativo_id", "_acum_lote"]], on="_dia", by="ativo_id",
+                      direction="backward").dropna(subset=["_acum_lote"])
+    e = e.assign(_saldo=e["qtd_acum"] + e["_acum_lote"], _venda=2)
+    linha = pd.concat([n[["ativo_id", "_dia", "_venda", "_saldo", "_pos"]],
+                       e[["ativo_id", "_dia", "_venda", "_saldo"]]], ignore_index=True)
+    linha = linha.sort_values(["ativo_id", "_dia", "_venda"], kind="mergesort")
+    culpada = linha["_pos"].where(linha["_venda"] == 1).groupby(linha["ativo_id"]).ffill()
+    ruins = culpada[linha["_saldo"] < -tol].dropna().astype(int).unique()
+    return novos.iloc[sorted(ruins)]
+
 def run(db_path: Path, make_backup: bool = True):
     if not db_path.exists():
         raise SystemExit(f"DB não encontrado: {db_path}")
@@ -178,6 +290,7 @@ def run(db_path: Path, make_backup: bool = True):
     con = sqlite3.connect(db_path)
     try:
         con.executescript(DDL)
+        rebuild_posicao(con)
         con.commit()
         print("Schema atualizado ✅")
     finally:
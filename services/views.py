@@ -0,0 +1,142 @@
+# services/views.py
+# "Visões" filtradas do fluxo de caixa, calculadas uma vez por (versão do dataset, filtros).
+# Os callbacks de Extratos só leem daqui: KPIs, gráficos e metas compartilham a mesma seleção.
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Optional, Sequence, Tuple
+
+import functools
+
+import pandas as pd
+
+from services import db as _db
+from services.cache import memoize
+from services.globals import filter_period_and_categories, series_by_period
+
+_LOADERS = {
+    "receitas": _db.load_receitas,
+    "despesas": _db.load_despesas,
+    "investimentos": _db.load_investimentos,
+}
+
+
+def coerce_fluxo(df: pd.DataFrame, tabela: Optional[str] = None) -> pd.DataFrame:
+    df = df.copy()
+    if df.empty: return df
+    if "Data" in df.columns:
+        df["Data"] = pd.to_datetime(df["Data"], errors="coerce").dt.normalize()
+    if "Valor" in df.columns:
+        df["Valor"] = pd.to_numeric(df["Valor"], errors="coerce").fillna(0.0)
+    if "Descrição" in df.columns:
+        df["Descrição"] = df["Descrição"].astype(str)
+    if "Categoria" in df.columns:
+        # dicionário do cadastro cat_<tabela>: filtros e groupby das visões trabalham nos códigos
+        df["Categoria"] = _db.como_categoria(df["Categoria"].astype(str), _db.cadastro_categorias(tabela))
+    return df
+
+
+def apply_extra_filters(df: pd.DataFrame, so_status=False, campo_status=None,
+                        desc_contains=None, valor_min=None, valor_max=None) -> pd.DataFrame:
+    if df.empty: return df
+    mask = pd.Series(True, index=df.index)
+    if so_status and campo_status and campo_status in df.columns: mask &= df[campo_status] == 1
+    if desc_contains:
+        s = _db.texto_busca(str(desc_contains).strip())
+        if s and "Descrição" in df.columns:
+            # mesma normalização do busca_norm do SQL (grid paginado); uma chamada por descrição distinta
+            u = pd.unique(df["Descrição"])
+            norm = dict(zip(u, map(_db.texto_busca, u)))
+            mask &= df["Descrição"].map(norm).str.contains(s, na=False, regex=False)
+    if valor_min is not None: mask &= df["Valor"] >= float(valor_min)
+    if valor_max is not None: mask &= df["Valor"] <= float(valor_max)
+    return df[mask]
+
+
+def prev_window(start, end):
+    if not start or not end: return None, None
+    s = pd.to_datetime(start).normalize(); e = pd.to_datetime(end).normalize()
+    delta = (e - s).days + 1
+    prev_end = s - pd.offsets.Day(1); prev_start = prev_end - pd.offsets.Day(delta - 1)
+    return prev_start, prev_end
+
+
+def _load_frame(table: str) -> pd.DataFrame:
+    return coerce_fluxo(_LOADERS[table](), table)
+
+# um cache por tabela: editar despesas não invalida as visões de receitas
+_FRAMES = {t: memoize(t, maxsize=1)(functools.partial(_load_frame, t)) for t in _LOADERS}
+
+
+def fluxo_frame(table: str) -> pd.DataFrame:
+    """Tabela inteira já normalizada; recarregada só quando a tabela muda."""
+    return _FRAMES[table]()
+
+
+@dataclass
+class FluxoView:
+    atual: pd.DataFrame
+    anterior: pd.DataFrame
+    categorias: list = field(default_factory=list)      # todas as categorias do dataset (opções do dropdown)
+    total_atual: float = 0.0
+    total_anterior: float = 0.0
+    por_categoria: pd.DataFrame = None                  # Categoria, Valor (desc)
+    por_descricao: pd.DataFrame = None                  # top 10 Descrição, Valor
+    por_dia_semana: pd.DataFrame = None                 # Dia, Valor
+    por_periodo: pd.DataFrame = None                    # Periodo, Valor
+
+    @property
+    def vazio(self) -> bool:
+        return self.atual.empty
+
+
+def _dia_semana(d: pd.Series) -> pd.Series:
+    try: return d.dt.day_name(locale="pt_BR").str[:3]
+    except Exception: return d.dt.day_name().str[:3]
+
+
+def _build_view(table: str, start=None, end=None, categorias: Tuple[str, ...] = (),
+                campo_status: Optional[str] = None, so_status: bool = False, busca: Optional[str] = None,
+                valor_min=None, valor_max=None, agrupar: str = "M") -> FluxoView:
+    df = fluxo_frame(table)
+    cats = sorted(map(str, df["Categoria"].dropna().unique())) if not df.empty else []
+    extra = dict(so_status=so_status, campo_status=campo_status, desc_contains=busca,
+                 valor_min=valor_min, valor_max=valor_max)
+
+    atual = apply_extra_filters(filter_period_and_categories(df, start, end, list(categorias)), **extra)
+    prev_s, prev_e = prev_window(start, end)
+    anterior = apply_extra_filters(filter_period_and_categories(df, prev_s, prev_e, list(categorias)), **extra)
+
+    v = FluxoView(atual=atual, anterior=anterior, categorias=cats,
+                  total_atual=float(atual["Valor"].sum()) if not atual.empty else 0.0,
+                  total_anterior=float(anterior["Valor"].sum()) if not anterior.empty else 0.0)
+    if atual.empty:
+        return v
+    v.por_categoria = (atual.groupby("Categoria", as_index=False, observed=True)["Valor"].sum()
+                       .sort_values("Valor", ascending=False))
+    v.por_descricao = (atual.groupby("Descrição", as_index=False)["Valor"].sum()
+                       .sort_values("Valor", ascending=False).head(10))
+    v.por_dia_semana = (atual.assign(Dia=_dia_semana(atual["Data"]))
+                        .groupby("Dia", as_index=False)["Valor"].sum())
+    v.por_periodo = series_by_period(atual, agrupar)
+    return v
+
+_VIEWS = {t: memoize(t, maxsize=16)(functools.partial(_build_view, t)) for t in _LOADERS}
+
+
+def fluxo_view(table: str, **filtros) -> FluxoView:
+    """
+    Seleção do período atual + janela anterior e agregados prontos para os gráficos,
+    calculada uma vez por (versão da tabela, filtros). Filtros nomeados e hasheáveis
+    (categorias como tupla) — ver view_args().
+    """
+    return _VIEWS[table](**filtros)
+
+
+def view_args(start, end, categorias: Optional[Sequence] = None, busca=None, faixa=None) -> dict:
+    """Normaliza os valores vindos dos componentes Dash para chaves hasheáveis."""
+    faixa = faixa or [None, None]
+    return dict(start=start, end=end,
+                categorias=tuple(sorted(str(c) for c in (categorias or []))),
+                busca=(str(busca).strip() or None) if busca else None,
+                valor_min=faixa[0], valor_max=faixa[1])
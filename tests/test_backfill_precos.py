@@ -0,0 +1,79 @@
+# tests/test_backfill_precos.py
+import datetime as dt
+import sqlite3
+
+from services import backfill_precos as bf
+from services import db, quotes
+
+D = dt.date
+FALTANDO = {D(2024, 3, d) for d in (11, 12, 13, 14, 15)}   # uma semana sem cotação
+FERIADO = D(2024, 3, 20)                                   # buraco de um dia só
+
+
+def _uteis(a, b):
+    return [d for d in (a + dt.timedelta(n) for n in range((b - a).days + 1)) if d.weekday() < 5]
+
+
+def _fixture(pasta, ticker, a, b):
+    linhas = ["Date,Open,High,Low,Close,Volume"]
+    linhas += [f"{d.isoformat()},1,1,1,{30 + d.day / 100:.2f},100" for d in _uteis(a, b)]
+    (pasta / f"{ticker}.csv").write_text("\n".join(linhas) + "\n", encoding="utf-8")
+
+
+def _cotacoes_existentes(conn, ticker):
+    quotes.ensure_quote_schema(conn)
+    rows = [(ticker, d, 10.0, "manual") for d in _uteis(D(2024, 3, 4), D(2024, 3, 29))
+            if d not in FALTANDO and d != FERIADO]
+    with conn:
+        quotes.upsert_quotes(conn, rows)
+
+
+def _banco_app():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(db.DDL_TRADES_TABLE)
+    conn.executemany("INSERT INTO trades (Data, Ticker, Tipo, Qtd, Preco) VALUES (?, ?, ?, ?, ?)",
+                     [("2024-03-04", "PETR4", "C", 100, 30.0), ("2024-03-29", "PETR4", "V", 100, 31.0)])
+    _cotacoes_existentes(conn, "PETR4")
+    return conn
+
+
+def test_detect_gaps_no_schema_do_app():
+    conn = _banco_app()
+    gaps = bf.detect_gaps(conn, as_of=D(2024, 4, 30))
+    assert [(g.ticker, g.ativo_id, g.ranges) for g in gaps] == [("PETR4", None, [(D(2024, 3, 11), D(2024, 3, 15))])]
+    # com min_gap=1 o "feriado" também aparece
+    (g,) = bf.detect_gaps(conn, as_of=D(2024, 4, 30), min_gap=1)
+    assert g.ranges == [(D(2024, 3, 11), D(2024, 3, 15)), (FERIADO, FERIADO)]
+
+
+def test_backfill_grava_so_os_dias_faltantes(tmp_path):
+    conn = _banco_app()
+    _fixture(tmp_path, "PETR4", D(2024, 3, 1), D(2024, 4, 5))
+    gravados = bf.backfill(conn, bf.CsvFixtureProvider(tmp_path), as_of=D(2024, 4, 30), chunk_size=2)
+    assert gravados == {"PETR4": 5}
+
+    got = {d: (px, src) for _, d, px, src in quotes.read_quotes(conn, ["PETR4"])}
+    for d in FALTANDO:
+        assert got[d.isoformat()] == (30 + d.day / 100, "fixture")
+    # dias já presentes não são sobrescritos; o buraco de um dia (feriado) fica como está
+    assert got["2024-03-04"] == (10.0, "manual")
+    assert FERIADO.isoformat() not in got
+    # fora do período em carteira nada é gravado
+    assert "2024-03-01" not in got and "2024-04-01" not in got
+    assert bf.detect_gaps(conn, as_of=D(2024, 4, 30)) == []
+
+
+def test_schema_da_carteira_usa_ativo_id_e_classe():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE ativos (id INTEGER PRIMARY KEY, ticker TEXT, classe TEXT);
+        CREATE TABLE trades (id INTEGER PRIMARY KEY, ativo_id INTEGER, data TEXT, tipo TEXT, quantidade REAL);
+        INSERT INTO ativos VALUES (7, 'PETR4', 'Ação'), (8, 'TESOURO', 'RF');
+        INSERT INTO trades (ativo_id, data, tipo, quantidade) VALUES
+            (7, '2024-03-04', 'C', 100), (7, '2024-03-29', 'V', 100), (8, '2024-03-04', 'C', 1);
+    """)
+    _cotacoes_existentes(conn, "PETR4")
+    assert bf.held_periods(conn, as_of=D(2024, 4, 30)) == {
+        7: [(D(2024, 3, 4), D(2024, 3, 29))], 8: [(D(2024, 3, 4), D(2024, 4, 30))]}
+    gaps = bf.detect_gaps(conn, as_of=D(2024, 4, 30))
+    assert [(g.ativo_id, g.ticker, g.dias) for g in gaps] == [(7, "PETR4", 5)]
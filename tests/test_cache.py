@@ -0,0 +1,53 @@
+# tests/test_cache.py
+import sqlite3
+
+import pytest
+
+from services import cache, db
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    caminho = tmp_path / "f.db"
+    monkeypatch.setattr(db, "DB_PATH", caminho)
+    monkeypatch.setattr(db, "_schema_ok", False)
+    db.ensure_core_schema()
+    cache.observar(caminho)
+    yield caminho
+    cache.observar(db.DB_PATH)
+
+
+def _inserir(con, n=3):
+    con.executemany('INSERT INTO despesas (Valor, Data, Categoria, "Descrição") VALUES (?, ?, ?, ?)',
+                    [(1.0, "2024-03-01", "Casa", f"d{i}") for i in range(n)])
+
+
+def test_escrita_pelo_connect_sobe_so_a_tag_da_tabela(banco):
+    antes = cache.versions("despesas", "receitas")
+    with db.connect() as con:          # sem cache.bump: outro processo só vê o banco
+        _inserir(con, 50)
+    depois = cache.versions("despesas", "receitas")
+    assert depois[0] == antes[0] + 1   # uma vez por transação, não por linha
+    assert depois[1] == antes[1]
+
+
+def test_outra_conexao_marcada_ou_nao(banco):
+    ext = sqlite3.connect(banco)
+    antes = cache.versions("despesas", "precos")
+    with ext:
+        _inserir(ext)
+        cache.marcar(ext, "despesas")
+    meio = cache.versions("despesas", "precos")
+    assert meio == (antes[0] + 1, antes[1])
+    with ext:                          # commit sem marcar(): tag desconhecida, invalida tudo
+        _inserir(ext)
+    fim = cache.versions("despesas", "precos")
+    assert fim[0] > meio[0] and fim[1] > meio[1]
+    ext.close()
+
+
+def test_sem_trigger_por_linha(banco):
+    with db.connect() as con:
+        nomes = [n for (n,) in con.execute("SELECT name FROM sqlite_master WHERE type='trigger' "
+                                           "AND name LIKE 'trg_%_cache_%'")]
+    assert nomes == []
@@ -0,0 +1,36 @@
+# tests/test_db.py
+import pytest
+
+from services import db
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "f.db")
+    monkeypatch.setattr(db, "_schema_ok", False)
+    db.ensure_core_schema()
+    return tmp_path / "f.db"
+
+
+def _despesas(descricoes):
+    with db.connect() as con:
+        con.executemany('INSERT INTO despesas (Valor, Data, Categoria, "Descrição") VALUES (?, ?, ?, ?)',
+                        [(10.0, "2024-03-01", "Casa", d) for d in descricoes])
+
+
+def test_busca_trata_porcento_e_sublinhado_como_texto(banco):
+    _despesas(["Desconto 50%", "Desconto 500", "IPTU_2024", "IPTUX2024", "Água"])
+    achados = lambda **kw: sorted(db.query_fluxo_page("despesas", page_size=None, **kw)[0]["Descrição"])
+    assert achados(busca="50%") == ["Desconto 50%"]
+    assert achados(busca="iptu_2024") == ["IPTU_2024"]
+    assert achados(busca="agua") == ["Água"]
+    assert achados(filter_query='{Descrição} contains "U_2"') == ["IPTU_2024"]
+
+
+def test_pagina_alem_do_fim_cai_na_ultima_valida(banco):
+    _despesas([f"d{i}" for i in range(35)])
+    df, total = db.query_fluxo_page("despesas", page_current=5, page_size=15)
+    assert total == 35 and len(df) == 5                    # 3ª página (índice 2)
+    assert db.pagina_valida(5, total, 15) == 2
+    df, total = db.query_fluxo_page("despesas", busca="nada", page_current=5, page_size=15)
+    assert total == 0 and df.empty and db.pagina_valida(5, total, 15) == 0
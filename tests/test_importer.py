@@ -0,0 +1,79 @@
+# tests/test_importer.py
+import sqlite3
+
+import pytest
+
+from services import importer
+
+
+def _csv(path, linhas):
+    path.write_text("Data;Valor;Descrição\n" + "\n".join(linhas) + "\n", encoding="utf-8")
+    return path
+
+
+def test_extratos_sobrepostos_no_mesmo_lote_nao_duplicam(tmp_path):
+    a = _csv(tmp_path / "a.csv", ["01/03/2024;-25,90;UBER TRIP", "02/03/2024;-10,00;PADARIA"])
+    b = _csv(tmp_path / "b.csv", ["01/03/2024;-25,90;UBER TRIP", "05/03/2024;-80,00;POSTO"])
+    conn = sqlite3.connect(":memory:")
+    rel = importer.importar([a, b], conn)
+    assert rel.inseridos == 3 and rel.duplicados == 1
+    assert conn.execute("SELECT COUNT(*) FROM despesas WHERE \"Descrição\" = 'UBER TRIP'").fetchone()[0] == 1
+    # reimportar tudo de novo não insere nada
+    assert importer.importar([a, b], conn).inseridos == 0
+
+
+def test_repeticao_dentro_do_arquivo_continua_sendo_duas_linhas(tmp_path):
+    a = _csv(tmp_path / "a.csv", ["01/03/2024;-25,90;UBER TRIP", "01/03/2024;-25,90;UBER TRIP"])
+    b = _csv(tmp_path / "b.csv", ["01/03/2024;-25,90;UBER TRIP"])
+    conn = sqlite3.connect(":memory:")
+    assert importer.importar([a, b], conn).inseridos == 2
+
+
+def test_utf8_com_multibyte_na_borda_da_amostra(tmp_path):
+    cab = "Data;Valor;Descrição\n"
+    linha = "01/03/2024;-12,00;AÇOUGUE\n"
+    # 'Ç' (2 bytes) começa no último byte da amostra de 64 KB
+    antes = len(cab.encode()) + len("02/03/2024;-1,00;\n") + len("01/03/2024;-12,00;A")
+    enchimento = "02/03/2024;-1,00;" + "X" * (65535 - antes) + "\n"
+    arq = tmp_path / "c.csv"
+    arq.write_text(cab + enchimento + linha, encoding="utf-8")
+    assert arq.read_bytes()[65535:65537] == "Ç".encode()
+    descricoes = [l.descricao for l in importer.iter_csv(arq)]
+    assert descricoes[-1] == "AÇOUGUE"
+
+
+def _nota(path, linhas):
+    path.write_text("Data;Ticker;Tipo;Quantidade;Preco\n" + "\n".join(linhas) + "\n", encoding="utf-8")
+    return path
+
+
+def test_trades_em_blocos_reimportar_nao_duplica(tmp_path):
+    # venda no 1º bloco, compra que a cobre num bloco posterior (chunk=1)
+    nota = _nota(tmp_path / "nota.csv", ["10/03/2024;PETR4;V;50;38,00", "05/03/2024;PETR4;C;100;36,50",
+                                          "05/03/2024;PETR4;C;100;36,50"])
+    conn = sqlite3.connect(":memory:")
+    rel = importer.importar_trades([nota], conn, chunk=1)
+    assert rel.inseridos == 3 and rel.lotes == 3
+    rel = importer.importar_trades([nota], conn, chunk=1)
+    assert rel.inseridos == 0 and rel.duplicados == 3
+    assert conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 3
+
+
+def test_trades_venda_descoberta_nao_grava_nada(tmp_path):
+    nota = _nota(tmp_path / "nota.csv", ["05/03/2024;VALE3;C;10;60,00", "06/03/2024;VALE3;V;11;61,00"])
+    conn = sqlite3.connect(":memory:")
+    with pytest.raises(importer.VendaDescoberta) as e:
+        importer.importar_trades([nota], conn, chunk=1)
+    assert len(e.value.linhas) == 1
+    assert conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 0
+
+
+def test_trades_venda_retroativa_que_descobre_venda_posterior(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    importer.importar_trades([_nota(tmp_path / "a.csv", ["05/03/2024;PETR4;C;100;36,50",
+                                                         "10/03/2024;PETR4;V;50;38,00"])], conn)
+    # 60 cabem em 09/03, mas a venda já gravada de 10/03 ficaria descoberta
+    with pytest.raises(importer.VendaDescoberta) as e:
+        importer.importar_trades([_nota(tmp_path / "b.csv", ["09/03/2024;PETR4;V;60;37,00"])], conn)
+    assert len(e.value.linhas) == 1
+    assert importer.importar_trades([_nota(tmp_path / "c.csv", ["09/03/2024;PETR4;V;50;37,00"])], conn).inseridos == 1
@@ -0,0 +1,73 @@
+# tests/test_ir.py
+import pytest
+
+from services import db, ir
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "f.db")
+    monkeypatch.setattr(db, "_schema_ok", False)
+    db.ensure_core_schema()
+    ir.apuracao_bolsa.cache_clear()
+    yield
+    ir.apuracao_bolsa.cache_clear()
+
+
+def _swing(c, v, ticker, qtd, compra, venda):
+    db.insert_trade(c, ticker, "C", qtd, compra, 0, None)
+    db.insert_trade(v, ticker, "V", qtd, venda, 0, None)
+
+
+def test_apuracao_mensal(banco):
+    _swing("2024-01-10", "2024-01-20", "PETR4", 1000, 30, 40)     # 40k vendidos, +10k
+    _swing("2024-02-01", "2024-02-15", "VALE3", 500, 30, 36)      # 18k vendidos: isento
+    _swing("2024-03-01", "2024-03-10", "BBAS3", 1000, 50, 45)     # -5k de prejuízo
+    _swing("2024-04-01", "2024-04-10", "ITUB4", 1000, 25, 33)     # +8k, compensa os 5k
+    db.insert_trade("2024-05-06", "WEGE3", "C", 150, 40, 0, None)  # day-trade de 100 + sobra de 50
+    db.insert_trade("2024-05-06", "WEGE3", "V", 100, 42, 0, None)
+    db.insert_trade("2024-06-03", "WEGE3", "V", 50, 50, 0, None)   # sobra pelo preço médio de 40
+    _swing("2024-07-01", "2024-07-10", "ABEV3", 2000, 12, 12.03)  # imposto 9: DARF < 10 fica pendente
+    _swing("2024-08-01", "2024-08-12", "ABEV3", 2000, 12, 12.03)
+
+    m = ir.apuracao_bolsa().set_index("mes")
+    assert m["ano"].eq(2024).all() and list(m.index) == [1, 2, 3, 4, 5, 6, 7, 8]
+
+    jan = m.loc[1]
+    assert (jan["vendas_acoes_comum"], jan["lucro_acoes_comum"], jan["imposto_devido"]) == (40000, 10000, 1500)
+    assert jan["darf_6015"] == pytest.approx(1500 - 40000 * ir.IRRF_COMUM)
+
+    assert m.loc[2, "lucro_acoes_comum"] == 3000 and m.loc[2, "imposto_devido"] == 0   # isenção dos 20k
+    assert m.loc[3, "prej_comum"] == 5000 and m.loc[3, "darf_6015"] == 0
+
+    abr = m.loc[4]
+    assert abr["base_calculo"] == 3000 and abr["imposto_devido"] == 450 and abr["prej_comum"] == 0
+    irrf_acumulado = (18000 + 45000 + 33000) * ir.IRRF_COMUM                    # fev e mar sem imposto
+    assert abr["irrf_compensado"] == pytest.approx(irrf_acumulado, abs=0.01)
+    assert abr["darf_6015"] == pytest.approx(450 - irrf_acumulado, abs=0.01)
+
+    mai = m.loc[5]
+    assert (mai["vendas_daytrade"], mai["lucro_daytrade"], mai["vendas_acoes_comum"]) == (4200, 200, 0)
+    assert mai["imposto_devido"] == 40 and mai["irrf_daytrade"] == 2
+    assert mai["darf_6015"] == 38
+
+    assert m.loc[6, "lucro_acoes_comum"] == 500 and m.loc[6, "darf_6015"] == 0
+
+    irrf_mes = 24060 * ir.IRRF_COMUM
+    assert m.loc[7, "imposto_devido"] == pytest.approx(9) and m.loc[7, "darf_6015"] == 0
+    pendente = 9 - irrf_mes - 2500 * ir.IRRF_COMUM                               # IRRF de junho sobrou
+    assert m.loc[8, "darf_6015"] == pytest.approx(round(pendente + 9 - irrf_mes, 2), abs=0.01)
+
+    rv = ir.consolidar_pf_bolsa_auto(2024)
+    assert list(rv.columns) == ir.PF_RV_CAMPOS and len(rv) == 8
+    assert ir.consolidar_pf_bolsa_auto(2023).empty
+
+
+def test_prejuizo_de_day_trade_nao_compensa_lucro_comum(banco):
+    db.insert_trade("2024-03-04", "PETR4", "C", 1000, 40, 0, None)
+    db.insert_trade("2024-03-04", "PETR4", "V", 1000, 38, 0, None)   # day-trade: -2k
+    _swing("2024-04-01", "2024-04-10", "VALE3", 1000, 60, 65)      # comum: +5k em 65k vendidos
+    m = ir.apuracao_bolsa().set_index("mes")
+    assert m.loc[3, "prej_daytrade"] == 2000
+    assert m.loc[4, "base_calculo"] == 5000 and m.loc[4, "imposto_devido"] == 750
+    assert m.loc[4, "prej_daytrade"] == 2000
@@ -0,0 +1,45 @@
+# tests/test_irpf.py
+import numpy as np
+import pytest
+
+from services import irpf
+
+# tabela anual oficial: (limite superior, alíquota, parcela a deduzir)
+PARCELAS = {
+    2022: [(22847.76, 0.0, 0.0), (33919.80, 0.075, 1713.58), (45012.60, 0.15, 4257.57),
+           (55976.16, 0.225, 7633.51), (np.inf, 0.275, 10432.32)],
+    2023: [(24511.92, 0.0, 0.0), (33919.80, 0.075, 1838.39), (45012.60, 0.15, 4382.38),
+           (55976.16, 0.225, 7758.32), (np.inf, 0.275, 10557.13)],
+    2024: [(26963.20, 0.0, 0.0), (33919.80, 0.075, 2022.24), (45012.60, 0.15, 4566.23),
+           (55976.16, 0.225, 7942.17), (np.inf, 0.275, 10740.98)],
+}
+
+
+def _oficial(base, ano):
+    for limite, aliq, parcela in PARCELAS[ano]:
+        if base <= limite:
+            return max(base * aliq - parcela, 0.0)
+
+
+@pytest.mark.parametrize("ano", sorted(PARCELAS))
+def test_faixas_batem_com_a_parcela_a_deduzir(ano):
+    bases = [0, 10000, 22847.76, 24511.92, 26963.20, 30000, 33919.80, 40000, 45012.60, 50000,
+             55976.16, 60000, 250000]
+    got = irpf.imposto(bases, ano)
+    # a parcela a deduzir oficial é arredondada no centavo
+    assert got == pytest.approx([_oficial(b, ano) for b in bases], abs=0.02)
+
+
+def test_imposto_60k_2024_e_ano_fora_da_tabela():
+    assert round(float(irpf.imposto(60000, 2024)), 2) == 5759.02
+    assert irpf.imposto(60000, 2030) == irpf.imposto(60000, 2024)
+    assert irpf.imposto(60000, 2010) == irpf.imposto(60000, 2015)
+
+
+def test_cenarios_teto_do_simplificado_e_do_pgbl():
+    c = irpf.cenarios([50000, 200000], irrf=1000, deducoes=5000, pgbl=30000, ano=2024)
+    assert c["desconto_simplificado"].tolist() == [10000, 16754.34]
+    assert c["pgbl_dedutivel"].tolist() == [6000, 24000]          # 12% da renda
+    assert c.loc[1, "base_completo"] == 200000 - 5000 - 24000
+    assert c.loc[1, "imposto_completo"] == pytest.approx(float(irpf.imposto(171000, 2024)) - 1000)
+    assert (c["imposto"] == c[["imposto_completo", "imposto_simplificado"]].min(axis=1)).all()
@@ -0,0 +1,103 @@
+# tests/test_price_matrix.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import db, performance, price_matrix, quotes
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "f.db")
+    monkeypatch.setattr(db, "_schema_ok", False)
+    _pasta(monkeypatch, tmp_path / "matriz")
+    db.ensure_core_schema()
+    return tmp_path
+
+
+def _pasta(monkeypatch, pasta):
+    monkeypatch.setattr(price_matrix, "PASTA", pasta)
+    monkeypatch.setattr(price_matrix, "ARQ_DADOS", pasta / "precos.bin")
+    monkeypatch.setattr(price_matrix, "ARQ_META", pasta / "meta.json")
+
+
+def _precos(linhas):
+    db.upsert_precos(pd.DataFrame(linhas, columns=["Ticker", "data", "preco"]))
+
+
+def _sujos():
+    with db.connect() as con:
+        return dict(con.execute("SELECT t.ticker, m.dia_min FROM matriz_suja m "
+                                "JOIN quote_tickers t ON t.id = m.ticker_id").fetchall())
+
+
+def _tabela(m):
+    return m.janela(m.inicio, m.fim).sort_index().copy()
+
+
+def _confere(tmp_path, monkeypatch):
+    """Matriz atual == rebuild completo em outra pasta (mesmos tickers, dias e valores)."""
+    m = price_matrix.abrir(refrescar=False)
+    inc = _tabela(m)
+    pasta = price_matrix.PASTA
+    _pasta(monkeypatch, tmp_path / "completo")
+    try:
+        with db.connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            price_matrix._rebuild(con)      # sem atualizar(): matriz_suja fica para a matriz principal
+        ref = _tabela(price_matrix.abrir(refrescar=False))
+    finally:
+        _pasta(monkeypatch, pasta)
+    pd.testing.assert_frame_equal(inc, ref)
+    return m
+
+
+def test_estende_e_reescreve_so_o_trecho_sujo(banco, monkeypatch):
+    _precos([("PETR4", "2023-01-02", 30.0), ("PETR4", "2023-01-05", 31.0),
+             ("VALE3", "2023-01-03", 70.0), ("VALE3", "2023-01-10", 72.0)])
+    assert price_matrix.atualizar()["modo"] == "completo"
+    assert _sujos() == {}
+    assert price_matrix.atualizar() == {"modo": "sem mudanças"}
+
+    _precos([("PETR4", "2023-01-20", 33.0), ("ITUB4", "2023-01-04", 25.0)])   # dias novos + ticker novo
+    assert _sujos() == {"PETR4": quotes.day_of("2023-01-20"), "ITUB4": quotes.day_of("2023-01-04")}
+    r = price_matrix.atualizar()
+    assert (r["modo"], r["colunas"], r["dias"]) == ("incremental", 2, 19)
+    m = _confere(banco, monkeypatch)
+    assert m.tickers == ("PETR4", "VALE3", "ITUB4")                          # coluna nova no fim
+    assert m.ultimo("2023-01-15").to_dict() == {"PETR4": 31.0, "VALE3": 72.0, "ITUB4": 25.0}
+
+    db.upsert_preco("VALE3", "2023-01-03", 69.0)                               # UPDATE
+    db.delete_precos([("PETR4", "2023-01-05")])                                # DELETE: volta ao ffill de 30
+    assert _sujos() == {"VALE3": quotes.day_of("2023-01-03"), "PETR4": quotes.day_of("2023-01-05")}
+    assert price_matrix.atualizar()["modo"] == "incremental"
+    m = _confere(banco, monkeypatch)
+    assert m.ultimo("2023-01-06", ["PETR4", "VALE3"]).to_dict() == {"PETR4": 30.0, "VALE3": 69.0}
+
+
+def test_cotacao_antes_do_primeiro_dia_reconstroi(banco, monkeypatch):
+    _precos([("PETR4", "2023-03-01", 30.0), ("VALE3", "2023-03-02", 70.0)])
+    price_matrix.atualizar()
+    _precos([("VALE3", "2022-12-30", 65.0)])
+    r = price_matrix.atualizar()
+    assert r["modo"] == "completo" and _sujos() == {}
+    m = _confere(banco, monkeypatch)
+    assert m.inicio == pd.Timestamp("2022-12-30")
+    assert np.isnan(m.janela("2022-12-30", "2022-12-30", ["PETR4"]).iloc[0, 0])
+    assert m.ultimo("2023-01-31").to_dict() == {"VALE3": 65.0}
+
+
+def test_build_positions_daily_matriz_igual_ao_pivot(banco):
+    db.insert_trade("2023-01-03", "PETR4", "C", 100, 30, 1, None)
+    db.insert_trade("2023-01-09", "VALE3", "C", 10, 70, 0, None)
+    db.insert_trade("2023-01-16", "PETR4", "V", 40, 33, 1, None)
+    _precos([("PETR4", "2023-01-02", 30.0), ("PETR4", "2023-01-10", 32.0), ("PETR4", "2023-01-18", 34.0),
+             ("VALE3", "2023-01-05", 70.0), ("VALE3", "2023-01-12", 71.0),
+             ("ITUB4", "2023-01-04", 25.0)])                                  # cotado, sem posição
+    price_matrix.atualizar()
+    db.upsert_preco("VALE3", "2023-01-20", 73.0)                               # pendente: abrir() refresca
+
+    pivot = performance.build_positions_daily(usar_snapshot=False, usar_matriz=False)
+    matriz = performance.build_positions_daily(usar_snapshot=False, usar_matriz=True)
+    pd.testing.assert_frame_equal(matriz, pivot)
+    assert pivot["vm_total"].iloc[-1] == pytest.approx(60 * 34 + 10 * 73)
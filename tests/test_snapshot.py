@@ -0,0 +1,112 @@
+# tests/test_snapshot.py
+import pandas as pd
+import pytest
+
+from services import db, snapshot
+
+
+@pytest.fixture(params=["npy", "parquet"])
+def banco(request, tmp_path, monkeypatch):
+    if request.param == "parquet" and snapshot._pq is None:
+        pytest.skip("pyarrow não instalado")
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "f.db")
+    monkeypatch.setattr(db, "_schema_ok", False)
+    monkeypatch.setattr(snapshot, "PASTA", tmp_path / "snap")
+    monkeypatch.setattr(snapshot, "FORMATO", request.param)
+    monkeypatch.setattr(snapshot, "_SCHEMA_OK", False)
+    db.ensure_core_schema()
+    return tmp_path
+
+
+def _despesa(con, data, valor):
+    con.execute('INSERT INTO despesas (Valor, Data, Categoria, "Descrição") VALUES (?, ?, ?, ?)',
+                (valor, data, "Casa", f"d {data}"))
+
+
+def _reconstruido(tmp_path, monkeypatch, tabela):
+    """Partições de um export completo em outra pasta: {ano: DataFrame}."""
+    pasta = snapshot.PASTA
+    monkeypatch.setattr(snapshot, "PASTA", tmp_path / "completo")
+    try:
+        snapshot.atualizar([tabela], completo=True)
+        return _particoes(tabela)
+    finally:
+        monkeypatch.setattr(snapshot, "PASTA", pasta)
+
+
+def _particoes(tabela):
+    return {a: snapshot.carregar(tabela, anos=[a], refrescar=False) for a in snapshot._anos_em_disco(tabela)}
+
+
+def _confere(tmp_path, monkeypatch, tabela):
+    inc = _particoes(tabela)
+    ref = _reconstruido(tmp_path, monkeypatch, tabela)
+    assert sorted(inc) == sorted(ref)
+    for ano in ref:
+        pd.testing.assert_frame_equal(inc[ano], ref[ano])
+
+
+def test_despesas_incremental_igual_ao_completo(banco, monkeypatch):
+    with db.connect() as con:
+        for data in ("2022-03-01", "2022-07-10", "2023-01-05", "2024-02-02", "2024-09-30"):
+            _despesa(con, data, 10.0)
+    assert snapshot.atualizar(["despesas"]) == {"despesas": [2022, 2023, 2024]}
+    assert snapshot.desatualizadas(["despesas"]) == []
+    assert snapshot.atualizar(["despesas"]) == {"despesas": []}      # em dia: nada a reescrever
+
+    with db.connect() as con:
+        _despesa(con, "2025-01-15", 5.0)                                # acima da marca d'água
+        _despesa(con, "2021-12-31", 7.0)                                # id novo, ano antigo
+        con.execute("UPDATE despesas SET Data = '2023-06-01' WHERE Data = '2022-07-10'")
+        con.execute("DELETE FROM despesas WHERE Data LIKE '2024-%'")    # 2024 fica vazio
+        sujos = {a for (a,) in con.execute("SELECT ano FROM snapshot_sujo WHERE tabela = 'despesas'")}
+    assert sujos == {2022, 2023, 2024}
+
+    assert snapshot.atualizar(["despesas"]) == {"despesas": [2021, 2022, 2023, 2024, 2025]}
+    assert snapshot._anos_em_disco("despesas") == [2021, 2022, 2023, 2025]
+    _confere(banco, monkeypatch, "despesas")
+
+
+def test_precos_cotacao_retroativa_abaixo_da_marca(banco, monkeypatch):
+    db.upsert_precos(pd.DataFrame({"Ticker": ["PETR4"] * 3 + ["VALE3"] * 2,
+                                   "data": ["2022-12-30", "2023-06-01", "2024-01-02", "2023-06-01", "2024-01-02"],
+                                   "preco": [30.0, 31.0, 32.0, 70.0, 71.0]}))
+    assert snapshot.atualizar(["precos"]) == {"precos": [2022, 2023, 2024]}
+
+    db.upsert_preco("VALE3", "2021-05-03", 60.0)       # day < chave_max: só o trigger enxerga
+    db.upsert_preco("PETR4", "2023-06-01", 31.5)       # upsert -> UPDATE
+    db.delete_precos([("PETR4", "2022-12-30")])         # 2022 fica vazio
+    with db.connect() as con:
+        sujos = {a for (a,) in con.execute("SELECT ano FROM snapshot_sujo WHERE tabela = 'precos'")}
+    assert sujos == {2021, 2022, 2023}
+
+    assert snapshot.atualizar(["precos"]) == {"precos": [2021, 2022, 2023]}
+    assert snapshot._anos_em_disco("precos") == [2021, 2023, 2024]
+    _confere(banco, monkeypatch, "precos")
+    p = snapshot.load_precos(refrescar=False)
+    assert p.loc[(p["Ticker"] == "PETR4") & (p["data"] == "2023-06-01"), "preco"].tolist() == [31.5]
+
+
+def test_trades_depois_do_refresh(banco, monkeypatch):
+    db.insert_trade("2023-02-01", "PETR4", "C", 100, 30, 0, None)
+    db.insert_trade("2024-02-01", "PETR4", "C", 50, 32, 0, None)
+    snapshot.atualizar(["trades"])
+    db.insert_trade("2022-11-01", "VALE3", "C", 10, 60, 0, None)
+    with db.connect() as con:
+        con.execute("UPDATE trades SET Qtd = 80 WHERE Data = '2023-02-01'")
+    assert snapshot.atualizar(["trades"]) == {"trades": [2022, 2023]}
+    _confere(banco, monkeypatch, "trades")
+    pd.testing.assert_frame_equal(snapshot.load_trades(refrescar=False), db.load_trades(),
+                                  check_categorical=False)
+
+
+def test_trigger_antigo_com_or_ignore_e_trocado(banco):
+    with db.connect() as con:
+        con.execute("CREATE TABLE snapshot_sujo (tabela TEXT NOT NULL, ano INTEGER NOT NULL, "
+                    "PRIMARY KEY (tabela, ano)) WITHOUT ROWID")
+        con.execute("CREATE TRIGGER trg_snap_precos_au AFTER UPDATE ON quotes BEGIN "
+                    "INSERT OR IGNORE INTO snapshot_sujo VALUES ('precos', 1), ('precos', 1); END")
+    db.upsert_preco("PETR4", "2024-01-02", 30.0)
+    snapshot.atualizar(["precos"])
+    db.upsert_preco("PETR4", "2024-01-02", 31.0)     # com o trigger antigo: UNIQUE constraint failed
+    assert snapshot.atualizar(["precos"]) == {"precos": [2024]}
@@ -0,0 +1,113 @@
+# tests/test_upgrade_portfolio_db.py
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from services import importer
+from services import upgrade_portfolio_db as upg
+
+
+@pytest.fixture
+def conn():
+    c = sqlite3.connect(":memory:")
+    c.executescript("""
+        CREATE TABLE receitas (id INTEGER PRIMARY KEY, Data TEXT, Categoria TEXT);
+        CREATE TABLE despesas (id INTEGER PRIMARY KEY, Data TEXT, Categoria TEXT);
+        CREATE TABLE investimentos (id INTEGER PRIMARY KEY, Data TEXT, Categoria TEXT);
+    """)
+    c.executescript(upg.DDL)
+    c.execute("INSERT INTO ativos (id, ticker, classe) VALUES (1, 'PETR4', 'Ação'), (2, 'VALE3', 'Ação')")
+    c.commit()
+    return c
+
+
+def _trade(c, data, tipo, qtd, ativo=1):
+    return c.execute("INSERT INTO trades (data, ativo_id, tipo, quantidade, preco) VALUES (?, ?, ?, ?, 10)",
+                     (data, ativo, tipo, qtd)).lastrowid
+
+
+def _posicoes(c, ativo=1):
+    return dict(c.execute("SELECT data, qtd_acum FROM posicao_acumulada WHERE ativo_id = ? ORDER BY data",
+                          (ativo,)).fetchall())
+
+
+def _reconstruida(c, ativo=1):
+    c.executescript(upg.REBUILD_POSICAO)
+    return _posicoes(c, ativo)
+
+
+def test_posicao_acumulada_acompanha_insert_update_delete(conn):
+    _trade(conn, "2024-03-05", "C", 100)
+    v = _trade(conn, "2024-03-10", "V", 50)
+    _trade(conn, "2024-03-01", "C", 20)               # retroativo: soma nas datas seguintes
+    assert _posicoes(conn) == {"2024-03-01": 20, "2024-03-05": 120, "2024-03-10": 70}
+
+    conn.execute("UPDATE trades SET quantidade = 30, data = '2024-03-07' WHERE id = ?", (v,))
+    esperado = {"2024-03-01": 20, "2024-03-05": 120, "2024-03-07": 90, "2024-03-10": 90}
+    assert _posicoes(conn) == esperado
+
+    conn.execute("DELETE FROM trades WHERE data = '2024-03-01'")
+    assert _posicoes(conn) == {d: q - 20 for d, q in esperado.items()}
+    assert upg.posicao_em(conn, 1, "2024-03-08") == 70
+    # os triggers chegam ao mesmo saldo que o rebuild (dias sem trade à parte)
+    mantida = _posicoes(conn)
+    assert all(mantida[d] == q for d, q in _reconstruida(conn).items())
+
+
+def test_trigger_barra_venda_descoberta_inclusive_retroativa(conn):
+    _trade(conn, "2024-03-05", "C", 100)
+    _trade(conn, "2024-03-10", "V", 50)
+    with pytest.raises(sqlite3.IntegrityError, match="Venda supera"):
+        _trade(conn, "2024-03-06", "V", 101)           # descoberta no próprio dia
+    with pytest.raises(sqlite3.IntegrityError, match="Venda supera"):
+        _trade(conn, "2024-03-06", "V", 60)            # cabe em 06/03, mas zera abaixo de 0 em 10/03
+    _trade(conn, "2024-03-06", "V", 50)                # exatamente o que sobra
+    assert _posicoes(conn)["2024-03-10"] == 0
+    with pytest.raises(sqlite3.IntegrityError, match="Venda supera"):
+        _trade(conn, "2024-03-04", "V", 1)             # antes da primeira compra
+    assert min(_posicoes(conn).values()) >= 0
+
+
+def test_trigger_de_update_desconta_a_versao_antiga(conn):
+    _trade(conn, "2024-03-05", "C", 100)
+    v = _trade(conn, "2024-03-10", "V", 50)
+    conn.execute("UPDATE trades SET quantidade = 100 WHERE id = ?", (v,))       # ok: 100 - 100
+    _trade(conn, "2024-03-12", "C", 10)
+    with pytest.raises(sqlite3.IntegrityError, match="Venda supera"):
+        conn.execute("UPDATE trades SET data = '2024-03-12', quantidade = 111 WHERE id = ?", (v,))
+    w = _trade(conn, "2024-03-15", "V", 10)
+    # antecipar a venda de 15/03 para 06/03 cabe no dia, mas deixaria 10/03 em -10
+    with pytest.raises(sqlite3.IntegrityError, match="Venda supera"):
+        conn.execute("UPDATE trades SET data = '2024-03-06' WHERE id = ?", (w,))
+    conn.execute("UPDATE trades SET data = '2024-03-13' WHERE id = ?", (w,))
+    assert _posicoes(conn)["2024-03-15"] == 0
+
+
+def _lote(linhas):
+    return pd.DataFrame(linhas, columns=["ativo_id", "data", "tipo", "quantidade"])
+
+
+def test_validar_vendas_olha_as_posicoes_posteriores(conn):
+    _trade(conn, "2024-03-05", "C", 100)
+    _trade(conn, "2024-03-10", "V", 50)
+    _trade(conn, "2024-03-01", "C", 5, ativo=2)
+    lote = _lote([(1, "2024-03-09", "V", 60), (1, "2024-03-06", "V", 10), (2, "2024-03-02", "V", 5)])
+    ruins = upg.validar_vendas(conn, lote)
+    # a de 09/03 cabe no dia (100 - 10 - 60 = 30), mas deixa 10/03 em -20
+    assert ruins.to_dict("records") == [{"ativo_id": 1, "data": "2024-03-09", "tipo": "V", "quantidade": 60}]
+    # compras do próprio lote antes da venda cobrem; depois dela, não
+    assert upg.validar_vendas(conn, _lote([(1, "2024-03-08", "C", 20), (1, "2024-03-09", "V", 70)])).empty
+    assert len(upg.validar_vendas(conn, _lote([(1, "2024-03-09", "V", 70), (1, "2024-03-11", "C", 20)]))) == 1
+
+
+def test_importer_recusa_venda_retroativa_no_schema_da_carteira(conn, tmp_path):
+    _trade(conn, "2024-03-05", "C", 100)
+    _trade(conn, "2024-03-10", "V", 50)
+    conn.commit()
+    nota = tmp_path / "nota.csv"
+    nota.write_text("Data;Ticker;Tipo;Quantidade;Preco\n09/03/2024;PETR4;V;60;38,00\n", encoding="utf-8")
+    with pytest.raises(importer.VendaDescoberta):
+        importer.importar_trades([nota], conn)
+    assert conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 2
+    assert min(_posicoes(conn).values()) >= 0